@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from community.models import ForumTopic
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает количество постов и последнюю активность тем форума (исправляет расхождения)'
+
+    def handle(self, *args, **options):
+        updated = ForumTopic.update_post_stats()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано тем: {updated}'))
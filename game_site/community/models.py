@@ -2,6 +2,11 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
 from userapp.models import User
 
 
@@ -11,10 +16,62 @@ class ForumTopic(models.Model):
     author = models.ForeignKey(User, related_name='forum_topic_user', on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     views = models.PositiveIntegerField(default=0)
+    # Денормализованные данные о постах, поддерживаются сигналами ForumPost
+    post_count = models.PositiveIntegerField(default=0, verbose_name='Количество постов')
+    # Время последнего поста; у темы без ответов - время ее создания
+    last_post_at = models.DateTimeField(default=timezone.now, verbose_name='Последняя активность')
+    last_post_author = models.ForeignKey(User, null=True, blank=True, related_name='+',
+                                         on_delete=models.SET_NULL)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-last_post_at', '-id']),  # Список тем по активности и keyset-пагинация
+        ]
 
     def __str__(self):
         return self.title
 
+    def get_absolute_url(self):
+        return f"/community/{self.slug}/"
+
+    @classmethod
+    def post_added(cls, post):
+        # Одним UPDATE: значения справа берутся до изменения строки, поэтому
+        # при параллельных постах последним останется самый новый
+        is_latest = models.Q(last_post_at__lte=post.created_at)
+        cls.objects.filter(pk=post.topic_id).update(
+            post_count=models.F('post_count') + 1,
+            last_post_at=Greatest('last_post_at', models.Value(post.created_at)),
+            last_post_author=models.Case(
+                models.When(is_latest, then=models.Value(post.author_id)),
+                default=models.F('last_post_author'),
+                output_field=models.BigIntegerField(),
+            ),
+        )
+
+    @classmethod
+    def update_post_stats(cls, topics=None):
+        """Пересчитывает денормализованные поля по таблице постов. Возвращает число тем"""
+        posts = ForumPost.objects.filter(topic=models.OuterRef('pk')).order_by()
+        latest = posts.order_by('-created_at', '-pk')
+        queryset = cls.objects.all() if topics is None else cls.objects.filter(pk__in=topics)
+        return queryset.update(
+            post_count=Coalesce(
+                models.Subquery(posts.values('topic').annotate(n=models.Count('pk')).values('n')), 0
+            ),
+            last_post_at=Coalesce(models.Subquery(latest.values('created_at')[:1]), 'created_at'),
+            last_post_author=models.Subquery(latest.values('author')[:1]),
+        )
+
+
+class ForumPostQuerySet(models.QuerySet):
+    def for_list(self):
+        """Посты в теме и в лентах: автор и тема одним JOIN"""
+        return self.select_related('author', 'topic')
+
+    # Отложенных полей у постов нет - в кэш кладутся те же объекты, что и в списки
+    for_cache = for_list
+
 
 class ForumPost(models.Model):
     topic = models.ForeignKey(ForumTopic, on_delete=models.CASCADE)
@@ -22,6 +79,32 @@ class ForumPost(models.Model):
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
 
+    objects = ForumPostQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['topic', 'created_at', 'id']),  # Keyset-пагинация постов темы
+        ]
+
     def __str__(self):
         return f"Пост в теме {self.topic.title}"
 
+
+@receiver(post_save, sender=ForumPost)
+def update_topic_on_post_save(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ForumTopic.post_added(instance)
+
+
+@receiver(post_delete, sender=ForumPost)
+def update_topic_on_post_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, ForumTopic):
+        # Посты удаляются вместе с темой - пересчитывать нечего
+        return
+    ForumTopic.objects.filter(pk=instance.topic_id).update(post_count=Greatest(models.F('post_count') - 1, 0))
+    # Удалили последний пост - время и автора берем у предыдущего (по индексу, один UPDATE)
+    latest = ForumPost.objects.filter(topic=models.OuterRef('pk')).order_by('-created_at', '-pk')
+    ForumTopic.objects.filter(pk=instance.topic_id, last_post_at__lte=instance.created_at).update(
+        last_post_at=Coalesce(models.Subquery(latest.values('created_at')[:1]), 'created_at'),
+        last_post_author=models.Subquery(latest.values('author')[:1]),
+    )
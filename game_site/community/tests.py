@@ -1,3 +1,91 @@
-from django.test import TestCase
+import datetime
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import RequestFactory, TestCase
 
 # Create your tests here.
+from mainapp import counters
+from userapp.models import User
+from .models import ForumPost, ForumTopic
+from .views import TopicDetailView, TopicListView
+
+
+class ForumTopicTestCase(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(email='alice@ex.com', username='alice', password='pass')
+        self.bob = User.objects.create_user(email='bob@ex.com', username='bob', password='pass')
+        self.quiet = ForumTopic.objects.create(title='Тихая', slug='quiet', author=self.alice)
+        self.busy = ForumTopic.objects.create(title='Активная', slug='busy', author=self.alice)
+        self.factory = RequestFactory()
+        counters.suspend_flush()
+
+    def post(self, topic, author):
+        return ForumPost.objects.create(topic=topic, author=author, content='...')
+
+    def test_counters_follow_posts(self):
+        first = self.post(self.busy, self.alice)
+        last = self.post(self.busy, self.bob)
+        self.busy.refresh_from_db()
+        self.assertEqual((self.busy.post_count, self.busy.last_post_at, self.busy.last_post_author),
+                         (2, last.created_at, self.bob))
+
+        last.delete()
+        self.busy.refresh_from_db()
+        self.assertEqual((self.busy.post_count, self.busy.last_post_at, self.busy.last_post_author),
+                         (1, first.created_at, self.alice))
+
+        # Пост "из прошлого" не перебивает последнюю активность
+        ForumTopic.post_added(ForumPost(topic=self.busy, author=self.bob,
+                                        created_at=first.created_at - datetime.timedelta(days=1)))
+        self.busy.refresh_from_db()
+        self.assertEqual((self.busy.post_count, self.busy.last_post_author), (2, self.alice))
+
+        call_command('recount_topics', stdout=StringIO())
+        self.busy.refresh_from_db()
+        self.quiet.refresh_from_db()
+        self.assertEqual((self.busy.post_count, self.busy.last_post_at), (1, first.created_at))
+        self.assertEqual((self.quiet.post_count, self.quiet.last_post_at), (0, self.quiet.created_at))
+
+    def test_topic_delete_skips_recount(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        for _ in range(3):
+            self.post(self.busy, self.bob)
+        with CaptureQueriesContext(connection) as queries:
+            self.busy.delete()
+        self.assertFalse([query for query in queries if query['sql'].startswith('UPDATE "community_forumtopic"')])
+
+    def test_list_ordered_by_activity(self):
+        self.post(self.quiet, self.bob)
+        response = TopicListView.as_view()(self.factory.get('/community/'))
+        self.assertEqual(list(response.context_data['object_list']), [self.quiet, self.busy])
+
+    def test_posts_keyset_pagination(self):
+        posts = [self.post(self.busy, self.alice) for _ in range(5)]
+        view = TopicDetailView.as_view(posts_per_page=2)
+        seen, cursor = [], ''
+        while True:
+            response = view(self.factory.get('/community/busy/', {'cursor': cursor}), slug='busy')
+            page = response.context_data['page_obj']
+            seen.extend(page.object_list)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, posts)
+        self.assertEqual(response.context_data['post_count'], 5)
+
+    def test_query_counts(self):
+        for _ in range(3):
+            self.post(self.busy, self.bob)
+        self.post(self.quiet, self.alice)
+        # Страница тем: COUNT и темы с авторами
+        with self.assertNumQueries(2):
+            response = TopicListView.as_view()(self.factory.get('/community/'))
+            [(topic.author.username, topic.last_post_author.username)
+             for topic in response.context_data['object_list'] if topic.post_count]
+        # Тема и страница постов с авторами
+        with self.assertNumQueries(2):
+            response = TopicDetailView.as_view()(self.factory.get('/community/busy/'), slug='busy')
+            [(str(post), post.author.username) for post in response.context_data['posts']]
@@ -4,6 +4,6 @@ from . import views
 name = 'community'
 
 urlpatterns = [
-    path('', views.index, name='list'),
+    path('', views.TopicListView.as_view(), name='list'),
+    path('<slug:slug>/', views.TopicDetailView.as_view(), name='topic_detail'),
 ]
-
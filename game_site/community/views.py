@@ -1,6 +1,50 @@
+from django.http import Http404
 from django.shortcuts import render
 
 # Create your views here.
+from django.views.generic import DetailView, ListView
+from mainapp import counters
+from mainapp.pagination import CursorPaginationMixin, CursorPaginator, InvalidCursor
+from .models import ForumTopic
 
-def index(request):
-    pass
\ No newline at end of file
+
+class TopicListView(CursorPaginationMixin, ListView):
+    """Темы форума по последней активности (денормализованные поля, без подзапросов к постам)"""
+    model = ForumTopic
+    template_name = 'community/topic_list.html'
+    paginate_by = 20
+    ordering = ['-last_post_at', '-pk']
+    cursor_ordering = ['-last_post_at', '-pk']
+
+    def get_queryset(self):
+        return super().get_queryset().select_related('author', 'last_post_author')
+
+
+class TopicDetailView(DetailView):
+    model = ForumTopic
+    template_name = 'community/topic_detail.html'
+    posts_per_page = 20
+
+    def get(self, request, *args, **kwargs):
+        # Увеличиваем счетчик просмотров (буферизованно, запись в БД пачками)
+        self.object = self.get_object()
+        counters.hit(self.object)
+        # super().get() загрузил бы объект повторно
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Посты темы всегда листаются по курсору: страница в глубине
+        # длинной темы читается по индексу (topic, created_at, id) без OFFSET
+        paginator = CursorPaginator(
+            self.object.forumpost_set.for_list(), self.posts_per_page, ['created_at', 'pk']
+        )
+        try:
+            page = paginator.page(self.request.GET.get('cursor') or None)
+        except InvalidCursor as exc:
+            raise Http404(str(exc))
+        context['posts'] = page.object_list
+        context['page_obj'] = page
+        context['post_count'] = self.object.post_count
+        return context
@@ -3,6 +3,9 @@ ASGI config for game_site project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+Serve it with an ASGI server (e.g. ``uvicorn game_site.asgi:application``) to
+enable the async notification stream (``userapp.views.notification_stream``).
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
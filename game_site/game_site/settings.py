@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 import os
+import sys
 from datetime import timedelta
 from pathlib import Path
 
@@ -28,6 +29,9 @@ DEBUG = True
 
 ALLOWED_HOSTS = ['*']
 
+# Профиль окружения: DJANGO_ENV=production включает настройки боевого сервера под WSGI
+PRODUCTION = os.environ.get('DJANGO_ENV') == 'production'
+
 
 # Application definition
 
@@ -38,6 +42,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'mainapp.apps.MainappConfig',
     'games.apps.GamesConfig',
     'community.apps.CommunityConfig',
     'guides.apps.GuidesConfig',
@@ -48,7 +53,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainapp.middleware.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'mainapp.middleware.ReplicaRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -69,6 +76,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'userapp.context_processors.notifications',
             ],
         },
     },
@@ -84,9 +92,135 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Постоянные соединения: не открываем БД и не выполняем PRAGMA на каждый запрос.
+        # Только в боевом профиле под WSGI: под ASGI (SSE-стримы) соединения
+        # открываются в потоках sync_to_async и постоянными не переиспользуются
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600 if PRODUCTION else 0)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Запись сразу берет блокировку: без взаимоблокировок при апгрейде чтения до записи
+            'transaction_mode': 'IMMEDIATE',
+        },
     }
 }
 
+# Учет SQL по запросам (mainapp.middleware.QueryInstrumentationMiddleware)
+SQL_INSTRUMENTATION = DEBUG or os.environ.get('SQL_INSTRUMENTATION') == '1'
+SQL_N_PLUS_ONE_THRESHOLD = 5  # одинаковых запросов за один запрос к сайту
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'game_site.sql': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+        },
+    },
+}
+
+# Реплики для чтения (mainapp.routers). Пути к копиям основной базы через запятую:
+# DB_REPLICAS=/var/lib/game_site/replica1.sqlite3,/var/lib/game_site/replica2.sqlite3
+DATABASE_REPLICAS = []
+for _index, _name in enumerate(filter(None, os.environ.get('DB_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{_index}'] = {**DATABASES['default'], 'NAME': _name, 'TEST': {'MIRROR': 'default'}}
+    DATABASE_REPLICAS.append(f'replica{_index}')
+
+DATABASE_ROUTERS = ['mainapp.routers.ReplicaRouter']
+
+# Сколько секунд после записи клиент читает из основной базы
+PRIMARY_STICKY_SECONDS = 15
+
+# PRAGMA для каждого нового соединения SQLite (mainapp.db)
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -64 * 1024,  # в КиБ, т.е. 64 МиБ
+    'busy_timeout': 5000,  # мс
+    'temp_store': 'MEMORY',
+}
+
+# Публичный API только для чтения (mainapp.api): JSON без авторизации
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+    'DEFAULT_PARSER_CLASSES': ['rest_framework.parsers.JSONParser'],
+    'DEFAULT_AUTHENTICATION_CLASSES': [],
+    'DEFAULT_PERMISSION_CLASSES': ['rest_framework.permissions.AllowAny'],
+    'UNAUTHENTICATED_USER': None,
+}
+
+# Токены партнеров для выгрузок /export/ (заголовок Authorization: Bearer <токен>), через запятую.
+# Сотрудникам (is_staff) токен не нужен
+EXPORT_API_TOKENS = [token for token in os.environ.get('EXPORT_API_TOKENS', '').split(',') if token]
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# Общий для всех воркеров кэш (L2 для mainapp.cache.tiered) - Redis. Без него - кэш
+# в отдельной базе SQLite (manage.py createcachetable --database cache): add() атомарен
+# благодаря первичному ключу, так что блокировки get_or_set работают между процессами,
+# а устаревшие записи удаляются по сроку и MAX_ENTRIES.
+# incr() у кэша в БД не атомарен, поэтому счетчики просмотров без Redis буферизуются
+# в памяти каждого процесса и сбрасываются им же, не воркером Celery (см. mainapp.counters). В тестах - кэш в памяти процесса.
+
+REDIS_URL = os.environ.get('REDIS_URL')
+TESTING = sys.argv[1:2] == ['test']
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        },
+    }
+elif TESTING:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+        'counters': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'view-counters',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+else:
+    # Отдельный файл: записи в кэш не ждут блокировку записи основной базы (mainapp.routers)
+    DATABASES['cache'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'cache.sqlite3',
+        'CONN_MAX_AGE': DATABASES['default'].get('CONN_MAX_AGE', 0),
+    }
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'cache_entries',
+            'OPTIONS': {'MAX_ENTRIES': 100000, 'CULL_FREQUENCY': 4},
+        },
+        'counters': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'view-counters',
+            'OPTIONS': {'MAX_ENTRIES': 100000},
+        },
+    }
+
+# Двухуровневый кэш: L1 в памяти процесса перед общим CACHES['default']
+TWO_TIER_CACHE = {
+    'ALIAS': 'default',
+    'L1_MAX_ENTRIES': 1000,
+    'L1_MAX_BYTES': 16 * 1024 * 1024,
+    'L1_TIMEOUT': 10,  # секунд; межпроцессной инвалидации L1 нет
+    'LOCK_TIMEOUT': 10,
+    'BETA': 1.0,  # > 1 - пересчитывать раньше
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -129,6 +263,16 @@ STATICFILES_DIRS = [BASE_DIR / 'static',]
 
 STATIC_ROOT = BASE_DIR / 'staticfiles'
 
+# Хэши в именах и .gz/.br копии при collectstatic (mainapp.staticfiles)
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'mainapp.staticfiles.CompressedManifestStaticFilesStorage',
+    },
+}
+
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
@@ -165,3 +309,17 @@ AUTHENTICATION_BACKENDS = [
     'django.contrib.auth.backends.ModelBackend',
 ]
 
+# Celery (game_site/celery.py). Без брокера задачи выполняются сразу в вызвавшем процессе
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', REDIS_URL or '')
+CELERY_TASK_ALWAYS_EAGER = not CELERY_BROKER_URL
+
+# Буферизованные счетчики просмотров (mainapp.counters)
+VIEW_COUNTER_CACHE = 'default' if REDIS_URL else 'counters'
+VIEW_COUNTER_FLUSH_INTERVAL = 30  # секунд
+
+# Копии изображений (mainapp.images): ширины в пикселях и качество сжатия
+IMAGE_DERIVATIVE_WIDTHS = [160, 320, 640, 1280]
+IMAGE_DERIVATIVE_QUALITY = 80
+
+# Брокер потока уведомлений (userapp.stream). Для нескольких процессов - RedisBroker
+NOTIFICATION_BROKER = 'userapp.stream.RedisBroker' if REDIS_URL else 'userapp.stream.InProcessBroker'
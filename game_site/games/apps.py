@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class GamesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'games'
+
+    def ready(self):
+        from . import cache  # noqa: F401 - подключает сигналы инвалидации кэша страницы игры
+        from mainapp import images
+        images.register(self.get_model('Game'), 'cover')
@@ -0,0 +1,163 @@
+"""
+Версионированный кэш страницы игры.
+
+У каждой игры есть счетчик версии в кэше. Любое изменение игры или связанных
+с ней гайдов, обзоров и новостей увеличивает версию, и закэшированные блоки
+старой версии просто перестают использоваться - устаревшие данные не показываются.
+Массовые изменения (импорт каталога) поднимают одну общую версию всех игр.
+
+Версии поднимаются после коммита транзакции: иначе параллельный читатель мог
+бы заполнить ключ новой версии еще незакоммиченными (или старыми) данными,
+и они показывались бы до истечения DETAIL_TIMEOUT.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from mainapp import cache as shared_cache
+from mainapp.routers import use_primary
+
+DETAIL_TIMEOUT = 60 * 60
+RELATED_LIMIT = 5
+# Общая версия всех страниц игр, входит в ключ вместе с версией игры
+CATALOG_VERSION = 'games'
+
+
+def get_version(game_id):
+    return shared_cache.get_version(f'game:{game_id}')
+
+
+def bump_version(game_id):
+    """Поднимает версию страницы игры после коммита (вне транзакции - сразу)"""
+    if game_id is not None:
+        transaction.on_commit(lambda: shared_cache.bump_version(f'game:{game_id}'))
+
+
+def bump_catalog_version():
+    """Сбрасывает страницы всех игр сразу - для массовых изменений вроде импорта каталога"""
+    transaction.on_commit(lambda: shared_cache.bump_version(CATALOG_VERSION))
+
+
+def bump_genres_version():
+    transaction.on_commit(lambda: shared_cache.bump_version('genres'))
+
+
+def page_version(game_id):
+    """Версия страницы игры и всего, что на ней показано: для ETag страниц с этой игрой"""
+    if game_id is None:
+        return ''
+    return f'{get_version(game_id)}.{shared_cache.get_version(CATALOG_VERSION)}'
+
+
+def _slug_key(slug):
+    return f'game:slug:{slug}'
+
+
+def get_game_id(slug):
+    """id игры по slug через кэш; None, если игры нет"""
+    from .models import Game
+
+    game_id = cache.get(_slug_key(slug))
+    if game_id is None:
+        game_id = Game.objects.filter(slug=slug).values_list('pk', flat=True).first()
+        if game_id is not None:
+            cache.set(_slug_key(slug), game_id, DETAIL_TIMEOUT)
+    return game_id
+
+
+def get_detail(slug, _retry=True):
+    """
+    Игра и связанные блоки страницы одним словарем из кэша.
+    Возвращает None, если игры с таким slug нет.
+    """
+    from .models import Game
+
+    game_id = get_game_id(slug)
+    if game_id is None:
+        return None
+
+    version = get_version(game_id)
+
+    def load():
+        with use_primary():
+            game = Game.objects.for_detail().filter(pk=game_id).first()
+            if game is None:
+                return None
+            return {
+                'object': game,
+                'guides': list(game.guide_set.for_cache().order_by('-created_at')[:RELATED_LIMIT]),
+                'reviews': list(game.review_set.for_cache().order_by('-created_at')[:RELATED_LIMIT]),
+                'news': list(game.news_set.for_cache().order_by('-created_at')[:RELATED_LIMIT]),
+                'cache_version': version,
+            }
+
+    catalog_version = shared_cache.get_version(CATALOG_VERSION)
+    detail = shared_cache.tiered.get_or_set(
+        f'game:{game_id}:v{version}.{catalog_version}:detail', load, DETAIL_TIMEOUT
+    )
+    if detail is None or detail['object'].slug != slug:
+        # Игру удалили или сменили ей slug - сопоставление в кэше устарело, ищем заново
+        cache.delete(_slug_key(slug))
+        return get_detail(slug, _retry=False) if _retry else None
+    return detail
+
+
+def get_genres():
+    """Список жанров для фильтров каталога"""
+    from .models import Genre
+
+    return shared_cache.tiered.get_or_set(
+        shared_cache.versioned_key('genres', 'list'), lambda: list(Genre.objects.all()), DETAIL_TIMEOUT
+    )
+
+
+@receiver(post_save, sender='games.Genre')
+@receiver(post_delete, sender='games.Genre')
+def invalidate_genres(sender, instance, **kwargs):
+    bump_genres_version()
+
+
+@receiver(post_save, sender='games.Game')
+@receiver(post_delete, sender='games.Game')
+def invalidate_game(sender, instance, **kwargs):
+    bump_version(instance.pk)
+
+
+@receiver(m2m_changed, sender='games.Game_genres')
+def invalidate_game_genres(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            bump_version(instance.pk)
+    elif action == 'pre_clear':
+        instance._cleared_game_ids = list(instance.games.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        for game_id in getattr(instance, '_cleared_game_ids', []):
+            bump_version(game_id)
+    elif action.startswith('post_'):
+        for game_id in pk_set:
+            bump_version(game_id)
+
+
+@receiver(pre_save, sender='guides.Guide')
+@receiver(pre_save, sender='reviews.Review')
+@receiver(pre_save, sender='news.News')
+def remember_previous_game(sender, instance, raw=False, **kwargs):
+    # Если запись перенесли к другой игре, нужно сбросить и страницу прежней игры
+    if not raw and not instance._state.adding:
+        instance._previous_game_id = (
+            sender._default_manager.filter(pk=instance.pk).values_list('game_id', flat=True).first()
+        )
+
+
+@receiver(post_save, sender='guides.Guide')
+@receiver(post_save, sender='reviews.Review')
+@receiver(post_save, sender='news.News')
+@receiver(post_delete, sender='guides.Guide')
+@receiver(post_delete, sender='reviews.Review')
+@receiver(post_delete, sender='news.News')
+def invalidate_related(sender, instance, **kwargs):
+    bump_version(instance.game_id)
+    previous = getattr(instance, '_previous_game_id', None)
+    if previous != instance.game_id:
+        bump_version(previous)
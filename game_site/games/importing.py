@@ -0,0 +1,277 @@
+"""
+Потоковый импорт каталога игр из CSV или JSONL (можно .gz).
+
+Файл читается по одной записи, записи собираются в пачки по batch_size и
+каждая пачка сохраняется в своей транзакции: bulk_create с update_conflicts
+по slug (новые игры вставляются, существующие обновляются), жанры находятся
+или создаются, связи с жанрами пишутся прямо в промежуточную таблицу.
+Память не зависит от размера файла - в ней только текущая пачка и словарь жанров.
+
+После каждой пачки в файл контрольной точки записывается число обработанных
+записей; прерванный импорт того же файла продолжается с этого места.
+bulk_create не шлет сигналов, поэтому версии кэша и поисковый индекс
+обновляются для каждой пачки явно, а счетчики фильтров пересчитываются в конце.
+"""
+import csv
+import datetime
+import gzip
+import hashlib
+import itertools
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.text import slugify
+
+from mainapp import search
+
+from . import cache as game_cache
+from .models import Game, GameFacetCount, Genre
+
+DEFAULT_BATCH_SIZE = 1000
+
+REQUIRED_FIELDS = ('title', 'developer', 'release_date', 'platforms', 'description')
+OPTIONAL_FIELDS = ('publisher', 'cover', 'trailer_url')
+# Разделитель жанров в колонке genres CSV-файла
+GENRE_SEPARATOR = '|'
+# Транслитерация кириллицы для slug из названия
+TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z', 'и': 'i',
+    'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r', 'с': 's', 'т': 't',
+    'у': 'u', 'ф': 'f', 'х': 'kh', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'shch', 'ъ': '', 'ы': 'y', 'ь': '',
+    'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+
+
+def _open(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8', newline='')
+    return open(path, encoding='utf-8', newline='')
+
+
+def detect_format(path):
+    name = path[:-3] if path.endswith('.gz') else path
+    if name.endswith('.csv'):
+        return 'csv'
+    if name.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise ValueError(f'Не удалось определить формат файла {path}: ожидается .csv или .jsonl')
+
+
+def read_records(path, fmt=None):
+    """Записи файла по одной: словари полей"""
+    fmt = fmt or detect_format(path)
+    with _open(path) as file:
+        if fmt == 'csv':
+            for row in csv.DictReader(file):
+                genres = row.get('genres')
+                if genres is not None:
+                    row['genres'] = [name for name in genres.split(GENRE_SEPARATOR) if name.strip()]
+                yield row
+        else:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as error:
+                    # Битая строка - ошибка этой записи, а не всего импорта
+                    yield ValidationError(f'Некорректный JSON: {error}')
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_checkpoint(checkpoint_path, path):
+    """Сколько записей файла уже импортировано. 0, если точки нет или файл с тех пор изменился"""
+    try:
+        with open(checkpoint_path, encoding='utf-8') as file:
+            checkpoint = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return 0
+    if checkpoint.get('file') != _fingerprint(path):
+        return 0
+    return checkpoint.get('processed', 0)
+
+
+def save_checkpoint(checkpoint_path, path, processed):
+    # Через временный файл: прерывание посреди записи не портит точку
+    temporary = f'{checkpoint_path}.tmp'
+    with open(temporary, 'w', encoding='utf-8') as file:
+        json.dump({'file': _fingerprint(path), 'processed': processed}, file)
+    os.replace(temporary, checkpoint_path)
+
+
+def _text(record, field):
+    value = record.get(field)
+    return '' if value is None else str(value).strip()
+
+
+def title_slug(title):
+    """
+    slug из названия. slugify отбрасывает не-ASCII символы ("Ведьмак 3" и "Смута 3" дали бы
+    один slug "3", и upsert слил бы игры), поэтому такое название транслитерируется, а хэш
+    названия в конце различает игры с совпавшей транслитерацией. Пустая строка - slug не построить.
+    """
+    if title.isascii():
+        return slugify(title)
+    base = slugify(title.lower().translate(TRANSLIT))
+    if not base:
+        return ''
+    suffix = hashlib.md5(title.encode()).hexdigest()[:8]
+    max_length = Game._meta.get_field('slug').max_length - len(suffix) - 1
+    return f'{base[:max_length].rstrip("-")}-{suffix}'
+
+
+def normalize(record):
+    """
+    Запись файла -> (несохраненная Game, необязательные поля из записи, названия жанров или None).
+    Плохая запись - ValidationError.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValidationError('Запись должна быть объектом')
+    missing = [field for field in REQUIRED_FIELDS if not _text(record, field)]
+    if missing:
+        raise ValidationError(f'Не заполнены поля: {", ".join(missing)}')
+
+    fields = {field: _text(record, field) for field in REQUIRED_FIELDS}
+    fields['platforms'] = fields['platforms'].upper()
+    try:
+        fields['release_date'] = datetime.date.fromisoformat(fields['release_date'])
+    except ValueError:
+        raise ValidationError(f'Некорректная дата выхода: {fields["release_date"]}')
+    fields['slug'] = _text(record, 'slug') or title_slug(fields['title'])
+    if not fields['slug']:
+        raise ValidationError('Не удалось построить slug из названия - укажите slug явно')
+    # Необязательные поля обновляются, только если они есть в записи
+    provided = tuple(field for field in OPTIONAL_FIELDS if field in record)
+    fields.update({field: _text(record, field) for field in provided})
+
+    game = Game(**fields)
+    # Уникальность slug обеспечивает сам upsert, обложку импорт может не передавать
+    game.full_clean(exclude=['cover', 'genres'], validate_unique=False, validate_constraints=False)
+
+    genres = record.get('genres')
+    if genres is not None:
+        if isinstance(genres, str):
+            genres = genres.split(GENRE_SEPARATOR)
+        genres = list(dict.fromkeys(str(name).strip() for name in genres if str(name).strip()))
+        too_long = [name for name in genres if len(name) > Genre._meta.get_field('name').max_length]
+        if too_long:
+            raise ValidationError(f'Слишком длинное название жанра: {too_long[0]}')
+    return game, provided, genres
+
+
+class GameImporter:
+    """Импорт одного файла; счетчики результата - в атрибутах"""
+
+    max_errors = 100
+
+    def __init__(self, batch_size=DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.created = self.updated = self.invalid = 0
+        # (номер записи, сообщение) для первых max_errors плохих записей
+        self.errors = []
+        self._genres = None
+
+    def run(self, path, fmt=None, checkpoint_path=None, resume=True, progress=None):
+        """Импортирует файл. Возвращает число записей, пропущенных по контрольной точке"""
+        skipped = load_checkpoint(checkpoint_path, path) if checkpoint_path and resume else 0
+        records = itertools.islice(enumerate(read_records(path, fmt), 1), skipped, None)
+        while batch := list(itertools.islice(records, self.batch_size)):
+            rows = []
+            for number, record in batch:
+                try:
+                    rows.append(normalize(record))
+                except ValidationError as error:
+                    self.invalid += 1
+                    if len(self.errors) < self.max_errors:
+                        self.errors.append((number, '; '.join(error.messages)))
+            self.save_batch(rows)
+            processed = batch[-1][0]
+            if checkpoint_path:
+                save_checkpoint(checkpoint_path, path, processed)
+            if progress:
+                progress(processed)
+        GameFacetCount.objects.rebuild()
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            os.remove(checkpoint_path)
+        return skipped
+
+    def save_batch(self, rows):
+        # Повтор slug в пачке - побеждает последняя запись
+        rows = list({game.slug: (game, provided, genres) for game, provided, genres in rows}.values())
+        if not rows:
+            return
+        slugs = [game.slug for game, _, _ in rows]
+        groups = {}
+        for game, provided, _ in rows:
+            groups.setdefault(provided, []).append(game)
+
+        with transaction.atomic():
+            existing = set(Game.objects.filter(slug__in=slugs).values_list('slug', flat=True))
+            for provided, games in groups.items():
+                Game.objects.bulk_create(
+                    games,
+                    update_conflicts=True,
+                    unique_fields=['slug'],
+                    update_fields=[*REQUIRED_FIELDS, *provided, 'updated_at'],
+                )
+            ids = dict(Game.objects.filter(slug__in=slugs).values_list('slug', 'pk'))
+            for game, _, _ in rows:
+                game.pk = ids[game.slug]
+            self.set_genres([(game.pk, genres) for game, _, genres in rows if genres is not None])
+
+            # Сигналы post_save не отправлялись - обновляем индекс и кэш сами.
+            # Новых игр в кэше еще нет; для обновленных одна общая версия
+            # вместо тысяч версий отдельных игр - она поднимается после коммита пачки
+            for game, _, _ in rows:
+                search.index_document(Game, game)
+            if existing:
+                game_cache.bump_catalog_version()
+        self.created += len(rows) - len(existing)
+        self.updated += len(existing)
+
+    def genre_ids(self, names):
+        """id жанров по названиям или slug; недостающие создаются"""
+        if self._genres is None:
+            self._genres = {}
+            for pk, name, slug in Genre.objects.values_list('pk', 'name', 'slug'):
+                self._genres[slug] = self._genres[name.lower()] = pk
+        missing = {
+            name.lower(): name for name in names if name not in self._genres and name.lower() not in self._genres
+        }
+        if missing:
+            new = {self.genre_slug(name): name for name in missing.values()}
+            Genre.objects.bulk_create(
+                [Genre(name=name, slug=slug) for slug, name in new.items()], ignore_conflicts=True
+            )
+            for pk, name, slug in Genre.objects.filter(slug__in=new).values_list('pk', 'name', 'slug'):
+                self._genres[slug] = self._genres[name.lower()] = pk
+                self._genres[new[slug].lower()] = pk
+            game_cache.bump_genres_version()
+        return [self._genres.get(name) or self._genres[name.lower()] for name in names]
+
+    @staticmethod
+    def genre_slug(name):
+        # Не-ASCII название - по хэшу: slugify("Ролевой RPG") совпал бы со slug жанра "RPG"
+        return (name.isascii() and slugify(name)) or 'genre-' + hashlib.md5(name.lower().encode()).hexdigest()[:10]
+
+    def set_genres(self, game_genres):
+        """Заменяет жанры игр: [(id игры, [названия жанров])]"""
+        if not game_genres:
+            return
+        through = Game.genres.through
+        names = list(dict.fromkeys(name for _, genres in game_genres for name in genres))
+        ids = dict(zip(names, self.genre_ids(names)))
+        through.objects.filter(game_id__in=[game_id for game_id, _ in game_genres]).delete()
+        through.objects.bulk_create(
+            [through(game_id=game_id, genre_id=ids[name]) for game_id, genres in game_genres for name in genres],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
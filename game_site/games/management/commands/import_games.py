@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from games.importing import DEFAULT_BATCH_SIZE, GameImporter, detect_format
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоковый импорт игр из CSV или JSONL (можно .gz) с обновлением существующих по slug. '
+        'Прерванный импорт продолжается с контрольной точки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='по умолчанию - по расширению файла')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--checkpoint', help='файл контрольной точки (по умолчанию <path>.checkpoint)')
+        parser.add_argument('--restart', action='store_true', help='начать сначала, игнорируя контрольную точку')
+
+    def handle(self, *args, path, **options):
+        try:
+            fmt = options['format'] or detect_format(path)
+        except ValueError as error:
+            raise CommandError(error)
+        checkpoint = options['checkpoint'] or f'{path}.checkpoint'
+        importer = GameImporter(batch_size=options['batch_size'])
+        try:
+            skipped = importer.run(
+                path, fmt, checkpoint, resume=not options['restart'],
+                progress=lambda processed: self.stdout.write(f'  обработано записей: {processed}'),
+            )
+        except FileNotFoundError:
+            raise CommandError(f'Файл {path} не найден')
+
+        if skipped:
+            self.stdout.write(f'Продолжено с контрольной точки, пропущено записей: {skipped}')
+        for number, message in importer.errors:
+            self.stderr.write(f'  запись {number}: {message}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {importer.created}, обновлено: {importer.updated}, с ошибками: {importer.invalid}'
+        ))
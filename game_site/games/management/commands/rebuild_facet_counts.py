@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from games.models import GameFacetCount
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает материализованные счетчики фильтров каталога (платформы и жанры)'
+
+    def handle(self, *args, **options):
+        rows = GameFacetCount.objects.rebuild()
+        self.stdout.write(self.style.SUCCESS(f'Счетчиков записано: {rows}'))
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Cast, Coalesce, Now, Round
+
+from games.models import Game
+from reviews.models import Review
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает агрегаты рейтинга всех игр по обзорам (исправляет расхождения)'
+
+    def handle(self, *args, **options):
+        reviews = Review.objects.filter(game=models.OuterRef('pk')).order_by().values('game')
+        with transaction.atomic():
+            # Один UPDATE с коррелированными агрегатами вместо обхода игр в Python
+            updated = Game.objects.update(
+                rating_sum=Coalesce(
+                    models.Subquery(reviews.annotate(total=models.Sum('rating')).values('total')), 0
+                ),
+                rating_count=Coalesce(
+                    models.Subquery(reviews.annotate(count=models.Count('pk')).values('count')), 0
+                ),
+            )
+            Game.objects.update(
+                rating=models.Case(
+                    models.When(
+                        rating_count__gt=0,
+                        then=Round(Cast('rating_sum', models.FloatField()) / models.F('rating_count'), 1),
+                    ),
+                    default=models.Value(0.0),
+                    output_field=models.FloatField(),
+                ),
+                updated_at=Now(),
+            )
+        self.stdout.write(self.style.SUCCESS(f'Рейтинг пересчитан для {updated} игр'))
@@ -1,5 +1,11 @@
-from django.db import models
+from collections import Counter
+
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import Cast, Coalesce, Round
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.urls import reverse
+from django.utils import timezone
 # Create your models here.
 
 
@@ -35,6 +41,18 @@ class Genre(models.Model):
         return reverse('games_by_genre', args=[self.slug])
 
 
+class GameQuerySet(models.QuerySet):
+    def for_list(self):
+        """Карточки каталога: жанры для бейджей одним запросом, без длинного описания"""
+        return self.defer('description').prefetch_related(
+            models.Prefetch('genres', queryset=Genre.objects.only('pk', 'name', 'slug'))
+        )
+
+    def for_detail(self):
+        """Страница игры: все поля и жанры"""
+        return self.prefetch_related('genres')
+
+
 # Модель: Игра
 class Game(models.Model):
     """
@@ -118,6 +136,17 @@ class Game(models.Model):
         verbose_name="Рейтинг",
         help_text="Средняя оценка игры на основе пользовательских рецензий"
     )
+    # Агрегаты для инкрементального пересчета рейтинга (поддерживаются сигналами reviews)
+    rating_sum = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Сумма оценок",
+        help_text="Сумма оценок всех обзоров игры"
+    )
+    rating_count = models.PositiveIntegerField(
+        default=0,
+        verbose_name="Количество оценок",
+        help_text="Количество обзоров игры"
+    )
     # Дата добавления в каталог (автоматически при создании)
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -129,18 +158,27 @@ class Game(models.Model):
         verbose_name="Дата обновления"
     )
 
+    objects = GameQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Игра"
         verbose_name_plural = "Игры"
         ordering = ['-release_date']  # Сортировка по дате выхода (новые сначала)
         indexes = [
             models.Index(fields=['title']),  # Индекс для ускорения поиска по названию
-            models.Index(fields=['-release_date']),  # Индекс для сортировки по дате
+            models.Index(fields=['-release_date', '-id']),  # Индекс для сортировки по дате (и keyset-пагинации)
         ]
 
     def __str__(self):
         return f"{self.title} ({self.release_date.year})"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Сохраненная платформа нужна для инкрементального обновления фасетов
+        instance._saved_platform = instance.__dict__.get('platforms')
+        return instance
+
     def get_absolute_url(self):
         """Возвращает URL для страницы детальной информации об игре"""
         return reverse('game_detail', args=[self.slug])
@@ -150,9 +188,209 @@ class Game(models.Model):
         return dict(self.PLATFORM_CHOICES).get(self.platforms, self.platforms)
 
     def update_rating(self):
-        """Пересчитывает рейтинг игры на основе всех обзоров"""
-        reviews = self.reviews.all()  # Связанные обзоры через related_name
-        if reviews.exists():
-            total = sum(review.rating for review in reviews)
-            self.rating = round(total / reviews.count(), 1)
-            self.save(update_fields=['rating'])
+        """Полностью пересчитывает рейтинг игры на основе всех обзоров (одним агрегирующим запросом)"""
+        totals = self.review_set.aggregate(
+            total=Coalesce(models.Sum('rating'), 0),
+            count=models.Count('pk'),
+        )
+        self.rating_sum = totals['total']
+        self.rating_count = totals['count']
+        self.rating = round(self.rating_sum / self.rating_count, 1) if self.rating_count else 0.0
+        self.save(update_fields=['rating', 'rating_sum', 'rating_count', 'updated_at'])
+
+    @classmethod
+    def apply_rating_delta(cls, game_id, sum_delta, count_delta):
+        """Атомарно изменяет агрегаты рейтинга игры одним UPDATE без чтения обзоров"""
+        new_sum = models.F('rating_sum') + sum_delta
+        new_count = models.F('rating_count') + count_delta
+        cls.objects.filter(pk=game_id).update(
+            rating_sum=new_sum,
+            rating_count=new_count,
+            updated_at=timezone.now(),
+            rating=models.Case(
+                models.When(
+                    rating_count__gt=-count_delta,
+                    then=Round(Cast(new_sum, models.FloatField()) / new_count, 1),
+                ),
+                default=models.Value(0.0),
+                output_field=models.FloatField(),
+            ),
+        )
+
+
+class GameFacetCountManager(models.Manager):
+    def apply(self, deltas):
+        """
+        Применяет изменения счетчиков {(платформа, id жанра): delta}.
+        Пустая платформа и жанр None означают "любая"/"любой".
+        """
+        for (platform, genre_id), delta in deltas.items():
+            if not delta:
+                continue
+            counter = self.filter(platform=platform, genre_id=genre_id)
+            if counter.update(count=models.F('count') + delta) or delta < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(platform=platform, genre_id=genre_id, count=delta)
+            except IntegrityError:
+                # Строку успел создать параллельный запрос
+                counter.update(count=models.F('count') + delta)
+
+    def snapshot(self):
+        """Все счетчики одним запросом"""
+        facets = {'total': 0, 'platforms': {}, 'genres': {}, 'combined': {}}
+        for platform, genre_id, count in self.values_list('platform', 'genre_id', 'count'):
+            if platform and genre_id:
+                facets['combined'][platform, genre_id] = count
+            elif platform:
+                facets['platforms'][platform] = count
+            elif genre_id:
+                facets['genres'][genre_id] = count
+            else:
+                facets['total'] = count
+        return facets
+
+    def rebuild(self):
+        """Полностью пересчитывает счетчики GROUP BY-запросами"""
+        through = Game.genres.through.objects
+        rows = [
+            self.model(platform='', genre_id=None, count=Game.objects.count()),
+            *(self.model(platform=platform, genre_id=None, count=count)
+              for platform, count in Game.objects.values_list('platforms').annotate(n=models.Count('pk')).order_by()),
+            *(self.model(platform='', genre_id=genre_id, count=count)
+              for genre_id, count in through.values_list('genre_id').annotate(n=models.Count('pk')).order_by()),
+            *(self.model(platform=platform, genre_id=genre_id, count=count)
+              for platform, genre_id, count in through.values_list('game__platforms', 'genre_id')
+              .annotate(n=models.Count('pk')).order_by()),
+        ]
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(rows, batch_size=500)
+        return len(rows)
+
+
+class GameFacetCount(models.Model):
+    """
+    Материализованные счетчики игр для фильтров каталога:
+    по платформе, по жанру и по паре платформа x жанр.
+    Поддерживаются сигналами Game и Game.genres, полный пересчет - rebuild_facet_counts.
+    """
+    platform = models.CharField(
+        max_length=50,
+        blank=True,
+        choices=Game.PLATFORM_CHOICES,
+        verbose_name="Платформа",
+        help_text="Пусто - любая платформа"
+    )
+    genre = models.ForeignKey(
+        Genre,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name='facet_counts',
+        verbose_name="Жанр",
+        help_text="Пусто - любой жанр"
+    )
+    count = models.IntegerField(default=0, verbose_name="Количество игр")
+
+    objects = GameFacetCountManager()
+
+    class Meta:
+        verbose_name = "Счетчик фильтра"
+        verbose_name_plural = "Счетчики фильтров"
+        constraints = [
+            models.UniqueConstraint(fields=['platform', 'genre'], name='unique_game_facet'),
+            # NULL не участвует в уникальности, поэтому строки "любой жанр" ограничиваем отдельно
+            models.UniqueConstraint(
+                fields=['platform'], condition=models.Q(genre__isnull=True), name='unique_game_facet_any_genre'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.platform or '*'} / {self.genre_id or '*'}: {self.count}"
+
+
+def _facet_deltas(platform, genre_ids, delta, with_totals=True):
+    deltas = Counter()
+    if with_totals:
+        deltas['', None] += delta
+        deltas[platform, None] += delta
+    for genre_id in genre_ids:
+        deltas['', genre_id] += delta
+        deltas[platform, genre_id] += delta
+    return deltas
+
+
+@receiver(post_save, sender=Game)
+def update_facets_on_save(sender, instance, created, raw=False, **kwargs):
+    old_platform = getattr(instance, '_saved_platform', None)
+    instance._saved_platform = instance.platforms
+    if raw:
+        return
+    if created:
+        # Жанры привязываются позже и учитываются через m2m_changed
+        GameFacetCount.objects.apply(_facet_deltas(instance.platforms, [], 1))
+    elif old_platform is not None and old_platform != instance.platforms:
+        genre_ids = list(instance.genres.values_list('pk', flat=True))
+        deltas = _facet_deltas(old_platform, genre_ids, -1)
+        deltas.update(_facet_deltas(instance.platforms, genre_ids, 1))
+        # Общий счетчик и счетчики жанров при смене платформы не меняются
+        GameFacetCount.objects.apply({key: delta for key, delta in deltas.items() if key[0]})
+
+
+@receiver(pre_delete, sender=Game)
+def remember_genres_on_delete(sender, instance, **kwargs):
+    # Строки m2m удаляются каскадом без m2m_changed, поэтому запоминаем жанры заранее
+    instance._deleted_genre_ids = list(instance.genres.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Game)
+def update_facets_on_delete(sender, instance, **kwargs):
+    genre_ids = getattr(instance, '_deleted_genre_ids', [])
+    GameFacetCount.objects.apply(_facet_deltas(instance.platforms, genre_ids, -1))
+
+
+@receiver(m2m_changed, sender=Game.genres.through)
+def update_facets_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('pre_remove', 'pre_clear'):
+        # Запоминаем реально существующие связи до удаления
+        links = sender.objects.filter(**{'genre' if reverse else 'game': instance})
+        if pk_set is not None:
+            links = links.filter(**{'game_id__in' if reverse else 'genre_id__in': pk_set})
+        instance._removed_genre_links = list(links.values_list('game__platforms', 'genre_id'))
+        return
+    if action == 'post_add' and pk_set:
+        if reverse:
+            links = Game.objects.filter(pk__in=pk_set).values_list('platforms', flat=True)
+            links = [(platform, instance.pk) for platform in links]
+        else:
+            links = [(instance.platforms, genre_id) for genre_id in pk_set]
+        delta = 1
+    elif action in ('post_remove', 'post_clear'):
+        links = getattr(instance, '_removed_genre_links', [])
+        delta = -1
+    else:
+        return
+    deltas = Counter()
+    for platform, genre_id in links:
+        deltas.update(_facet_deltas(platform, [genre_id], delta, with_totals=False))
+    GameFacetCount.objects.apply(deltas)
+
+
+@receiver(m2m_changed, sender=Game.genres.through)
+def touch_games_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    # Жанры входят в выгрузку каталога: инкрементальная выгрузка (updated_since) должна их заметить
+    if reverse and action == 'pre_clear':
+        instance._ungenred_game_ids = list(instance.games.values_list('pk', flat=True))
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        game_ids = [instance.pk]
+    elif action == 'post_clear':
+        game_ids = getattr(instance, '_ungenred_game_ids', [])
+    else:
+        game_ids = pk_set
+    if game_ids:
+        Game.objects.filter(pk__in=game_ids).update(updated_at=timezone.now())
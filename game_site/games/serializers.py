@@ -0,0 +1,20 @@
+from rest_framework import serializers
+
+from .models import Game, Genre
+
+
+class GenreSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Genre
+        fields = ['id', 'name', 'slug']
+
+
+class GameSerializer(serializers.ModelSerializer):
+    url = serializers.CharField(source='get_absolute_url', read_only=True)
+
+    class Meta:
+        model = Game
+        fields = [
+            'id', 'slug', 'title', 'developer', 'publisher', 'release_date', 'platforms', 'genres',
+            'description', 'cover', 'trailer_url', 'rating', 'rating_count', 'url', 'created_at', 'updated_at',
+        ]
@@ -1,3 +1,357 @@
-from django.test import TestCase
+import datetime
+import json
+import os
+import shutil
+import tempfile
+from io import StringIO
 
-# Create your tests here.
+from django.core import serializers
+from django.core.management import call_command
+from django.core.cache import cache
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from reviews.models import Review
+from userapp.models import User
+from . import cache as game_cache
+from .importing import GameImporter
+from .models import Game, GameFacetCount, Genre
+from .views import GameDetailView, GameListView
+
+
+def make_game(**kwargs):
+    defaults = {
+        'title': 'Игра',
+        'slug': 'game',
+        'developer': 'Studio',
+        'release_date': datetime.date(2024, 1, 1),
+        'platforms': Game.PC,
+        'description': 'Описание',
+        'cover': 'game_covers/cover.jpg',
+    }
+    defaults.update(kwargs)
+    return Game.objects.create(**defaults)
+
+
+class GameRatingTestCase(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        self.game = make_game()
+
+    def add_review(self, rating, game=None):
+        return Review.objects.create(
+            game=game or self.game, author=self.author, content='...', rating=rating, pros='', cons=''
+        )
+
+    def assertRating(self, rating, rating_sum, rating_count, game=None):
+        game = game or self.game
+        game.refresh_from_db()
+        self.assertEqual((game.rating, game.rating_sum, game.rating_count), (rating, rating_sum, rating_count))
+
+    def test_incremental_updates(self):
+        first = self.add_review(8)
+        self.add_review(5)
+        self.assertRating(6.5, 13, 2)
+
+        first = Review.objects.get(pk=first.pk)
+        first.rating = 10
+        first.save()
+        self.assertRating(7.5, 15, 2)
+
+        first.delete()
+        self.assertRating(5.0, 5, 1)
+
+    def test_moving_review_to_another_game(self):
+        other = make_game(title='Другая', slug='other')
+        review = self.add_review(6)
+        review = Review.objects.get(pk=review.pk)
+        review.game = other
+        review.save()
+        self.assertRating(0.0, 0, 0)
+        self.assertRating(6.0, 6, 1, game=other)
+
+    def test_fixture_loading_keeps_aggregates(self):
+        review = self.add_review(8)
+        data = serializers.serialize('json', [review])
+        review.delete()
+        # В фикстуре агрегаты игры уже учитывают обзор
+        Game.objects.filter(pk=self.game.pk).update(rating=8.0, rating_sum=8, rating_count=1)
+        for obj in serializers.deserialize('json', data):
+            obj.save()
+        self.assertRating(8.0, 8, 1)
+
+    def test_recompute_ratings_fixes_drift(self):
+        self.add_review(7)
+        self.add_review(9)
+        Game.objects.update(rating=1.0, rating_sum=100, rating_count=1)
+        empty = make_game(title='Пустая', slug='empty')
+        Game.objects.filter(pk=empty.pk).update(rating=3.0, rating_sum=3, rating_count=1)
+
+        call_command('recompute_ratings', stdout=StringIO())
+        self.assertRating(8.0, 16, 2)
+        self.assertRating(0.0, 0, 0, game=empty)
+
+
+class GameListViewTestCase(TestCase):
+    def setUp(self):
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        self.games = []
+        for i in range(5):
+            game = make_game(title=f'Игра {i}', slug=f'game-{i}', release_date=datetime.date(2024, 1, 1 + i % 2),
+                             platforms=Game.PC if i < 4 else Game.PS5)
+            if i % 2 == 0:
+                game.genres.add(self.rpg)
+            self.games.append(game)
+
+    def get_context(self, **params):
+        request = RequestFactory().get('/games', params)
+        return GameListView.as_view(paginate_by=2)(request).context_data
+
+    def test_cursor_pagination_with_filters(self):
+        context = self.get_context(cursor='', platform=Game.PC)
+        first = context['page_obj']
+        context = self.get_context(cursor=first.next_cursor, platform=Game.PC)
+        second = context['page_obj']
+        self.assertFalse(second.has_next())
+        expected = list(Game.objects.filter(platforms=Game.PC).order_by('-release_date', '-pk'))
+        self.assertEqual(first.object_list + second.object_list, expected)
+
+        context = self.get_context(cursor='', genre='rpg')
+        self.assertEqual({game.slug for game in context['object_list']}, {'game-4', 'game-2'})
+
+    def test_offset_pagination_is_default(self):
+        context = self.get_context(genre='rpg')
+        self.assertEqual(context['paginator'].count, 3)
+
+    def test_list_query_count(self):
+        cache.clear()
+        self.get_context()
+        # COUNT, страница, жанры страницы одним запросом, счетчики фильтров
+        with self.assertNumQueries(4):
+            context = self.get_context()
+            badges = [[genre.name for genre in game.genres.all()] for game in context['object_list']]
+        self.assertEqual(badges, [['RPG'] if game in self.games[::2] else [] for game in context['object_list']])
+        self.assertIn('description', context['object_list'][0].get_deferred_fields())
+
+
+class GameFacetCountTestCase(TestCase):
+    def setUp(self):
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        self.shooter = Genre.objects.create(name='Шутер', slug='shooter')
+
+    def assertFacetsConsistent(self):
+        incremental = GameFacetCount.objects.snapshot()
+        GameFacetCount.objects.rebuild()
+        rebuilt = GameFacetCount.objects.snapshot()
+        # Нулевые счетчики после удаления эквивалентны отсутствующим
+        for facets in (incremental, rebuilt):
+            for key in ('platforms', 'genres', 'combined'):
+                facets[key] = {k: v for k, v in facets[key].items() if v}
+        self.assertEqual(incremental, rebuilt)
+        return rebuilt
+
+    def test_incremental_counts(self):
+        game = make_game(slug='a')
+        game.genres.add(self.rpg, self.shooter)
+        other = make_game(slug='b', platforms=Game.PS5)
+        self.rpg.games.add(other)
+        facets = self.assertFacetsConsistent()
+        self.assertEqual(facets['total'], 2)
+        self.assertEqual(facets['genres'], {self.rpg.pk: 2, self.shooter.pk: 1})
+        self.assertEqual(facets['combined'][Game.PS5, self.rpg.pk], 1)
+
+        game = Game.objects.get(pk=game.pk)
+        game.platforms = Game.SWITCH
+        game.save()
+        game.genres.remove(self.shooter, self.rpg)
+        game.genres.remove(self.shooter)
+        other.genres.clear()
+        facets = self.assertFacetsConsistent()
+        self.assertEqual(facets['platforms'], {Game.SWITCH: 1, Game.PS5: 1})
+        self.assertEqual(facets['genres'], {})
+
+        game.genres.add(self.rpg)
+        other.delete()
+        facets = self.assertFacetsConsistent()
+        self.assertEqual(facets['combined'], {(Game.SWITCH, self.rpg.pk): 1})
+
+    def test_list_view_exposes_counts(self):
+        make_game(slug='a').genres.add(self.rpg)
+        make_game(slug='b', platforms=Game.PS5).genres.add(self.rpg, self.shooter)
+        request = RequestFactory().get('/games', {'platform': Game.PS5})
+        context = GameListView.as_view()(request).context_data
+        self.assertEqual(context['genre_counts'], {self.rpg.pk: 1, self.shooter.pk: 1})
+        self.assertEqual(context['platform_counts'], {Game.PC: 1, Game.PS5: 1})
+
+
+class GameDetailCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        self.game = make_game()
+
+    def get_context(self, slug='game'):
+        request = RequestFactory().get(f'/games/game/{slug}/')
+        return GameDetailView.as_view()(request, slug=slug).context_data
+
+    def test_hot_page_is_served_from_cache(self):
+        self.get_context()
+        with self.assertNumQueries(0):
+            context = self.get_context()
+        self.assertEqual(context['object'], self.game)
+
+    def test_cold_detail_query_count(self):
+        from guides.models import Guide
+        from news.models import News
+
+        for i in range(3):
+            Review.objects.create(game=self.game, author=self.author, content='...', rating=7, pros='', cons='')
+            Guide.objects.create(title=f'Гайд {i}', slug=f'guide-{i}', game=self.game, author=self.author,
+                                 content='...', difficulty='beginner', featured_image='guide_images/g.jpg')
+            News.objects.create(title=f'Новость {i}', slug=f'news-{i}', content='...', author=self.author,
+                                game=self.game)
+        cache.clear()
+        # slug -> id, игра, ее жанры, по запросу на гайды, обзоры и новости
+        with self.assertNumQueries(6):
+            context = self.get_context()
+            [str(item) for key in ('guides', 'reviews') for item in context[key]]
+            [(item.author.username, item.game.title) for item in context['news']]
+        # В кэше лежат объекты без отложенных полей: обращение к ним не идет в БД
+        with self.assertNumQueries(0):
+            context = self.get_context()
+            [(item.content, item.game.description) for key in ('guides', 'reviews', 'news') for item in context[key]]
+
+    def test_related_changes_bump_version(self):
+        version = self.get_context()['cache_version']
+        # Версии поднимаются после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            review = Review.objects.create(
+                game=self.game, author=self.author, content='...', rating=9, pros='', cons=''
+            )
+        context = self.get_context()
+        self.assertGreater(context['cache_version'], version)
+        self.assertEqual(context['reviews'], [review])
+        self.assertEqual(context['object'].rating, 9.0)
+
+        other = make_game(title='Другая', slug='other')
+        self.get_context('other')
+        review.game = other
+        with self.captureOnCommitCallbacks(execute=True):
+            review.save()
+        self.assertEqual(self.get_context()['reviews'], [])
+        self.assertEqual(self.get_context('other')['reviews'], [review])
+
+    def test_version_is_bumped_after_commit(self):
+        version = game_cache.get_version(self.game.pk)
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.game.title = 'Новое название'
+            self.game.save()
+            # До коммита читатель заполнил бы новую версию незакоммиченными данными
+            self.assertEqual(game_cache.get_version(self.game.pk), version)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(game_cache.get_version(self.game.pk), version)
+
+    def test_conditional_get(self):
+        request = RequestFactory().get('/games/game/game/')
+        etag = GameDetailView.as_view()(request, slug='game').headers['ETag']
+        # ETag из версий в кэше: ни запросов, ни сборки страницы
+        request = RequestFactory().get('/games/game/game/', HTTP_IF_NONE_MATCH=etag)
+        with self.assertNumQueries(0):
+            self.assertEqual(GameDetailView.as_view()(request, slug='game').status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Review.objects.create(game=self.game, author=self.author, content='...', rating=9, pros='', cons='')
+        response = GameDetailView.as_view()(request, slug='game')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_slug_change(self):
+        self.get_context()
+        self.game.slug = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.game.save()
+        with self.assertRaises(Http404):
+            self.get_context()
+        self.assertEqual(self.get_context('renamed')['object'], self.game)
+
+
+class ImportGamesTestCase(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        cache.clear()
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def test_csv_import_and_jsonl_upsert(self):
+        path = self.write('games.csv', (
+            'slug,title,developer,release_date,platforms,description,cover,genres\n'
+            'elden,Elden,FromSoft,2022-02-25,pc,Open world,game_covers/elden.jpg,rpg|Экшен\n'
+            ',Hades,Supergiant,2020-09-17,SWITCH,Roguelike,,Экшен\n'
+            'broken,Broken,Studio,not-a-date,PC,...,,\n'
+            ',Ведьмак 3,CD Projekt,2015-05-19,PC,...,,\n'
+            ',Смута 3,Cyberia,2024-04-04,PC,...,,\n'
+            ',???,Studio,2024-04-04,PC,...,,\n'
+        ))
+        out = StringIO()
+        call_command('import_games', path, stdout=out, stderr=StringIO())
+        # Не-латинские названия транслитерируются и не сливаются в одну игру "3";
+        # отклоняется только название, из которого slug не построить
+        self.assertIn('Создано: 4, обновлено: 0, с ошибками: 2', out.getvalue())
+        self.assertFalse(Game.objects.filter(slug='3').exists())
+        self.assertTrue(Game.objects.get(title='Ведьмак 3').slug.startswith('vedmak-3-'))
+        self.assertTrue(Game.objects.get(title='Смута 3').slug.startswith('smuta-3-'))
+        elden = Game.objects.get(slug='elden')
+        self.assertEqual(elden.platforms, Game.PC)
+        action = Genre.objects.get(name='Экшен')
+        self.assertEqual(set(elden.genres.all()), {self.rpg, action})
+        self.assertEqual(list(Game.objects.get(slug='hades').genres.all()), [action])
+        facets = GameFacetCount.objects.snapshot()
+        self.assertEqual((facets['total'], facets['genres'][action.pk]), (4, 2))
+
+        self.assertEqual(game_cache.get_detail('elden')['object'].title, 'Elden')
+
+        # Обложки в записи нет - остается прежняя; жанры заменяются
+        path = self.write('update.jsonl', json.dumps({
+            'slug': 'elden', 'title': 'Elden Ring', 'developer': 'FromSoftware', 'release_date': '2022-02-25',
+            'platforms': 'PS5', 'description': 'Open world', 'genres': ['RPG'],
+        }) + '\n{oops\n')
+        out = StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_games', path, stdout=out, stderr=StringIO())
+        self.assertIn('Создано: 0, обновлено: 1, с ошибками: 1', out.getvalue())
+        elden.refresh_from_db()
+        self.assertEqual(
+            (elden.title, elden.platforms, elden.cover.name), ('Elden Ring', 'PS5', 'game_covers/elden.jpg')
+        )
+        self.assertEqual(list(elden.genres.all()), [self.rpg])
+        self.assertEqual(game_cache.get_detail('elden')['object'].title, 'Elden Ring')
+        self.assertEqual(GameFacetCount.objects.snapshot()['platforms'], {'PC': 2, 'PS5': 1, 'SWITCH': 1})
+
+    def test_resume_from_checkpoint(self):
+        path = self.write('games.jsonl', ''.join(
+            json.dumps({'slug': f'game-{i}', 'title': f'Игра {i}', 'developer': 'Studio', 'release_date': '2024-01-01',
+                        'platforms': 'PC', 'description': '...'}) + '\n'
+            for i in range(5)
+        ))
+        checkpoint = path + '.checkpoint'
+
+        def interrupt(processed):
+            if processed >= 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            GameImporter(batch_size=2).run(path, checkpoint_path=checkpoint, progress=interrupt)
+        self.assertEqual(Game.objects.count(), 2)
+
+        importer = GameImporter(batch_size=2)
+        self.assertEqual(importer.run(path, checkpoint_path=checkpoint), 2)
+        self.assertEqual((importer.created, importer.updated), (3, 0))
+        self.assertEqual(Game.objects.count(), 5)
+        self.assertFalse(os.path.exists(checkpoint))
@@ -1,14 +1,19 @@
 from django.shortcuts import render
 
 # Create your views here.
+from django.http import Http404
 from django.views.generic import ListView, DetailView
-from .models import Game, Genre
+from mainapp.conditional import ConditionalGetMixin, page_etag
+from mainapp.pagination import CursorPaginationMixin
+from . import cache as game_cache
+from .models import Game, GameFacetCount
 
 
-class GameListView(ListView):
-    model = Game
+class GameListView(CursorPaginationMixin, ListView):
+    queryset = Game.objects.for_list()
     template_name = 'games/game_list.html'
     paginate_by = 12
+    cursor_ordering = ['-release_date', '-pk']
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -19,21 +24,56 @@ class GameListView(ListView):
         # Фильтрация по жанру
         genre_slug = self.request.GET.get('genre')
         if genre_slug:
-            queryset = queryset.filter(genre__slug=genre_slug)
+            queryset = queryset.filter(genres__slug=genre_slug)
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['genres'] = Genre.objects.all()
+        context['genres'] = game_cache.get_genres()
+        # Счетчики для боковой панели фильтров - один запрос к материализованной таблице
+        facets = GameFacetCount.objects.snapshot()
+        platform = self.request.GET.get('platform')
+        genre = next((g for g in context['genres'] if g.slug == self.request.GET.get('genre')), None)
+        if platform:
+            context['genre_counts'] = {
+                genre_id: count for (p, genre_id), count in facets['combined'].items() if p == platform
+            }
+        else:
+            context['genre_counts'] = facets['genres']
+        if genre:
+            context['platform_counts'] = {
+                p: count for (p, genre_id), count in facets['combined'].items() if genre_id == genre.pk
+            }
+        else:
+            context['platform_counts'] = facets['platforms']
+        context['total_count'] = facets['total']
         return context
 
 
-class GameDetailView(DetailView):
-    model = Game
+class GameDetailView(ConditionalGetMixin, DetailView):
+    queryset = Game.objects.for_detail()
     template_name = 'games/game_detail.html'
 
+    def get_validators(self):
+        # Версия игры меняется вместе с гайдами, обзорами и новостями на странице,
+        # поэтому только ETag: updated_at самой игры их не отражает
+        game_id = game_cache.get_game_id(self.kwargs['slug'])
+        if game_id is None:
+            return None
+        return page_etag(self.request, 'game', game_id, game_cache.page_version(game_id)), None
+
+    def get_object(self, queryset=None):
+        # Игра и связанные блоки берутся из версионированного кэша (см. games.cache)
+        self.detail = game_cache.get_detail(self.kwargs['slug'])
+        if self.detail is None:
+            raise Http404('Игра не найдена')
+        return self.detail['object']
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['guides'] = self.object.guide_set.all()[:5]
-        context['reviews'] = self.object.review_set.all()[:5]
-        return context
\ No newline at end of file
+        context['guides'] = self.detail['guides']
+        context['reviews'] = self.detail['reviews']
+        context['news'] = self.detail['news']
+        # Версия для {% cache %} фрагментов шаблона: меняется вместе со связанными данными
+        context['cache_version'] = self.detail['cache_version']
+        return context
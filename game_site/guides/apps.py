@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class GuidesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'guides'
+
+    def ready(self):
+        from mainapp import counters, images
+        counters.register(self.get_model('Guide'))
+        images.register(self.get_model('Guide'), 'featured_image')
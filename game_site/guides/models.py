@@ -5,6 +5,19 @@ from django.db import models
 from userapp.models import User
 
 
+class GuideQuerySet(models.QuerySet):
+    def for_list(self):
+        """Список гайдов: игра и автор одним JOIN, без текста гайда и описания игры"""
+        return self.select_related('game', 'author').defer('content', 'game__description')
+
+    def for_detail(self):
+        return self.select_related('game', 'author').defer('game__description')
+
+    def for_cache(self):
+        """Гайды для кэша страницы игры: все поля, без отложенных"""
+        return self.select_related('game', 'author')
+
+
 class Guide(models.Model):
     DIFFICULTY_CHOICES = [
         ('beginner', 'Для новичков'),
@@ -23,6 +36,13 @@ class Guide(models.Model):
     featured_image = models.ImageField(upload_to='guide_images/')
     views = models.PositiveIntegerField(default=0)
 
+    objects = GuideQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),  # Сортировка списка и keyset-пагинация
+        ]
+
     def __str__(self):
         return f"{self.title} для {self.game.title}"
 
@@ -0,0 +1,13 @@
+from rest_framework import serializers
+
+from .models import Guide
+
+
+class GuideSerializer(serializers.ModelSerializer):
+    # Без счетчика просмотров: он меняется без updated_at, а представление кэшируется по нему
+    class Meta:
+        model = Guide
+        fields = [
+            'id', 'slug', 'title', 'game', 'author', 'content', 'difficulty', 'featured_image',
+            'created_at', 'updated_at',
+        ]
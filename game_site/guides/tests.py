@@ -1,3 +1,39 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
 
 # Create your tests here.
+from games.tests import make_game
+from mainapp import counters
+from userapp.models import User
+from .models import Guide
+from .views import GuideDetailView, GuideListView
+
+
+class GuideViewsQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Занимаем таймер сброса счетчиков просмотров, чтобы просмотр не писал в БД
+        counters.suspend_flush()
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        for i in range(5):
+            Guide.objects.create(
+                title=f'Гайд {i}', slug=f'guide-{i}', game=make_game(slug=f'game-{i}'), author=author,
+                content='...', difficulty='beginner', featured_image='guide_images/g.jpg',
+            )
+        self.factory = RequestFactory()
+
+    def test_list_query_count(self):
+        # COUNT и страница с играми и авторами
+        with self.assertNumQueries(2):
+            context = GuideListView.as_view()(self.factory.get('/guides/')).context_data
+            titles = [(str(guide), guide.author.username) for guide in context['object_list']]
+        self.assertEqual(len(titles), 5)
+        self.assertIn('content', context['object_list'][0].get_deferred_fields())
+
+    def test_detail_query_count(self):
+        guide = Guide.objects.get(slug='guide-0')
+        # updated_at для ETag и сам объект с автором и игрой
+        with self.assertNumQueries(2):
+            response = GuideDetailView.as_view()(self.factory.get('/guides/'), pk=guide.pk)
+            obj = response.context_data['object']
+            str(obj), obj.author.username, obj.content
@@ -2,14 +2,19 @@ from django.shortcuts import render
 
 # Create your views here.
 from django.views.generic import ListView, DetailView
+from games import cache as game_cache
+from mainapp import counters
+from mainapp.conditional import ConditionalGetMixin, page_etag
+from mainapp.pagination import CursorPaginationMixin
 from .models import Guide
 
 
-class GuideListView(ListView):
-    model = Guide
+class GuideListView(CursorPaginationMixin, ListView):
+    queryset = Guide.objects.for_list()
     template_name = 'guides/guide_list.html'
     paginate_by = 10
     ordering = ['-created_at']
+    cursor_ordering = ['-created_at', '-pk']
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -22,13 +27,27 @@ class GuideListView(ListView):
         return queryset
 
 
-class GuideDetailView(DetailView):
-    model = Guide
+class GuideDetailView(ConditionalGetMixin, DetailView):
+    queryset = Guide.objects.for_detail()
     template_name = 'guides/guide_detail.html'
 
+    def get_validators(self):
+        row = Guide.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'game_id').first()
+        if row is None:
+            return None
+        updated_at, game_id = row
+        etag = page_etag(self.request, 'guide', self.kwargs['pk'], updated_at.timestamp(),
+                         game_cache.page_version(game_id))
+        return etag, updated_at
+
+    def not_modified_hook(self):
+        # Повторный просмотр из кэша браузера - тоже просмотр; для счетчика хватает pk
+        counters.hit(Guide(pk=self.kwargs['pk']))
+
     def get(self, request, *args, **kwargs):
-        # Увеличиваем счетчик просмотров
+        # Увеличиваем счетчик просмотров (буферизованно, запись в БД пачками)
         self.object = self.get_object()
-        self.object.views += 1
-        self.object.save()
-        return super().get(request, *args, **kwargs)
\ No newline at end of file
+        counters.hit(self.object)
+        # super().get() загрузил бы объект повторно
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
\ No newline at end of file
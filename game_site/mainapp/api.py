@@ -0,0 +1,277 @@
+"""
+Публичный JSON API только для чтения: игры, жанры, обзоры, новости, гайды.
+
+Представление объекта (результат сериализатора) кэшируется под ключом с его
+updated_at: изменение объекта дает новый ключ, и инвалидация не нужна.
+Список сначала читает только ключевые поля страницы (pk, updated_at и поля
+сортировки), берет готовые фрагменты одним get_many и сериализует лишь
+промахи - их полные строки загружаются одним запросом через for_detail().
+
+Параметры: ?fields=id,title - только эти поля; ?include=game,author - вместо
+id связанные объекты (их поля - ?fields[game]=title,slug), по запросу на
+связь; ?cursor= и ?page_size= - keyset-пагинация (mainapp.pagination),
+?count=exact|estimate - общее количество.
+
+ETag ответа считается по тем же ключевым полям, поэтому на If-None-Match
+с совпадающим ETag отдается 304 еще до сериализации (mainapp.conditional).
+"""
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.routers import SimpleRouter
+from rest_framework.utils.urls import replace_query_param
+
+from games.models import Game, Genre
+from games.serializers import GameSerializer, GenreSerializer
+from guides.models import Guide
+from guides.serializers import GuideSerializer
+from news.models import News
+from news.serializers import NewsSerializer
+from reviews.models import Review
+from reviews.serializers import ReviewSerializer
+from userapp.serializers import PublicUserSerializer
+
+from . import conditional
+from .pagination import COUNT_ESTIMATE, COUNT_EXACT, COUNT_NONE, CursorPaginator, InvalidCursor
+
+# Увеличить при изменении сериализаторов: старые фрагменты перестанут читаться
+FRAGMENT_VERSION = 1
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _has_updated_at(model):
+    try:
+        model._meta.get_field('updated_at')
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def fragment_key(model, pk, updated_at):
+    return f'api:v{FRAGMENT_VERSION}:{model._meta.label_lower}:{pk}:{updated_at.timestamp():.6f}'
+
+
+def represent(serializer_class, objects):
+    """
+    Представления объектов в том же порядке. У объектов достаточно pk и updated_at:
+    готовые берутся из кэша, остальные загружаются одним запросом и сериализуются.
+    Модели без updated_at сериализуются каждый раз.
+    """
+    model = serializer_class.Meta.model
+    if not _has_updated_at(model):
+        return [dict(serializer_class(obj).data) for obj in objects]
+    keys = {obj.pk: fragment_key(model, obj.pk, obj.updated_at) for obj in objects}
+    fragments = cache.get_many(keys.values())
+    missing = [pk for pk, key in keys.items() if key not in fragments]
+    if missing:
+        manager = model._default_manager
+        queryset = manager.for_detail() if hasattr(manager, 'for_detail') else manager.all()
+        fresh = {}
+        for obj in queryset.filter(pk__in=missing):
+            # Объект мог измениться после чтения страницы - ключ по его актуальной версии.
+            # ETag ответа посчитан по updated_at из скелета и тело может оказаться новее его;
+            # это безвредно: следующий запрос прочитает новый updated_at, получит другой ETag,
+            # а фрагмент уже лежит под ключом новой версии
+            keys[obj.pk] = fragment_key(model, obj.pk, obj.updated_at)
+            fresh[keys[obj.pk]] = dict(serializer_class(obj).data)
+        cache.set_many(fresh, FRAGMENT_TIMEOUT)
+        fragments.update(fresh)
+    # Удаленные за это время объекты пропускаются
+    return [fragments[keys[obj.pk]] for obj in objects if keys[obj.pk] in fragments]
+
+
+def _requested_fields(value, serializer_class, param):
+    if not value:
+        return None
+    fields = [field.strip() for field in value.split(',') if field.strip()]
+    unknown = sorted(set(fields) - set(serializer_class.Meta.fields))
+    if unknown:
+        raise ValidationError({param: f'Неизвестные поля: {", ".join(unknown)}'})
+    return fields
+
+
+def _only(data, fields):
+    return data if fields is None else {field: data[field] for field in fields if field in data}
+
+
+class CursorPagination(BasePagination):
+    """DRF-обертка над CursorPaginator: ?cursor=, ?page_size=, ?count="""
+
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            page_size = int(request.query_params.get('page_size', DEFAULT_PAGE_SIZE))
+        except ValueError:
+            raise ValidationError({'page_size': 'Ожидается число'})
+        page_size = min(max(page_size, 1), MAX_PAGE_SIZE)
+        count_mode = request.query_params.get('count', COUNT_NONE)
+        if count_mode not in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE):
+            count_mode = COUNT_NONE
+        self.request = request
+        self.paginator = CursorPaginator(queryset, page_size, view.ordering, count_mode)
+        try:
+            self.page = self.paginator.page(request.query_params.get('cursor') or None)
+        except InvalidCursor as exc:
+            raise ValidationError({'cursor': str(exc)})
+        self.count = self.paginator.count
+        return list(self.page)
+
+    def get_validators(self):
+        """Части ответа помимо объектов страницы - для ETag"""
+        return [self.page.next_cursor, self.page.previous_cursor, self.count]
+
+    def _link(self, cursor):
+        if cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), 'cursor', cursor)
+
+    def get_paginated_response(self, data):
+        payload = {
+            'next': self._link(self.page.next_cursor),
+            'previous': self._link(self.page.previous_cursor),
+        }
+        if self.count is not None:
+            payload['count'] = self.count
+        payload['results'] = data
+        return Response(payload)
+
+
+class FragmentViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Список и объект из кэшированных фрагментов. ordering - поля keyset-сортировки,
+    includes - {поле с id: сериализатор связанного объекта} для ?include=.
+    """
+    ordering = ['-created_at', '-pk']
+    includes = {}
+    pagination_class = CursorPagination
+    lookup_value_converter = 'int'
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        model = queryset.model
+        if not _has_updated_at(model):
+            return queryset
+        # Остальные поля придут из кэша фрагментов или догрузятся для промахов
+        return queryset.only('pk', 'updated_at', *(item.lstrip('-') for item in self.ordering))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        objects = self.paginate_queryset(queryset)
+        if objects is None:
+            objects = list(queryset.order_by(*self.ordering))
+            return self.not_modified(objects) or Response(self.build(objects))
+        extra = self.paginator.get_validators()
+        return self.not_modified(objects, extra) or self.get_paginated_response(self.build(objects))
+
+    def retrieve(self, request, *args, **kwargs):
+        obj = self.get_object()
+        last_modified = getattr(obj, 'updated_at', None)
+        return self.not_modified([obj], last_modified=last_modified) or Response(self.build([obj])[0])
+
+    def not_modified(self, objects, extra=(), last_modified=None):
+        """
+        304 до сериализации, если ответ не изменился. ETag - по pk и updated_at
+        объектов и адресу запроса (поля, курсор, хост ссылок). Со связанными
+        объектами (?include=) ответ зависит от их версий - такие запросы не проверяются.
+        """
+        if not _has_updated_at(self.queryset.model) or self.request.query_params.get('include'):
+            self.validators = None
+            return None
+        self.validators = (
+            conditional.make_etag(
+                FRAGMENT_VERSION, self.request.get_host(), self.request.get_full_path(), *extra,
+                *((obj.pk, obj.updated_at.timestamp()) for obj in objects),
+            ),
+            last_modified,
+        )
+        return conditional.not_modified(self.request, *self.validators)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        validators = getattr(self, 'validators', None)
+        if validators and response.status_code == 200:
+            conditional.set_validators(response, *validators)
+        return response
+
+    def build(self, objects):
+        params = self.request.query_params
+        fields = _requested_fields(params.get('fields'), self.serializer_class, 'fields')
+        includes = [name.strip() for name in params.get('include', '').split(',') if name.strip()]
+        unknown = sorted(set(includes) - set(self.includes))
+        if unknown:
+            raise ValidationError({'include': f'Нельзя раскрыть: {", ".join(unknown)}'})
+
+        data = [_only(fragment, fields) for fragment in represent(self.serializer_class, objects)]
+        for name in includes:
+            if data and name not in data[0]:
+                continue
+            self.expand(data, name, self.includes[name])
+        return data
+
+    def expand(self, data, name, serializer_class):
+        """Заменяет id в поле name (одно или список) представлениями связанных объектов"""
+        fields = _requested_fields(self.request.query_params.get(f'fields[{name}]'), serializer_class,
+                                   f'fields[{name}]')
+        ids = set()
+        for item in data:
+            value = item[name]
+            ids.update(value if isinstance(value, list) else [value])
+        ids.discard(None)
+        model = serializer_class.Meta.model
+        queryset = model._default_manager.filter(pk__in=ids)
+        if _has_updated_at(model):
+            queryset = queryset.only('pk', 'updated_at')
+        related = {
+            fragment['id']: _only(fragment, fields) for fragment in represent(serializer_class, list(queryset))
+        }
+        for item in data:
+            value = item[name]
+            item[name] = [related.get(pk) for pk in value] if isinstance(value, list) else related.get(value)
+
+
+class GameViewSet(FragmentViewSet):
+    queryset = Game.objects.all()
+    serializer_class = GameSerializer
+    ordering = ['-release_date', '-pk']
+    includes = {'genres': GenreSerializer}
+    lookup_field = 'slug'
+    lookup_value_converter = 'slug'
+
+
+class GenreViewSet(FragmentViewSet):
+    queryset = Genre.objects.all()
+    serializer_class = GenreSerializer
+    ordering = ['name', 'pk']
+    pagination_class = None
+    lookup_field = 'slug'
+    lookup_value_converter = 'slug'
+
+
+class ReviewViewSet(FragmentViewSet):
+    queryset = Review.objects.all()
+    serializer_class = ReviewSerializer
+    includes = {'game': GameSerializer, 'author': PublicUserSerializer}
+
+
+class NewsViewSet(FragmentViewSet):
+    queryset = News.objects.all()
+    serializer_class = NewsSerializer
+    includes = {'game': GameSerializer, 'author': PublicUserSerializer}
+
+
+class GuideViewSet(FragmentViewSet):
+    queryset = Guide.objects.all()
+    serializer_class = GuideSerializer
+    includes = {'game': GameSerializer, 'author': PublicUserSerializer}
+
+
+router = SimpleRouter(use_regex_path=False)
+router.register('games', GameViewSet, basename='api-game')
+router.register('genres', GenreViewSet, basename='api-genre')
+router.register('reviews', ReviewViewSet, basename='api-review')
+router.register('news', NewsViewSet, basename='api-news')
+router.register('guides', GuideViewSet, basename='api-guide')
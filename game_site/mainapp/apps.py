@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class MainappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'mainapp'
+
+    def ready(self):
+        from . import db  # noqa: F401 - PRAGMA для новых соединений SQLite
+        from . import search
+        search.connect_signals()
+        post_migrate.connect(search.create_fts_table, sender=self)
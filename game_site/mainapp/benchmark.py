@@ -0,0 +1,235 @@
+"""
+Нагрузочный прогон страниц сайта.
+
+targets() обходит urls.py и подставляет в маршруты с параметрами реальные
+slug/pk/username из БД. run() гоняет запросы в несколько потоков - либо
+внутри процесса через тестовый Client (SQL-запросы считает QueryRecorder),
+либо по HTTP к запущенному серверу (число запросов берется из заголовка
+X-DB-Query-Count, если включен SQL_INSTRUMENTATION). compare() сверяет
+результат с сохраненной базовой линией.
+"""
+import json
+import math
+import re
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from statistics import median
+
+from django.apps import apps
+from django.db import connections
+from django.test import Client
+from django.urls import URLPattern, URLResolver, get_resolver
+from django.urls.resolvers import RoutePattern
+
+from .instrumentation import QueryRecorder
+
+# Не нагружаем: админка, OAuth, формы с побочными эффектами и бесконечный стрим
+SKIP_NAMESPACES = {'admin', 'social'}
+SKIP_NAMES = {'logout', 'notification_stream'}
+SKIP_NAME_PARTS = ('password',)
+
+# Сколько разных объектов подставлять в маршруты с параметрами
+SAMPLE_SIZE = 50
+
+_param_re = re.compile(r'<(?:\w+:)?(\w+)>')
+
+
+def _walk(patterns, prefix='', namespace=None):
+    for pattern in patterns:
+        route = prefix + str(pattern.pattern)
+        if isinstance(pattern, URLResolver):
+            yield from _walk(pattern.url_patterns, route, pattern.namespace or namespace)
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield namespace, route, pattern
+
+
+def _skipped(namespace, name):
+    return namespace in SKIP_NAMESPACES or name in SKIP_NAMES or any(part in name for part in SKIP_NAME_PARTS)
+
+
+def _samples(pattern, params):
+    """Список значений параметров маршрута: из модели вью или из пользователей"""
+    # У ViewSet из DRF класс лежит в атрибуте cls
+    view_class = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+    model = getattr(view_class, 'model', None)
+    if model is None and getattr(view_class, 'queryset', None) is not None:
+        model = view_class.queryset.model
+    if 'username' in params:
+        model = apps.get_model('userapp', 'User')
+    if model is None:
+        return []
+    rows = model._default_manager.order_by('-pk').values_list(*params)[:SAMPLE_SIZE]
+    return [dict(zip(params, row)) for row in rows]
+
+
+def _fill(route, kwargs):
+    return '/' + _param_re.sub(lambda match: str(kwargs[match.group(1)]), route)
+
+
+def targets(only=None):
+    """[(маршрут, [url, ...])] для всех подходящих маршрутов; only - префиксы маршрутов
+
+    Ключ - шаблон маршрута ('/news/<int:pk>/'): имена вроде 'list' и 'detail'
+    в приложениях без app_name повторяются.
+    """
+    result = []
+    for namespace, route, pattern in _walk(get_resolver().url_patterns):
+        if not isinstance(pattern.pattern, RoutePattern) or _skipped(namespace, pattern.name):
+            continue
+        if only and not ('/' + route).startswith(tuple(only)):
+            continue
+        params = list(pattern.pattern.converters)
+        if params:
+            urls = [_fill(route, kwargs) for kwargs in _samples(pattern, params)]
+        else:
+            urls = ['/' + route]
+        if urls:
+            result.append(('/' + route, urls))
+    return result
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, math.ceil(q / 100 * len(ordered)) - 1)
+    return ordered[index]
+
+
+class InProcessTransport:
+    """Запросы через тестовый Client в этом же процессе"""
+
+    def __init__(self, user=None):
+        self.user = user
+        self.local = threading.local()
+
+    def client(self):
+        client = getattr(self.local, 'client', None)
+        if client is None:
+            client = self.local.client = Client(raise_request_exception=False)
+            if self.user is not None:
+                client.force_login(self.user)
+        return client
+
+    def request(self, url):
+        client = self.client()
+        with QueryRecorder() as recorder:
+            response = client.get(url)
+        return response.status_code, recorder.count
+
+
+class HTTPTransport:
+    """Запросы по HTTP к запущенному серверу"""
+
+    def __init__(self, base_url, timeout=30):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def request(self, url):
+        try:
+            with urllib.request.urlopen(self.base_url + url, timeout=self.timeout) as response:
+                response.read()
+                status, headers = response.status, response.headers
+        except urllib.error.HTTPError as error:
+            status, headers = error.code, error.headers
+        queries = headers.get('X-DB-Query-Count')
+        return status, int(queries) if queries is not None else None
+
+
+def run(transport, target_list, requests=100, concurrency=4):
+    """Гоняет requests запросов на каждый маршрут в concurrency потоков. Возвращает отчет по маршрутам"""
+    report = {}
+    for name, urls in target_list:
+        samples = []
+        lock = threading.Lock()
+        counter = iter(range(requests))
+
+        def worker():
+            while True:
+                with lock:
+                    index = next(counter, None)
+                if index is None:
+                    return
+                url = urls[index % len(urls)]
+                start = time.perf_counter()
+                status, queries = transport.request(url)
+                elapsed = time.perf_counter() - start
+                with lock:
+                    samples.append((elapsed, status, queries))
+
+        def threaded_worker():
+            try:
+                worker()
+            finally:
+                # У каждого потока свои соединения с БД
+                connections.close_all()
+
+        started = time.perf_counter()
+        if concurrency <= 1:
+            worker()
+        else:
+            threads = [threading.Thread(target=threaded_worker) for _ in range(concurrency)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        wall = time.perf_counter() - started
+        report[name] = summarize(samples, wall)
+    return report
+
+
+def summarize(samples, wall):
+    latencies = [elapsed * 1000 for elapsed, _, _ in samples]
+    queries = [count for _, _, count in samples if count is not None]
+    statuses = defaultdict(int)
+    for _, status, _ in samples:
+        statuses[str(status)] += 1
+    return {
+        'requests': len(samples),
+        'rps': round(len(samples) / wall, 1) if wall else 0.0,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'queries': median(queries) if queries else None,
+        'errors': sum(n for status, n in statuses.items() if status.startswith('5')),
+        'statuses': dict(statuses),
+    }
+
+
+def compare(report, baseline, threshold=0.2):
+    """Регрессии относительно базовой линии: [(маршрут, метрика, было, стало)]
+
+    Задержка хуже больше чем на threshold, пропускная способность ниже больше
+    чем на threshold, любое увеличение числа SQL-запросов.
+    """
+    regressions = []
+    for name, current in report.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('p50_ms', 'p95_ms'):
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], current[metric]))
+        if previous['rps'] and current['rps'] < previous['rps'] * (1 - threshold):
+            regressions.append((name, 'rps', previous['rps'], current['rps']))
+        if previous.get('queries') is not None and current.get('queries') is not None \
+                and current['queries'] > previous['queries']:
+            regressions.append((name, 'queries', previous['queries'], current['queries']))
+    return regressions
+
+
+def load_baseline(path):
+    try:
+        with open(path, encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def save_baseline(path, report):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2, sort_keys=True)
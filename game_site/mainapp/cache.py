@@ -0,0 +1,227 @@
+"""
+Общие помощники кэширования: версионированные ключи и двухуровневый кэш.
+
+Версионированные ключи: данные кэшируются под ключом с номером версии,
+а инвалидация лишь увеличивает версию. В отличие от удаления ключа это
+не оставляет окна, в котором параллельный запрос запишет в кэш устаревшие данные.
+Новая версия - метка времени в наносекундах, записанная set(): в отличие от incr()
+это атомарно на любом бэкенде, и одновременные увеличения не сливаются в одно.
+Ключи версий живут VERSION_TIMEOUT; после истечения версия начнется с текущего
+времени - больше всех прежних, так что старые данные не оживут.
+"""
+import math
+import pickle
+import random
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.utils.functional import SimpleLazyObject
+
+
+VERSION_TIMEOUT = 60 * 60 * 24 * 30
+
+
+def _version_key(name):
+    return f'{name}:version'
+
+
+def _new_version(current=None):
+    # От текущего времени: после вытеснения ключа старые версии не повторятся
+    return max(time.time_ns(), (current or 0) + 1)
+
+
+def get_version(name):
+    version = cache.get(_version_key(name))
+    if version is None:
+        version = _new_version()
+        if not cache.add(_version_key(name), version, timeout=VERSION_TIMEOUT):
+            version = cache.get(_version_key(name), version)
+    return version
+
+
+def get_versions(names):
+    """{name: версия} для многих имен одним get_many"""
+    keys = {name: _version_key(name) for name in names}
+    found = cache.get_many(keys.values())
+    return {name: found[key] if key in found else get_version(name) for name, key in keys.items()}
+
+
+def bump_version(name):
+    cache.set(_version_key(name), _new_version(cache.get(_version_key(name))), timeout=VERSION_TIMEOUT)
+
+
+def versioned_key(name, *parts):
+    """Ключ текущей версии: '<name>:v<версия>:<parts>'"""
+    return ':'.join([name, f'v{get_version(name)}', *map(str, parts)])
+
+
+class LRUCache:
+    """
+    Потокобезопасный LRU-кэш процесса, ограниченный числом записей и объемом в байтах.
+    Значения хранятся сериализованными, как в locmem: запросы не делят изменяемые объекты.
+    """
+
+    def __init__(self, max_entries=1000, max_bytes=16 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data = OrderedDict()  # key -> (pickled value, expires_at, size)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            if item[1] <= time.monotonic():
+                self._pop(key)
+                return default
+            self._data.move_to_end(key)
+        return pickle.loads(item[0])
+
+    def set(self, key, value, timeout):
+        try:
+            data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        except (pickle.PicklingError, TypeError, AttributeError):
+            return
+        size = len(data)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+            self._data[key] = (data, time.monotonic() + timeout, size)
+            self.size += size
+            while len(self._data) > self.max_entries or self.size > self.max_bytes:
+                self._pop(next(iter(self._data)))
+
+    def delete(self, key):
+        with self._lock:
+            if key in self._data:
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key):
+        self.size -= self._data.pop(key)[2]
+
+
+class TwoTierCache:
+    """
+    Двухуровневый кэш: L1 - LRU в памяти процесса, L2 - общий бэкенд Django (CACHES).
+
+    get_or_set() защищает от "эффекта толпы": пересчет значения выполняет один
+    поток (блокировка в процессе) и один процесс (блокировка в L2), остальные
+    получают прежнее значение или ждут результата. Кроме того, значение
+    пересчитывается заранее с вероятностью, растущей к концу срока жизни
+    (probabilistic early expiration, XFetch), поэтому горячие ключи обычно
+    не истекают одновременно у всех.
+
+    L1 не инвалидируется между процессами, поэтому живет недолго (L1_TIMEOUT);
+    для данных, которые должны обновляться сразу, используйте versioned_key().
+    """
+    LOCK_STRIPES = 64
+
+    def __init__(self, alias='default', l1_max_entries=1000, l1_max_bytes=16 * 1024 * 1024,
+                 l1_timeout=10, lock_timeout=10, beta=1.0):
+        self.alias = alias
+        self.l1 = LRUCache(l1_max_entries, l1_max_bytes)
+        self.l1_timeout = l1_timeout
+        self.lock_timeout = lock_timeout
+        self.beta = beta
+        self._locks = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+
+    @property
+    def l2(self):
+        return caches[self.alias]
+
+    def _entry(self, key):
+        entry = self.l1.get(key)
+        if entry is None:
+            entry = self.l2.get(key)
+            if entry is not None:
+                self.l1.set(key, entry, min(self.l1_timeout, max(entry[2] - time.time(), 0)))
+        return entry
+
+    def _store(self, key, value, delta, timeout):
+        entry = (value, delta, time.time() + timeout)
+        self.l2.set(key, entry, timeout)
+        self.l1.set(key, entry, min(self.l1_timeout, timeout))
+
+    def get(self, key, default=None):
+        entry = self._entry(key)
+        return default if entry is None else entry[0]
+
+    def set(self, key, value, timeout=300):
+        self._store(key, value, 0, timeout)
+
+    def delete(self, key):
+        self.l1.delete(key)
+        self.l2.delete(key)
+
+    def clear(self):
+        """Очищает оба уровня; L1 других процессов истечет сам через l1_timeout"""
+        self.l1.clear()
+        self.l2.clear()
+
+    def is_fresh(self, entry):
+        value, delta, expires_at = entry
+        # XFetch: чем дольше считается значение и чем ближе срок, тем вероятнее ранний пересчет
+        return time.time() - delta * self.beta * math.log(random.random() or 1e-12) < expires_at
+
+    def get_or_set(self, key, compute, timeout=300):
+        entry = self._entry(key)
+        if entry is not None and self.is_fresh(entry):
+            return entry[0]
+
+        with self._locks[hash(key) % self.LOCK_STRIPES]:
+            current = self._entry(key)
+            if current is not None and (entry is None or current[2] != entry[2]):
+                # Пока ждали блокировку, значение пересчитал другой поток
+                return current[0]
+
+            lock_key = f'{key}:lock'
+            locked = self.l2.add(lock_key, 1, self.lock_timeout)
+            if not locked:
+                if entry is not None:
+                    # Пересчетом уже занят другой процесс - отдаем прежнее значение
+                    return entry[0]
+                deadline = time.monotonic() + self.lock_timeout
+                while time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    current = self.l2.get(key)
+                    if current is not None:
+                        return current[0]
+            try:
+                started = time.monotonic()
+                value = compute()
+                self._store(key, value, time.monotonic() - started, timeout)
+                return value
+            finally:
+                if locked:
+                    self.l2.delete(lock_key)
+
+
+def _build_tiered():
+    options = getattr(settings, 'TWO_TIER_CACHE', {})
+    return TwoTierCache(
+        alias=options.get('ALIAS', 'default'),
+        l1_max_entries=options.get('L1_MAX_ENTRIES', 1000),
+        l1_max_bytes=options.get('L1_MAX_BYTES', 16 * 1024 * 1024),
+        l1_timeout=options.get('L1_TIMEOUT', 10),
+        lock_timeout=options.get('LOCK_TIMEOUT', 10),
+        beta=options.get('BETA', 1.0),
+    )
+
+
+# Общий для процесса экземпляр
+tiered = SimpleLazyObject(_build_tiered)
@@ -0,0 +1,83 @@
+"""
+Условный GET: ETag и Last-Modified без загрузки и рендеринга страницы.
+
+Валидаторы считаются из дешевых данных - updated_at одним values_list и
+версий связанного содержимого из кэша (games.cache). Если клиент или
+обратный прокси прислал совпадающий If-None-Match / If-Modified-Since,
+отдается 304 без шаблона и тела. Связанное содержимое учитывает только ETag,
+но при If-None-Match дата Django уже не проверяет.
+
+HTML-страницы зависят от пользователя (меню, CSRF-токен), поэтому в ETag
+страницы входит id пользователя; при непоказанных flash-сообщениях
+проверка не выполняется - иначе сообщение потерялось бы за 304.
+"""
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """Сильный ETag из произвольных значений"""
+    return quote_etag(hashlib.md5(':'.join(map(str, parts)).encode()).hexdigest())
+
+
+def page_etag(request, *parts):
+    """ETag HTML-страницы: с учетом пользователя"""
+    user = getattr(request, 'user', None)
+    return make_etag(getattr(user, 'pk', None) or 0, *parts)
+
+
+def has_pending_messages(request):
+    # len() загружает сообщения, но не помечает их показанными
+    return hasattr(request, '_messages') and len(get_messages(request)) > 0
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """Ответ 304/412, если условие запроса выполнено, иначе None"""
+    if request.method not in ('GET', 'HEAD'):
+        return None
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    if etag and not response.has_header('ETag'):
+        response.headers['ETag'] = etag
+    if last_modified and not response.has_header('Last-Modified'):
+        response.headers['Last-Modified'] = http_date(last_modified.timestamp())
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    Условный GET для DetailView. get_validators() возвращает (etag, last_modified)
+    или None - нет объекта или валидаторов; тогда запрос идет обычным путем.
+    not_modified_hook() вызывается при ответе 304, например для учета просмотра.
+    """
+
+    def get_validators(self):
+        return None
+
+    def not_modified_hook(self):
+        pass
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or has_pending_messages(request):
+            return super().dispatch(request, *args, **kwargs)
+        validators = self.get_validators()
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+        response = not_modified(request, *validators)
+        if response is None:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                set_validators(response, *validators)
+            return response
+        if response.status_code == 304:
+            self.not_modified_hook()
+        return response
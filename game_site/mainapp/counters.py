@@ -0,0 +1,166 @@
+"""
+Буферизованные счетчики просмотров.
+
+Вместо UPDATE всей строки на каждый просмотр инкременты копятся в кэше
+и периодически сбрасываются в БД пакетными ``F('views') + n``.
+
+Кэш счетчиков (VIEW_COUNTER_CACHE) должен давать атомарные incr/add. Без Redis
+это кэш в памяти процесса: у каждого процесса свой буфер, pending() и flush()
+видят только его. Воркер Celery такого буфера не видит, поэтому сброс тогда
+выполняется в том же процессе, даже если брокер настроен.
+"""
+from collections import defaultdict
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import F
+
+from .routers import internal_writes
+
+KEY_PREFIX = 'viewcounter'
+# Пометка "объект в очереди" живет ограниченно: если его слот потерялся,
+# следующий просмотр после истечения снова поставит объект в очередь
+DIRTY_TIMEOUT = 60 * 60
+
+# label модели -> имя поля счетчика
+_registry = {}
+
+
+def register(model, field='views'):
+    """Подключает модель к буферизованному счетчику (вызывается из AppConfig.ready)"""
+    _registry[model._meta.label_lower] = field
+
+
+def get_cache():
+    return caches[getattr(settings, 'VIEW_COUNTER_CACHE', 'default')]
+
+
+def is_process_local():
+    """Буфер живет в памяти процесса - сбрасывать его может только этот процесс"""
+    return isinstance(get_cache(), LocMemCache)
+
+
+def flush_interval():
+    """Как часто (в секундах) сбрасывать буфер в БД"""
+    return getattr(settings, 'VIEW_COUNTER_FLUSH_INTERVAL', 30)
+
+
+def _key(*parts):
+    return ':'.join([KEY_PREFIX, *map(str, parts)])
+
+
+def _incr(cache, key, delta):
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Ключа еще нет: первый add выигрывает, остальные просто инкрементируют
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def hit(obj, n=1):
+    """Регистрирует n просмотров объекта без записи в БД"""
+    label = obj._meta.label_lower
+    if label not in _registry:
+        raise ValueError(f'Модель {label} не зарегистрирована в счетчике просмотров')
+    cache = get_cache()
+    _incr(cache, _key(label, 'count', obj.pk), n)
+    # Первый инкремент после сброса помечает объект как "грязный"
+    if cache.add(_key(label, 'dirty', obj.pk), 1, timeout=DIRTY_TIMEOUT):
+        slot = _incr(cache, _key(label, 'slots'), 1)
+        cache.set(_key(label, 'slot', slot), obj.pk, timeout=None)
+    _incr(cache, _key('pending'), n)
+    # add() одновременно служит и таймером, и блокировкой: сброс запускается один раз за интервал,
+    # и не в запросе посетителя, а задачей Celery - если воркер видит тот же буфер
+    if cache.add(_key('flush-lock'), 1, timeout=flush_interval()):
+        if is_process_local():
+            flush()
+        else:
+            from .tasks import flush_view_counters
+
+            flush_view_counters.delay()
+
+
+def suspend_flush(timeout=60 * 60):
+    """Занимает таймер сброса: timeout секунд hit() не запускает сброс (для тестов)"""
+    get_cache().set(_key('flush-lock'), 1, timeout=timeout)
+
+
+def resume_flush():
+    """Освобождает таймер: следующий hit() снова запустит сброс"""
+    get_cache().delete(_key('flush-lock'))
+
+
+def pending():
+    """Сколько инкрементов накоплено и еще не записано в БД"""
+    return get_cache().get(_key('pending'), 0)
+
+
+def pending_for(obj):
+    """Сколько несброшенных просмотров у конкретного объекта"""
+    return get_cache().get(_key(obj._meta.label_lower, 'count', obj.pk), 0)
+
+
+def flush():
+    """
+    Записывает накопленные инкременты в БД.
+    Возвращает словарь {label: количество записанных просмотров}.
+    """
+    cache = get_cache()
+    result = {}
+    total = 0
+    for label, field in _registry.items():
+        last = cache.get(_key(label, 'slots'), 0)
+        done = cache.get(_key(label, 'flushed'), 0)
+        if last <= done:
+            continue
+        slot_keys = [_key(label, 'slot', slot) for slot in range(done + 1, last + 1)]
+        slots = cache.get_many(slot_keys)
+        # Слот уже выделен, но hit() еще не записал в него pk - сбрасываем только слоты до него,
+        # остальные дождутся следующего сброса. Пропуск, не заполнившийся и к следующему
+        # сбросу (процесс упал между incr и set), отбрасывается
+        gap_key = _key(label, 'gap')
+        for index, key in enumerate(slot_keys):
+            if key not in slots and cache.get(gap_key) != done + 1 + index:
+                cache.set(gap_key, done + 1 + index, timeout=None)
+                slot_keys = slot_keys[:index]
+                last = done + index
+                break
+        if not slot_keys:
+            continue
+        pks = [slots[key] for key in slot_keys if key in slots]
+        cache.delete_many(slot_keys)
+        cache.set(_key(label, 'flushed'), last, timeout=None)
+
+        # Группируем объекты по величине инкремента: один UPDATE на каждое значение n
+        by_delta = defaultdict(list)
+        for pk in pks:
+            # Сначала снимаем пометку, чтобы параллельные просмотры заново встали в очередь
+            cache.delete(_key(label, 'dirty', pk))
+            count_key = _key(label, 'count', pk)
+            delta = cache.get(count_key, 0)
+            if delta:
+                try:
+                    cache.decr(count_key, delta)
+                except ValueError:
+                    # Ключ вытеснили между get и decr - прочитанные просмотры все равно записываем
+                    pass
+                by_delta[delta].append(pk)
+        if not by_delta:
+            continue
+
+        model = apps.get_model(label)
+        # Сброс мог выполниться в запросе посетителя - это не его запись
+        with internal_writes(), transaction.atomic():
+            for delta, delta_pks in by_delta.items():
+                model._default_manager.filter(pk__in=delta_pks).update(**{field: F(field) + delta})
+        result[label] = sum(delta * len(delta_pks) for delta, delta_pks in by_delta.items())
+        total += result[label]
+
+    if total:
+        _incr(cache, _key('pending'), -total)
+    return result
@@ -0,0 +1,34 @@
+"""
+Настройка соединений SQLite для боевой нагрузки.
+
+При каждом новом соединении (сигнал connection_created) выполняются PRAGMA
+из настройки SQLITE_PRAGMAS: журнал WAL (читатели не ждут писателя),
+synchronous=NORMAL (в режиме WAL надежно и без fsync на каждый коммит),
+mmap, размер страничного кэша и ожидание блокировки вместо ошибки
+"database is locked". Вместе с CONN_MAX_AGE (в боевом профиле под WSGI)
+соединение и его настройки живут между запросами.
+"""
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+
+def pragmas():
+    return settings.SQLITE_PRAGMAS
+
+
+def apply_pragmas(cursor, values=None):
+    for name, value in (pragmas() if values is None else values).items():
+        cursor.execute(f'PRAGMA {name} = {value}')
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    values = dict(pragmas())
+    if connection.is_in_memory_db():
+        # У базы в памяти нет файла журнала
+        values.pop('journal_mode', None)
+    with connection.cursor() as cursor:
+        apply_pragmas(cursor, values)
@@ -0,0 +1,151 @@
+"""
+Потоковая выгрузка каталога игр и обзоров в NDJSON или CSV.
+
+Строки читаются QuerySet.iterator(chunk_size) через values() - в памяти только
+текущая пачка. Жанры игр подгружаются одним запросом на пачку. Результат
+отдается генератором байтов, который можно на лету сжимать в gzip: его
+потребляют и StreamingHttpResponse, и команда export_catalog. Под ASGI
+синхронный генератор Django собрал бы в память целиком, поэтому там он
+оборачивается в aiterate() - асинхронный итератор, читающий по пачке.
+
+Выгрузка игр в CSV совместима с import_games. updated_since отбирает записи
+по updated_at (у игр его обновляют и смена жанров, и новые оценки).
+"""
+import csv
+import datetime
+import itertools
+import json
+import zlib
+
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from games.importing import GENRE_SEPARATOR
+
+DEFAULT_CHUNK_SIZE = 2000
+FORMATS = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv',
+}
+GZIP_LEVEL = 6
+
+
+def _games(updated_since, chunk_size):
+    Game = apps.get_model('games', 'Game')
+    through = Game.genres.through
+    queryset = Game.objects.order_by('pk')
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    rows = queryset.values(
+        'id', 'slug', 'title', 'developer', 'publisher', 'release_date', 'platforms', 'description',
+        'cover', 'trailer_url', 'rating', 'rating_count', 'created_at', 'updated_at',
+    ).iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        genres = {}
+        links = through.objects.filter(game_id__in=[row['id'] for row in chunk]).order_by('genre__name')
+        for game_id, slug in links.values_list('game_id', 'genre__slug'):
+            genres.setdefault(game_id, []).append(slug)
+        for row in chunk:
+            row['genres'] = genres.get(row['id'], [])
+        yield chunk
+
+
+def _reviews(updated_since, chunk_size):
+    Review = apps.get_model('reviews', 'Review')
+    queryset = Review.objects.order_by('pk')
+    if updated_since is not None:
+        queryset = queryset.filter(updated_at__gte=updated_since)
+    rows = queryset.values(
+        'id', 'game__slug', 'author__username', 'rating', 'content', 'pros', 'cons', 'created_at', 'updated_at',
+    ).iterator(chunk_size=chunk_size)
+    while chunk := list(itertools.islice(rows, chunk_size)):
+        for row in chunk:
+            row['game'] = row.pop('game__slug')
+            row['author'] = row.pop('author__username')
+        yield chunk
+
+
+# Набор данных -> (генератор пачек строк, колонки CSV)
+DATASETS = {
+    'games': (_games, [
+        'id', 'slug', 'title', 'developer', 'publisher', 'release_date', 'platforms', 'description',
+        'cover', 'trailer_url', 'genres', 'rating', 'rating_count', 'created_at', 'updated_at',
+    ]),
+    'reviews': (_reviews, ['id', 'game', 'author', 'rating', 'content', 'pros', 'cons', 'created_at', 'updated_at']),
+}
+
+
+def parse_since(value):
+    """ISO-дата или дата-время -> aware datetime. ValueError, если не разобрать"""
+    moment = parse_datetime(value)
+    if moment is None:
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(f'Некорректная дата: {value}')
+        moment = datetime.datetime.combine(day, datetime.time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class _Line:
+    """Файлоподобный объект для csv.writer: просто возвращает записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def _ndjson(chunks, columns):
+    for chunk in chunks:
+        yield ''.join(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n' for row in chunk).encode()
+
+
+def _csv(chunks, columns):
+    writer = csv.writer(_Line())
+    yield writer.writerow(columns).encode()
+    for chunk in chunks:
+        lines = []
+        for row in chunk:
+            values = []
+            for column in columns:
+                value = row[column]
+                if isinstance(value, list):
+                    value = GENRE_SEPARATOR.join(value)
+                elif hasattr(value, 'isoformat'):
+                    value = value.isoformat()
+                values.append(value)
+            lines.append(writer.writerow(values))
+        yield ''.join(lines).encode()
+
+
+def gzip_stream(chunks, level=GZIP_LEVEL):
+    """Сжимает поток байтов в gzip по мере чтения"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for data in chunks:
+        compressed = compressor.compress(data)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+async def aiterate(chunks):
+    """Асинхронный итератор поверх потока байтов: каждая пачка читается в потоке sync_to_async"""
+    chunks = iter(chunks)
+    read = sync_to_async(next)
+    try:
+        while (chunk := await read(chunks, None)) is not None:
+            yield chunk
+    finally:
+        # Клиент мог отключиться посреди выгрузки - закрываем генератор и его курсор в том же потоке
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close)()
+
+
+def stream(dataset, fmt='ndjson', updated_since=None, compress=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Генератор байтов выгрузки. KeyError - неизвестный набор данных или формат"""
+    rows, columns = DATASETS[dataset]
+    writer = {'ndjson': _ndjson, 'csv': _csv}[fmt]
+    result = writer(rows(updated_since, chunk_size), columns)
+    return gzip_stream(result) if compress else result
@@ -0,0 +1,165 @@
+"""
+Производные изображения: уменьшенные копии загрузок в WebP и JPEG.
+
+Для каждого зарегистрированного ImageField после сохранения с новым файлом
+задача Celery строит копии фиксированной ширины (IMAGE_DERIVATIVE_WIDTHS). Имя копии содержит хэш
+содержимого исходника, поэтому файл никогда не меняется под тем же URL и его
+можно кэшировать навсегда. Если копий еще нет (старые загрузки, другой
+сервер), они строятся при первом запросе и остаются на диске.
+Описание копий (манифест) кэшируется по имени исходного файла.
+"""
+import hashlib
+from io import BytesIO
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models.signals import post_save
+from PIL import Image, ImageOps
+
+DEFAULT_WIDTHS = (160, 320, 640, 1280)
+DEFAULT_QUALITY = 80
+DERIVATIVES_DIR = 'derivatives'
+MANIFEST_TIMEOUT = 60 * 60 * 24 * 30
+
+# Формат -> (имя формата Pillow, расширение, MIME-тип)
+FORMATS = {
+    'webp': ('WEBP', 'webp', 'image/webp'),
+    'jpeg': ('JPEG', 'jpg', 'image/jpeg'),
+}
+
+# label модели -> имена полей изображений
+_registry = {}
+
+
+def register(model, *fields):
+    """Подключает поля изображений модели к построению копий (вызывается из AppConfig.ready)"""
+    _registry[model._meta.label_lower] = fields
+    post_save.connect(_generate_on_save, sender=model, dispatch_uid=f'images_{model._meta.label_lower}')
+
+
+def widths():
+    return tuple(getattr(settings, 'IMAGE_DERIVATIVE_WIDTHS', DEFAULT_WIDTHS))
+
+
+def quality():
+    return getattr(settings, 'IMAGE_DERIVATIVE_QUALITY', DEFAULT_QUALITY)
+
+
+def _manifest_key(name):
+    return 'image:' + hashlib.md5(name.encode()).hexdigest()
+
+
+def derivative_name(digest, width, fmt):
+    return f'{DERIVATIVES_DIR}/{digest[:2]}/{digest}-{width}w.{FORMATS[fmt][1]}'
+
+
+def _target_widths(original_width):
+    # Не увеличиваем: самая широкая копия - в исходную ширину
+    targets = [width for width in widths() if width < original_width]
+    if original_width <= max(widths()):
+        targets.append(original_width)
+    return targets or [max(widths())]
+
+
+def _encode(image, fmt):
+    pillow_format = FORMATS[fmt][0]
+    if pillow_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    buffer = BytesIO()
+    image.save(buffer, pillow_format, quality=quality(), optimize=True)
+    return buffer.getvalue()
+
+
+def build(name, storage=default_storage):
+    """Строит недостающие копии исходного файла name. Возвращает манифест"""
+    with storage.open(name, 'rb') as source:
+        data = source.read()
+    digest = hashlib.sha256(data).hexdigest()[:20]
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+        original_width = image.width
+        variants = {fmt: [] for fmt in FORMATS}
+        for width in _target_widths(original_width):
+            resized = None
+            for fmt in FORMATS:
+                target = derivative_name(digest, width, fmt)
+                if not storage.exists(target):
+                    if resized is None:
+                        height = max(1, round(image.height * width / original_width))
+                        resized = image if width == original_width else image.resize(
+                            (width, height), Image.Resampling.LANCZOS
+                        )
+                    storage.save(target, ContentFile(_encode(resized, fmt)))
+                variants[fmt].append((width, target))
+    return {'digest': digest, 'width': original_width, 'variants': variants}
+
+
+def get_manifest(field_file):
+    """Манифест копий изображения: из кэша или с построением недостающих файлов"""
+    if not field_file:
+        return None
+    key = _manifest_key(field_file.name)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            manifest = build(field_file.name, field_file.storage)
+        except (OSError, Image.DecompressionBombError):
+            # Исходника нет или это не изображение - отдаем оригинал как есть
+            return None
+        cache.set(key, manifest, MANIFEST_TIMEOUT)
+    return manifest
+
+
+def srcset(field_file, fmt='jpeg', manifest=None):
+    """Значение атрибута srcset: "url 320w, url 640w, ..." (манифест можно передать уже загруженным)"""
+    manifest = manifest or get_manifest(field_file)
+    if manifest is None:
+        return ''
+    storage = field_file.storage
+    return ', '.join(f'{storage.url(name)} {width}w' for width, name in manifest['variants'][fmt])
+
+
+def rebuild(batch_size=1000):
+    """Строит недостающие копии для всех загрузок. Возвращает число обработанных файлов"""
+    total = 0
+    for label, fields in _registry.items():
+        queryset = apps.get_model(label)._default_manager.only('pk', *fields)
+        for obj in queryset.iterator(chunk_size=batch_size):
+            for field in fields:
+                if get_manifest(getattr(obj, field)) is not None:
+                    total += 1
+    return total
+
+
+def build_for(label, pk, fields):
+    """Копии изображений объекта (для задачи Celery): объект перечитывается, его могли изменить"""
+    obj = apps.get_model(label)._default_manager.filter(pk=pk).only('pk', *fields).first()
+    if obj is not None:
+        for field in fields:
+            get_manifest(getattr(obj, field))
+
+
+def _generate_on_save(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    label = sender._meta.label_lower
+    fields = _registry[label]
+    if update_fields is not None:
+        # Например, save(update_fields=['last_login']) - изображения не менялись
+        fields = [field for field in fields if field in update_fields]
+    files = {field: getattr(instance, field) for field in fields}
+    files = {field: field_file for field, field_file in files.items() if field_file}
+    # Манифест в кэше - копии этого файла уже построены, файл не менялся
+    known = cache.get_many([_manifest_key(field_file.name) for field_file in files.values()])
+    fields = [field for field, field_file in files.items() if _manifest_key(field_file.name) not in known]
+    if fields:
+        from .tasks import build_image_derivatives
+
+        pk = instance.pk
+        transaction.on_commit(lambda: build_image_derivatives.delay(label, pk, fields))
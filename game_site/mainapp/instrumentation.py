@@ -0,0 +1,63 @@
+"""
+Учет SQL-запросов в пределах одного запроса к сайту.
+
+QueryRecorder подключается через connection.execute_wrapper ко всем базам
+и считает запросы, суммарное время и "отпечатки" - SQL без конкретных
+значений. Один и тот же отпечаток много раз подряд - признак N+1
+(например, __str__ обзора, который достает game и author на каждой строке).
+"""
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from django.db import connections
+
+_string_re = re.compile(r"'(?:[^']|'')*'")
+_number_re = re.compile(r'\b\d+(?:\.\d+)?\b')
+_in_list_re = re.compile(r'\bIN \((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+_space_re = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL без литералов и с любым IN (...) одинаковым: запросы, отличающиеся только значениями, совпадают"""
+    sql = _string_re.sub('?', sql)
+    sql = _number_re.sub('?', sql)
+    sql = sql.replace('%s', '?')
+    sql = _in_list_re.sub('IN (...)', sql)
+    return _space_re.sub(' ', sql).strip()
+
+
+def is_service_statement(sql):
+    return sql.lstrip().upper().startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT'))
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+        self._stack = None
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not is_service_statement(sql):
+                self.duration += time.perf_counter() - start
+                self.count += 1
+                self.fingerprints[fingerprint(sql)] += 1
+
+    def __enter__(self):
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stack.close()
+
+    def duplicates(self, threshold=2):
+        """[(отпечаток, сколько раз)] для повторяющихся запросов, самые частые первыми"""
+        return [(sql, n) for sql, n in self.fingerprints.most_common() if n >= threshold]
@@ -0,0 +1,115 @@
+import os
+import random
+import sqlite3
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from mainapp import db
+
+
+def _setup(path, rows):
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE item (id INTEGER PRIMARY KEY, title TEXT NOT NULL, views INTEGER NOT NULL)')
+    connection.executemany(
+        'INSERT INTO item (id, title, views) VALUES (?, ?, 0)', ((i, f'item {i}' * 5) for i in range(1, rows + 1))
+    )
+    connection.commit()
+    connection.close()
+
+
+class Profile:
+    """Как открываются соединения и какие у них настройки"""
+
+    def __init__(self, name, persistent, pragmas):
+        self.name = name
+        self.persistent = persistent
+        self.pragmas = pragmas
+
+    def connect(self, path):
+        # isolation_level=None - транзакциями управляем сами, как Django в autocommit
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        if self.pragmas:
+            db.apply_pragmas(connection.cursor(), self.pragmas)
+        return connection
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность SQLite на чтение и запись под конкурентной нагрузкой: '
+        'настройки по умолчанию с соединением на каждый запрос против WAL, PRAGMA из SQLITE_PRAGMAS '
+        'и постоянных соединений'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--duration', type=float, default=5.0, help='секунд на профиль')
+        parser.add_argument('--write-ratio', type=float, default=0.2)
+        parser.add_argument('--rows', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        profiles = [
+            Profile('по умолчанию', persistent=False, pragmas=None),
+            Profile('WAL + PRAGMA + CONN_MAX_AGE', persistent=True, pragmas=db.pragmas()),
+        ]
+        results = []
+        with tempfile.TemporaryDirectory() as directory:
+            for index, profile in enumerate(profiles):
+                path = os.path.join(directory, f'bench{index}.sqlite3')
+                _setup(path, options['rows'])
+                results.append(self.run(profile, path, options))
+
+        self.stdout.write(f"{'профиль':<30}{'чтений/с':>12}{'записей/с':>12}{'ошибок':>10}")
+        for profile, (reads, writes, errors) in zip(profiles, results):
+            self.stdout.write(f'{profile.name:<30}{reads:>12.0f}{writes:>12.0f}{errors:>10}')
+        (base_reads, base_writes, _), (reads, writes, _) = results
+        self.stdout.write(self.style.SUCCESS(
+            f'Ускорение: чтение x{reads / max(base_reads, 1):.1f}, запись x{writes / max(base_writes, 1):.1f}'
+        ))
+
+    def run(self, profile, path, options):
+        counts = {'reads': 0, 'writes': 0, 'errors': 0}
+        lock = threading.Lock()
+        deadline = time.monotonic() + options['duration']
+        rows, write_ratio = options['rows'], options['write_ratio']
+
+        def worker(seed):
+            rng = random.Random(seed)
+            reads = writes = errors = 0
+            connection = profile.connect(path) if profile.persistent else None
+            while time.monotonic() < deadline:
+                # Без постоянных соединений каждый "запрос" открывает БД заново
+                current = connection or profile.connect(path)
+                try:
+                    if rng.random() < write_ratio:
+                        current.execute('BEGIN IMMEDIATE')
+                        current.execute('UPDATE item SET views = views + 1 WHERE id = ?', (rng.randint(1, rows),))
+                        current.execute('COMMIT')
+                        writes += 1
+                    else:
+                        current.execute('SELECT title, views FROM item WHERE id = ?', (rng.randint(1, rows),))
+                        current.execute('SELECT id, title FROM item ORDER BY id DESC LIMIT 20').fetchall()
+                        reads += 1
+                except sqlite3.OperationalError:
+                    errors += 1
+                    if current.in_transaction:
+                        current.execute('ROLLBACK')
+                finally:
+                    if current is not connection:
+                        current.close()
+            if connection is not None:
+                connection.close()
+            with lock:
+                counts['reads'] += reads
+                counts['writes'] += writes
+                counts['errors'] += errors
+
+        threads = [threading.Thread(target=worker, args=(seed,)) for seed in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        duration = options['duration']
+        return counts['reads'] / duration, counts['writes'] / duration, counts['errors']
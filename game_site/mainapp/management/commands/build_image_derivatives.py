@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mainapp import images
+
+
+class Command(BaseCommand):
+    help = 'Строит недостающие копии изображений (WebP/JPEG фиксированной ширины) для всех загрузок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = images.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {total}'))
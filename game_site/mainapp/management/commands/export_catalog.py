@@ -0,0 +1,40 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp import export
+
+
+class Command(BaseCommand):
+    help = 'Потоковая выгрузка игр с жанрами или обзоров в NDJSON/CSV, при необходимости сжатая gzip'
+
+    def add_arguments(self, parser):
+        parser.add_argument('dataset', choices=sorted(export.DATASETS))
+        parser.add_argument('--format', choices=sorted(export.FORMATS), default='ndjson')
+        parser.add_argument('--output', '-o', default='-', help='файл; "-" - стандартный вывод')
+        parser.add_argument('--gzip', action='store_true')
+        parser.add_argument('--updated-since', help='ISO-дата или дата-время: только измененное с этого момента')
+        parser.add_argument('--chunk-size', type=int, default=export.DEFAULT_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        updated_since = None
+        if options['updated_since']:
+            try:
+                updated_since = export.parse_since(options['updated_since'])
+            except ValueError as error:
+                raise CommandError(error)
+        chunks = export.stream(
+            options['dataset'], options['format'], updated_since, options['gzip'], options['chunk_size']
+        )
+        if options['output'] == '-':
+            output = getattr(self.stdout, 'buffer', None) or sys.stdout.buffer
+            for data in chunks:
+                output.write(data)
+            output.flush()
+            return
+        size = 0
+        with open(options['output'], 'wb') as file:
+            for data in chunks:
+                file.write(data)
+                size += len(data)
+        self.stdout.write(self.style.SUCCESS(f'Записано {size} байт в {options["output"]}'))
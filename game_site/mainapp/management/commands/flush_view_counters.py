@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from mainapp import counters
+
+
+class Command(BaseCommand):
+    help = 'Принудительно сбрасывает накопленные счетчики просмотров в БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--stats', action='store_true',
+            help='Только показать количество несброшенных инкрементов'
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Ожидают записи: {counters.pending()}')
+        if options['stats']:
+            return
+        flushed = counters.flush()
+        for label, count in flushed.items():
+            self.stdout.write(f'{label}: +{count}')
+        self.stdout.write(self.style.SUCCESS(f'Записано просмотров: {sum(flushed.values())}'))
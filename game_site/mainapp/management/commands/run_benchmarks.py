@@ -0,0 +1,75 @@
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp import benchmark
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон всех страниц из urls.py: пропускная способность, p50/p95/p99 задержки '
+        'и число SQL-запросов, сравнение с базовой линией (--baseline). По умолчанию - в этом процессе, '
+        'с --url - по HTTP к запущенному серверу'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', help='адрес запущенного сервера, например http://127.0.0.1:8000')
+        parser.add_argument('--requests', type=int, default=100, help='запросов на каждый маршрут')
+        parser.add_argument('--concurrency', type=int, default=4)
+        parser.add_argument('--only', nargs='*', help='только маршруты с этими префиксами, например /api /games')
+        parser.add_argument('--user', help='username, от имени которого идут запросы (только в процессе)')
+        # Базовая линия зависит от машины, поэтому в репозиторий не кладется и по умолчанию не ищется
+        parser.add_argument('--baseline', help='JSON базовой линии: сравнить с ней (или сохранить с --save-baseline)')
+        parser.add_argument('--save-baseline', action='store_true', help='сохранить результат как базовую линию')
+        parser.add_argument('--threshold', type=float, default=0.2, help='допустимое ухудшение, доля')
+
+    def handle(self, *args, **options):
+        if options['save_baseline'] and not options['baseline']:
+            raise CommandError('--save-baseline требует --baseline')
+        if options['url']:
+            if options['user']:
+                raise CommandError('--user работает только без --url')
+            transport = benchmark.HTTPTransport(options['url'])
+        else:
+            user = None
+            if options['user']:
+                try:
+                    user = get_user_model().objects.get(username=options['user'])
+                except get_user_model().DoesNotExist:
+                    raise CommandError(f'Пользователь {options["user"]} не найден')
+            transport = benchmark.InProcessTransport(user)
+
+        targets = benchmark.targets(options['only'])
+        if not targets:
+            raise CommandError('Нет маршрутов для прогона - заполните БД (seed_benchmark_data)')
+        report = benchmark.run(transport, targets, options['requests'], options['concurrency'])
+        self.print_report(report)
+
+        if not options['baseline']:
+            return
+        path = Path(options['baseline'])
+        if options['save_baseline']:
+            benchmark.save_baseline(path, report)
+            self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена: {path}'))
+            return
+        baseline = benchmark.load_baseline(path)
+        if baseline is None:
+            raise CommandError(f'Базовой линии {path} нет - сохраните ее с --save-baseline')
+        regressions = benchmark.compare(report, baseline, options['threshold'])
+        for name, metric, before, after in regressions:
+            self.stdout.write(self.style.ERROR(f'{name}: {metric} {before} -> {after}'))
+        if regressions:
+            raise CommandError(f'Регрессий относительно базовой линии: {len(regressions)}')
+        self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"{'маршрут':<32}{'rps':>9}{'p50, мс':>10}{'p95, мс':>10}{'p99, мс':>10}{'SQL':>6}{'5xx':>6}"
+        )
+        for name, row in report.items():
+            queries = '-' if row['queries'] is None else f"{row['queries']:g}"
+            self.stdout.write(
+                f"{name:<32}{row['rps']:>9}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+                f"{queries:>6}{row['errors']:>6}"
+            )
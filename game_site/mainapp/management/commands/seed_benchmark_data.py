@@ -0,0 +1,193 @@
+import datetime
+import itertools
+import random
+from io import StringIO
+
+from django.apps import apps
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+
+# Количество строк при --scale 1
+VOLUMES = {
+    'users': 50_000,
+    'genres': 40,
+    'games': 100_000,
+    'reviews': 1_000_000,
+    'news': 200_000,
+    'guides': 200_000,
+    'topics': 50_000,
+    'posts': 2_000_000,
+    'notifications': 2_000_000,
+    'friends_per_user': 20,
+}
+
+WORDS = (
+    'игра мир герой квест босс уровень оружие броня магия дракон замок лес город космос корабль '
+    'битва стратегия тактика гонка арена турнир секрет сюжет финал обновление патч сезон режим'
+).split()
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет БД синтетическими данными для нагрузочных тестов: игры, обзоры, новости, гайды, '
+        'форум, уведомления и граф друзей. Вставка пачками bulk_create, каждая пачка - отдельная '
+        'транзакция; затем пересчет денормализованных счетчиков штатными командами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', type=float, default=0.1,
+                            help='множитель объемов (1 - миллионы строк обзоров, постов и уведомлений)')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--prefix', default='bench', help='префикс slug и имен, чтобы не пересекаться с данными')
+        parser.add_argument('--search-index', action='store_true', help='перестроить и поисковый индекс (долго)')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.prefix = options['prefix']
+        volumes = {
+            name: max(1, int(count * options['scale'])) if name != 'friends_per_user' else count
+            for name, count in VOLUMES.items()
+        }
+        Game = apps.get_model('games', 'Game')
+        if Game.objects.filter(slug__startswith=f'{self.prefix}-').exists():
+            raise CommandError(f'Данные с префиксом "{self.prefix}" уже есть - задайте другой --prefix')
+
+        # Без общей транзакции: миллионы строк в одной транзакции раздули бы WAL и держали
+        # блокировку записи все время заполнения. Каждая пачка bulk_create коммитится сама
+        users, profiles = self.seed_users(volumes['users'])
+        games = self.seed_games(volumes['games'], volumes['genres'])
+        self.seed_content(users, games, volumes)
+        self.seed_forum(users, volumes['topics'], volumes['posts'])
+        self.seed_notifications(users, volumes['notifications'])
+        self.seed_friends(profiles, volumes['friends_per_user'])
+
+        # bulk_create не шлет сигналов - пересчитываем денормализованные данные целиком
+        repairs = [
+            'recompute_ratings', 'rebuild_facet_counts', 'recount_topics', 'recount_notifications',
+            'recompute_user_ratings',
+        ]
+        if options['search_index']:
+            repairs.append('rebuild_search_index')
+        for command in repairs:
+            call_command(command, stdout=StringIO())
+        self.stdout.write(self.style.SUCCESS(
+            'Создано: ' + ', '.join(f'{name}={count}' for name, count in volumes.items())
+        ))
+
+    def text(self, words):
+        return ' '.join(self.rng.choices(WORDS, k=words))
+
+    def bulk(self, model, rows):
+        """bulk_create из генератора пачками, без накопления всех объектов в памяти"""
+        total = 0
+        rows = iter(rows)
+        while batch := list(itertools.islice(rows, self.batch_size)):
+            model.objects.bulk_create(batch, batch_size=self.batch_size)
+            total += len(batch)
+        self.stdout.write(f'  {model._meta.label}: {total}')
+        return total
+
+    def ids(self, model, **filters):
+        return list(model.objects.filter(**filters).values_list('pk', flat=True))
+
+    def seed_users(self, count):
+        User = apps.get_model('userapp', 'User')
+        Profile = apps.get_model('userapp', 'Profile')
+        # Один хэш на всех: PBKDF2 на каждого пользователя занял бы минуты
+        password = make_password('benchmark')
+        self.bulk(User, (
+            User(email=f'{self.prefix}{i}@example.com', username=f'{self.prefix}{i}', password=password,
+                 bio=self.text(10))
+            for i in range(count)
+        ))
+        users = self.ids(User, email__startswith=self.prefix, email__endswith='@example.com')
+        # Профиль обычно создает сигнал post_save, которого у bulk_create нет
+        self.bulk(Profile, (Profile(user_id=user_id) for user_id in users))
+        profiles = self.ids(Profile, user__email__startswith=self.prefix, user__email__endswith='@example.com')
+        return users, profiles
+
+    def seed_games(self, count, genre_count):
+        Game = apps.get_model('games', 'Game')
+        Genre = apps.get_model('games', 'Genre')
+        self.bulk(Genre, (Genre(name=f'Жанр {i}', slug=f'{self.prefix}-genre-{i}') for i in range(genre_count)))
+        genres = self.ids(Genre, slug__startswith=f'{self.prefix}-genre-')
+        platforms = [value for value, _ in Game.PLATFORM_CHOICES]
+        start = datetime.date(2000, 1, 1)
+        self.bulk(Game, (
+            Game(title=f'{self.text(2).title()} {i}', slug=f'{self.prefix}-game-{i}', developer=self.text(1),
+                 release_date=start + datetime.timedelta(days=self.rng.randrange(9000)),
+                 platforms=self.rng.choice(platforms), description=self.text(80),
+                 cover='game_covers/benchmark.jpg')
+            for i in range(count)
+        ))
+        games = self.ids(Game, slug__startswith=f'{self.prefix}-game-')
+        through = Game.genres.through
+        self.bulk(through, (
+            through(game_id=game_id, genre_id=genre_id)
+            for game_id in games
+            for genre_id in self.rng.sample(genres, k=min(len(genres), self.rng.randint(1, 3)))
+        ))
+        return games
+
+    def pick(self, ids):
+        # Популярность по степенному закону: немногие игры и авторы собирают большую часть записей
+        return ids[min(len(ids) - 1, int(self.rng.paretovariate(1.2)) - 1)] if self.rng.random() < 0.5 \
+            else self.rng.choice(ids)
+
+    def seed_content(self, users, games, volumes):
+        Review = apps.get_model('reviews', 'Review')
+        News = apps.get_model('news', 'News')
+        Guide = apps.get_model('guides', 'Guide')
+        self.bulk(Review, (
+            Review(game_id=self.pick(games), author_id=self.pick(users), content=self.text(120),
+                   rating=self.rng.randint(1, 10), pros=self.text(10), cons=self.text(10))
+            for _ in range(volumes['reviews'])
+        ))
+        self.bulk(News, (
+            News(title=self.text(6), slug=f'{self.prefix}-news-{i}', content=self.text(150),
+                 author_id=self.pick(users), game_id=self.pick(games) if self.rng.random() < 0.7 else None,
+                 image='news_images/benchmark.jpg')
+            for i in range(volumes['news'])
+        ))
+        difficulties = [value for value, _ in Guide.DIFFICULTY_CHOICES]
+        self.bulk(Guide, (
+            Guide(title=self.text(5), slug=f'{self.prefix}-guide-{i}', game_id=self.pick(games),
+                  author_id=self.pick(users), content=self.text(300), difficulty=self.rng.choice(difficulties),
+                  featured_image='guide_images/benchmark.jpg')
+            for i in range(volumes['guides'])
+        ))
+
+    def seed_forum(self, users, topic_count, post_count):
+        ForumTopic = apps.get_model('community', 'ForumTopic')
+        ForumPost = apps.get_model('community', 'ForumPost')
+        self.bulk(ForumTopic, (
+            ForumTopic(title=self.text(6), slug=f'{self.prefix}-topic-{i}', author_id=self.pick(users))
+            for i in range(topic_count)
+        ))
+        topics = self.ids(ForumTopic, slug__startswith=f'{self.prefix}-topic-')
+        self.bulk(ForumPost, (
+            ForumPost(topic_id=self.pick(topics), author_id=self.pick(users), content=self.text(60))
+            for _ in range(post_count)
+        ))
+
+    def seed_notifications(self, users, count):
+        Notification = apps.get_model('userapp', 'Notification')
+        self.bulk(Notification, (
+            Notification(user_id=self.pick(users), message=self.text(8), is_read=self.rng.random() < 0.7)
+            for _ in range(count)
+        ))
+
+    def seed_friends(self, profiles, per_user):
+        FriendUser = apps.get_model('userapp', 'FriendUser')
+
+        def edges():
+            for profile_id in profiles:
+                friends = {self.pick(profiles) for _ in range(self.rng.randint(0, per_user * 2))}
+                friends.discard(profile_id)
+                for friend_id in friends:
+                    yield FriendUser(user_id=profile_id, friend_id=friend_id)
+
+        self.bulk(FriendUser, edges())
@@ -0,0 +1,75 @@
+import json
+import logging
+
+from django.conf import settings
+
+from . import instrumentation, routers
+
+PRIMARY_COOKIE = 'db_primary'
+
+sql_logger = logging.getLogger('game_site.sql')
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Держит запрос на основной базе, если он изменяет данные (не GET/HEAD/OPTIONS)
+    или если тот же клиент недавно писал - пока реплики не догнали его изменения.
+    """
+    SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        sticky = PRIMARY_COOKIE in request.COOKIES or request.method not in self.SAFE_METHODS
+        pinned = routers._pinned.set(sticky)
+        wrote = routers._wrote.set(False)
+        try:
+            response = self.get_response(request)
+            if routers._wrote.get() and routers.replicas():
+                response.set_cookie(
+                    PRIMARY_COOKIE, '1', max_age=getattr(settings, 'PRIMARY_STICKY_SECONDS', 15),
+                    httponly=True, samesite='Lax',
+                )
+            return response
+        finally:
+            routers._wrote.reset(wrote)
+            routers._pinned.reset(pinned)
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Считает SQL-запросы каждого запроса к сайту. Отдает итог в заголовках
+    X-DB-Query-Count, X-DB-Query-Time (мс), X-DB-Duplicate-Queries и Server-Timing
+    и пишет JSON-строку в лог game_site.sql (WARNING, если похоже на N+1).
+    Включается настройкой SQL_INSTRUMENTATION.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = getattr(settings, 'SQL_INSTRUMENTATION', settings.DEBUG)
+        self.threshold = getattr(settings, 'SQL_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if not self.enabled:
+            return self.get_response(request)
+        with instrumentation.QueryRecorder() as recorder:
+            response = self.get_response(request)
+        duplicates = recorder.duplicates(self.threshold)
+        duration_ms = recorder.duration * 1000
+        response['X-DB-Query-Count'] = str(recorder.count)
+        response['X-DB-Query-Time'] = f'{duration_ms:.1f}'
+        response['X-DB-Duplicate-Queries'] = str(sum(n for _, n in duplicates))
+        response['Server-Timing'] = f'db;dur={duration_ms:.1f};desc="{recorder.count} queries"'
+        sql_logger.log(
+            logging.WARNING if duplicates else logging.INFO,
+            json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'queries': recorder.count,
+                'db_time_ms': round(duration_ms, 1),
+                'duplicates': [{'sql': sql, 'count': n} for sql, n in duplicates],
+            }, ensure_ascii=False),
+        )
+        return response
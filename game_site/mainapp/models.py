@@ -1,3 +1,23 @@
 from django.db import models
 
 # Create your models here.
+
+
+class SearchTerm(models.Model):
+    """
+    Инвертированный индекс для полнотекстового поиска на СУБД без FTS5.
+    Одна строка - один термин одного документа (игры, гайда или новости).
+    """
+    term = models.CharField(max_length=64, verbose_name="Термин")
+    kind = models.PositiveSmallIntegerField(verbose_name="Тип документа")
+    object_id = models.BigIntegerField(verbose_name="ID документа")
+    weight = models.PositiveIntegerField(default=1, verbose_name="Вес")
+
+    class Meta:
+        verbose_name = "Поисковый термин"
+        verbose_name_plural = "Поисковые термины"
+        indexes = [
+            # Префиксный поиск - диапазонный запрос по B-tree индексу term
+            models.Index(fields=['term', 'kind']),
+            models.Index(fields=['kind', 'object_id']),
+        ]
@@ -0,0 +1,208 @@
+"""
+Keyset (cursor) пагинация для списков.
+
+Вместо OFFSET страница ищется по значениям полей сортировки последней
+записи предыдущей страницы, поэтому глубокие страницы не замедляются.
+Общее количество считается только по запросу: точно, приблизительно или никак.
+"""
+import base64
+import datetime
+import hashlib
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import connections
+from django.db.models import Q
+from django.http import Http404
+
+COUNT_EXACT = 'exact'
+COUNT_ESTIMATE = 'estimate'
+COUNT_NONE = 'none'
+
+ESTIMATE_CACHE_TIMEOUT = 60 * 5
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return datetime.date.fromisoformat(value['d'])
+        raise InvalidCursor('Неизвестный тип значения в курсоре')
+    return value
+
+
+def encode_cursor(values, reverse=False):
+    payload = {'v': [_encode_value(value) for value in values], 'r': int(reverse)}
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        return [_decode_value(value) for value in payload['v']], bool(payload['r'])
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidCursor('Некорректный курсор') from exc
+
+
+def estimate_count(queryset):
+    """
+    Приблизительное количество строк: оценка планировщика на PostgreSQL,
+    на остальных СУБД - точный COUNT, закэшированный на несколько минут.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    sql, params = queryset.order_by().query.sql_with_params()
+    key = 'estimate_count:' + hashlib.md5(f'{sql}{params!r}'.encode()).hexdigest()
+    count = cache.get(key)
+    if count is None:
+        count = queryset.order_by().count()
+        cache.set(key, count, ESTIMATE_CACHE_TIMEOUT)
+    return count
+
+
+class CursorPage:
+    """Страница keyset-пагинации (аналог django.core.paginator.Page)"""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class CursorPaginator:
+    """
+    Пагинатор по курсору. ordering - поля сортировки вида ['-created_at', '-pk'];
+    последнее поле должно быть уникальным (обычно pk), чтобы порядок был однозначным.
+    """
+
+    def __init__(self, queryset, per_page, ordering, count_mode=COUNT_NONE):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = list(ordering)
+        self.count_mode = count_mode
+
+    @property
+    def count(self):
+        if self.count_mode == COUNT_EXACT:
+            return self.queryset.order_by().count()
+        if self.count_mode == COUNT_ESTIMATE:
+            return estimate_count(self.queryset)
+        return None
+
+    @staticmethod
+    def _field(item):
+        return item.lstrip('-')
+
+    def _seek(self, values, reverse):
+        """Условие "строго после values" в порядке сортировки (или строго до при reverse)"""
+        condition = Q()
+        equal = Q()
+        for item, value in zip(self.ordering, values):
+            field = self._field(item)
+            descending = item.startswith('-') != reverse
+            lookup = 'lt' if descending else 'gt'
+            condition |= equal & Q(**{f'{field}__{lookup}': value})
+            equal &= Q(**{field: value})
+        return condition
+
+    def _values(self, obj):
+        return [getattr(obj, self._field(item)) for item in self.ordering]
+
+    def page(self, cursor=None):
+        values, reverse = decode_cursor(cursor) if cursor else (None, False)
+        if values is not None and len(values) != len(self.ordering):
+            raise InvalidCursor('Курсор не соответствует сортировке')
+
+        ordering = self.ordering
+        if reverse:
+            ordering = [item[1:] if item.startswith('-') else f'-{item}' for item in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if values is not None:
+            try:
+                queryset = queryset.filter(self._seek(values, reverse))
+            except (ValidationError, TypeError, ValueError) as exc:
+                # Курсор разобран, но значения не подходят к полям сортировки (например, строка вместо даты)
+                raise InvalidCursor('Курсор не соответствует сортировке') from exc
+        # Лишняя запись показывает, есть ли еще страница в этом направлении
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if reverse:
+            rows.reverse()
+
+        next_cursor = previous_cursor = None
+        if rows:
+            if has_more or reverse:
+                next_cursor = encode_cursor(self._values(rows[-1]))
+            if values is not None and (has_more or not reverse):
+                previous_cursor = encode_cursor(self._values(rows[0]), reverse=True)
+        return CursorPage(rows, self, next_cursor, previous_cursor)
+
+
+class CursorPaginationMixin:
+    """
+    Подключает keyset-пагинацию к ListView по запросу клиента: ?cursor=<курсор>
+    (пустой ?cursor= - первая страница). Без параметра работает обычная OFFSET-пагинация.
+    Режим подсчета задается ?count=exact|estimate|none.
+    """
+    cursor_ordering = ['-pk']
+    cursor_count_mode = COUNT_NONE
+
+    def use_cursor_pagination(self):
+        return 'cursor' in self.request.GET
+
+    def get_ordering(self):
+        if self.use_cursor_pagination():
+            return self.cursor_ordering
+        return super().get_ordering()
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.use_cursor_pagination():
+            return super().paginate_queryset(queryset, page_size)
+        count_mode = self.request.GET.get('count', self.cursor_count_mode)
+        if count_mode not in (COUNT_EXACT, COUNT_ESTIMATE, COUNT_NONE):
+            count_mode = self.cursor_count_mode
+        paginator = CursorPaginator(queryset, page_size, self.cursor_ordering, count_mode)
+        try:
+            page = paginator.page(self.request.GET.get('cursor') or None)
+        except InvalidCursor as exc:
+            raise Http404(str(exc))
+        return paginator, page, page.object_list, page.has_other_pages()
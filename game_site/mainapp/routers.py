@@ -0,0 +1,93 @@
+"""
+Маршрутизация запросов к БД между основной базой и репликами для чтения.
+
+Чтения уходят на случайную реплику из DATABASE_REPLICAS, записи - только
+в default. После первой записи (и внутри транзакций) контекст "прилипает"
+к основной базе, чтобы запрос видел свои же изменения; ReplicaRoutingMiddleware
+продлевает это на следующие PRIMARY_STICKY_SECONDS секунд через cookie,
+пока реплики догоняют основную базу. Без настроенных реплик все идет в default.
+Служебные записи (сброс счетчиков, internal_writes()) клиента не привязывают.
+
+Заполнение кэша под версионированным ключом читает из основной базы
+(use_primary()): отставшая реплика записала бы под новую версию старые данные,
+и они жили бы в кэше до следующего изменения.
+
+Таблица кэша в БД (DatabaseCache) живет в базе CACHE_DATABASE, если она настроена;
+обращения к ней не считаются записью и не привязывают клиента к основной базе.
+"""
+import contextlib
+import contextvars
+import random
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CACHE_APP_LABEL = 'django_cache'
+CACHE_DATABASE = 'cache'
+
+_pinned = contextvars.ContextVar('db_pinned_to_primary', default=False)
+_wrote = contextvars.ContextVar('db_wrote_to_primary', default=False)
+
+
+def replicas():
+    return [alias for alias in getattr(settings, 'DATABASE_REPLICAS', []) if alias in connections.settings]
+
+
+def is_pinned():
+    return _pinned.get()
+
+
+@contextlib.contextmanager
+def use_primary():
+    """Все чтения внутри блока - из основной базы"""
+    token = _pinned.set(True)
+    try:
+        yield
+    finally:
+        _pinned.reset(token)
+
+
+@contextlib.contextmanager
+def internal_writes():
+    """Записи внутри блока не привязывают текущего клиента к основной базе"""
+    pinned, wrote = _pinned.set(_pinned.get()), _wrote.set(_wrote.get())
+    try:
+        yield
+    finally:
+        _pinned.reset(pinned)
+        _wrote.reset(wrote)
+
+
+def _cache_database():
+    return CACHE_DATABASE if CACHE_DATABASE in connections.settings else DEFAULT_DB_ALIAS
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return _cache_database()
+        pool = replicas()
+        if not pool or _pinned.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return random.choice(pool)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return _cache_database()
+        _pinned.set(True)
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        pool = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in pool and obj2._state.db in pool:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == CACHE_APP_LABEL or db == CACHE_DATABASE:
+            return app_label == CACHE_APP_LABEL and db == _cache_database()
+        # Реплики - копии основной базы, схема приходит вместе с данными
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,280 @@
+"""
+Полнотекстовый поиск по играм, гайдам и новостям.
+
+На SQLite используется виртуальная таблица FTS5 (ранжирование bm25),
+на остальных СУБД - инвертированный индекс в модели SearchTerm.
+Индекс обновляется инкрементально сигналами post_save/post_delete.
+"""
+import abc
+import re
+from collections import Counter
+
+from django.apps import apps
+from django.db import connections, models
+from django.db.models.signals import post_delete, post_save
+
+FTS_TABLE = 'mainapp_search_fts'
+
+# Тип документа -> (код, модель, поля заголовка, поля текста)
+SEARCH_TYPES = {
+    'game': (1, 'games.Game', ['title'], ['description', 'developer']),
+    'guide': (2, 'guides.Guide', ['title'], ['content']),
+    'news': (3, 'news.News', ['title'], ['content']),
+}
+KIND_CODES = {kind: code for kind, (code, *_) in SEARCH_TYPES.items()}
+KIND_NAMES = {code: kind for kind, code in KIND_CODES.items()}
+
+TITLE_WEIGHT = 10
+MAX_TERM_LENGTH = 64
+
+_word_re = re.compile(r'\w+')
+
+
+def tokenize(text):
+    return [word[:MAX_TERM_LENGTH] for word in _word_re.findall(text.lower())]
+
+
+def document_for(kind, obj):
+    """Заголовок и текст документа для индексации"""
+    _, _, title_fields, body_fields = SEARCH_TYPES[kind]
+    title = ' '.join(str(getattr(obj, field) or '') for field in title_fields)
+    body = ' '.join(str(getattr(obj, field) or '') for field in body_fields)
+    return title, body
+
+
+class SearchPage:
+    """Страница результатов поиска: найденные объекты, общее число и фасеты по типам"""
+
+    def __init__(self, hits, total, facets):
+        self.hits = hits  # [(kind, obj, score)]
+        self.total = total
+        self.facets = facets
+
+
+class BaseSearchBackend(abc.ABC):
+    def __init__(self, using='default'):
+        self.using = using
+
+    @abc.abstractmethod
+    def index(self, kind, obj):
+        pass
+
+    @abc.abstractmethod
+    def remove(self, kind, pk):
+        pass
+
+    @abc.abstractmethod
+    def clear(self):
+        pass
+
+    @abc.abstractmethod
+    def match(self, terms, kinds, offset, limit):
+        """Возвращает ([(kind, pk, score)], {kind: count})"""
+
+    def search(self, query, kinds=None, offset=0, limit=20):
+        terms = list(dict.fromkeys(tokenize(query)))
+        kinds = [kind for kind in (kinds or SEARCH_TYPES) if kind in SEARCH_TYPES]
+        if not terms or not kinds:
+            return SearchPage([], 0, {})
+        matches, facets = self.match(terms, kinds, offset, limit)
+
+        # Гидратация пачкой: один запрос на тип документа
+        by_kind = {}
+        for kind, pk, _ in matches:
+            by_kind.setdefault(kind, []).append(pk)
+        objects = {
+            kind: apps.get_model(SEARCH_TYPES[kind][1])._default_manager.in_bulk(pks)
+            for kind, pks in by_kind.items()
+        }
+        hits = [
+            (kind, objects[kind][pk], score)
+            for kind, pk, score in matches
+            if pk in objects[kind]
+        ]
+        total = sum(count for kind, count in facets.items() if kind in kinds)
+        return SearchPage(hits, total, facets)
+
+
+class FTS5SearchBackend(BaseSearchBackend):
+    """
+    Индекс в виртуальной таблице FTS5. rowid кодирует тип и id документа,
+    поэтому обновление и удаление идут по первичному ключу, без сканирования.
+    """
+
+    @staticmethod
+    def rowid(kind, pk):
+        return pk * 4 + KIND_CODES[kind]
+
+    def create_table(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                "kind UNINDEXED, title, body, "
+                "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+            )
+
+    def index(self, kind, obj):
+        title, body = document_for(kind, obj)
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"INSERT OR REPLACE INTO {FTS_TABLE} (rowid, kind, title, body) VALUES (%s, %s, %s, %s)",
+                [self.rowid(kind, obj.pk), kind, title, body],
+            )
+
+    def remove(self, kind, pk):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [self.rowid(kind, pk)])
+
+    def clear(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+
+    def match(self, terms, kinds, offset, limit):
+        # Каждое слово - префиксный запрос, слова объединяются через AND
+        expression = ' '.join(f'"{term}"*' for term in terms)
+        placeholders = ', '.join(['%s'] * len(kinds))
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(
+                f"SELECT kind, COUNT(*) FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s GROUP BY kind",
+                [expression],
+            )
+            facets = dict(cursor.fetchall())
+            cursor.execute(
+                f"SELECT kind, rowid / 4, bm25({FTS_TABLE}, 0, {TITLE_WEIGHT}.0, 1.0) AS rank "
+                f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND kind IN ({placeholders}) "
+                "ORDER BY rank LIMIT %s OFFSET %s",
+                [expression, *kinds, limit, offset],
+            )
+            # bm25 отрицателен: чем меньше, тем релевантнее
+            matches = [(kind, pk, -rank) for kind, pk, rank in cursor.fetchall()]
+        return matches, facets
+
+
+class TermIndexSearchBackend(BaseSearchBackend):
+    """Переносимый инвертированный индекс на модели SearchTerm"""
+
+    @property
+    def terms(self):
+        return apps.get_model('mainapp', 'SearchTerm')._default_manager.using(self.using)
+
+    def index(self, kind, obj):
+        title, body = document_for(kind, obj)
+        weights = Counter()
+        for term in tokenize(title):
+            weights[term] += TITLE_WEIGHT
+        for term in tokenize(body):
+            weights[term] += 1
+        self.remove(kind, obj.pk)
+        model = self.terms.model
+        self.terms.bulk_create(
+            [model(term=term, kind=KIND_CODES[kind], object_id=obj.pk, weight=weight)
+             for term, weight in weights.items()],
+            batch_size=500,
+        )
+
+    def remove(self, kind, pk):
+        self.terms.filter(kind=KIND_CODES[kind], object_id=pk).delete()
+
+    def clear(self):
+        self.terms.all().delete()
+
+    def match(self, terms, kinds, offset, limit):
+        # Префикс как диапазон [term, term + U+FFFF) - работает по индексу на любой СУБД
+        prefix = [models.Q(term__gte=term, term__lt=term + '\uffff') for term in terms]
+        any_term = prefix[0]
+        for q in prefix[1:]:
+            any_term |= q
+        documents = (
+            self.terms.filter(any_term)
+            .values('kind', 'object_id')
+            .annotate(
+                score=models.Sum('weight'),
+                **{
+                    f'has_{i}': models.Max(models.Case(
+                        models.When(q, then=1), default=0, output_field=models.IntegerField()
+                    ))
+                    for i, q in enumerate(prefix)
+                },
+            )
+            .filter(**{f'has_{i}': 1 for i in range(len(prefix))})
+        )
+        # Фасеты считает СУБД поверх сгруппированных документов - в Python только итоги по типам
+        sql, params = documents.order_by().query.get_compiler(using=self.using).as_sql()
+        with connections[self.using].cursor() as cursor:
+            cursor.execute(f'SELECT kind, COUNT(*) FROM ({sql}) documents GROUP BY kind', params)
+            facets = {KIND_NAMES[code]: count for code, count in cursor.fetchall()}
+        codes = [KIND_CODES[kind] for kind in kinds]
+        page = documents.filter(kind__in=codes).order_by('-score', 'kind', 'object_id')[offset:offset + limit]
+        matches = [(KIND_NAMES[row['kind']], row['object_id'], row['score']) for row in page]
+        return matches, facets
+
+
+_backends = {}
+
+
+def get_backend(using='default'):
+    if using not in _backends:
+        connection = connections[using]
+        if connection.vendor == 'sqlite' and _has_fts5(connection):
+            _backends[using] = FTS5SearchBackend(using)
+        else:
+            _backends[using] = TermIndexSearchBackend(using)
+    return _backends[using]
+
+
+def _has_fts5(connection):
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA compile_options')
+        return any(row[0] == 'ENABLE_FTS5' for row in cursor.fetchall())
+
+
+def search(query, kinds=None, offset=0, limit=20):
+    return get_backend().search(query, kinds, offset, limit)
+
+
+def rebuild(batch_size=1000):
+    """Полностью перестраивает индекс. Возвращает число проиндексированных документов"""
+    backend = get_backend()
+    backend.clear()
+    total = 0
+    for kind, (_, label, title_fields, body_fields) in SEARCH_TYPES.items():
+        queryset = apps.get_model(label)._default_manager.only('pk', *title_fields, *body_fields)
+        for obj in queryset.iterator(chunk_size=batch_size):
+            backend.index(kind, obj)
+            total += 1
+    return total
+
+
+def _kind_for(sender):
+    label = sender._meta.label
+    for kind, (_, model_label, *_) in SEARCH_TYPES.items():
+        if model_label == label:
+            return kind
+
+
+def index_document(sender, instance, raw=False, update_fields=None, **kwargs):
+    if raw:
+        return
+    kind = _kind_for(sender)
+    _, _, title_fields, body_fields = SEARCH_TYPES[kind]
+    # Сохранение только служебных полей (рейтинг и т.п.) не требует переиндексации
+    if update_fields and not set(update_fields) & {*title_fields, *body_fields}:
+        return
+    get_backend().index(kind, instance)
+
+
+def remove_document(sender, instance, **kwargs):
+    get_backend().remove(_kind_for(sender), instance.pk)
+
+
+def create_fts_table(using='default', **kwargs):
+    backend = get_backend(using)
+    if isinstance(backend, FTS5SearchBackend):
+        backend.create_table()
+
+
+def connect_signals():
+    for _, label, *_ in SEARCH_TYPES.values():
+        model = apps.get_model(label)
+        post_save.connect(index_document, sender=model, dispatch_uid=f'search_index_{label}')
+        post_delete.connect(remove_document, sender=model, dispatch_uid=f'search_remove_{label}')
@@ -0,0 +1,145 @@
+"""
+Статика с хэшами в именах и заранее сжатыми копиями.
+
+collectstatic через CompressedManifestStaticFilesStorage пишет файлы с хэшем
+содержимого в имени (app.3f2a1b9c8d7e.css) и рядом - .gz и .br (brotli, если
+установлен пакет brotli). Обычно статику отдает веб-сервер; если его нет,
+serve() выбирает сжатую копию по Accept-Encoding и ставит хэшированным файлам
+Cache-Control на год - их содержимое под этим именем никогда не меняется.
+"""
+import functools
+import gzip
+import mimetypes
+import os
+import posixpath
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, staticfiles_storage
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.base import ContentFile
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_EXTENSIONS = (
+    '.css', '.js', '.mjs', '.map', '.json', '.svg', '.html', '.txt', '.xml', '.ico',
+    '.ttf', '.otf', '.eot', '.webmanifest',
+)
+MIN_COMPRESS_SIZE = 256
+# Сжатая копия сохраняется, только если заметно меньше оригинала
+MAX_COMPRESS_RATIO = 0.95
+
+IMMUTABLE_MAX_AGE = 60 * 60 * 24 * 365
+MUTABLE_MAX_AGE = 60 * 5
+
+# Content-Encoding -> расширение сжатой копии, в порядке предпочтения
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def compressors():
+    result = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        result.insert(0, ('.br', lambda data: brotli.compress(data, quality=11)))
+    return result
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage, который дополнительно пишет .gz и .br копии файлов"""
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as original:
+            data = original.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, compress in compressors():
+            compressed = compress(data)
+            target = name + suffix
+            if self.exists(target):
+                self.delete(target)
+            if len(compressed) <= len(data) * MAX_COMPRESS_RATIO:
+                self._save(target, ContentFile(compressed))
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, которые клиент готов принять (q > 0)"""
+    encodings = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if coding and quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+@functools.cache
+def _hashed_names(manifest_hash):
+    """Имена с хэшем из манифеста - считаются один раз на версию манифеста"""
+    return frozenset(staticfiles_storage.hashed_files.values())
+
+
+def is_hashed(path):
+    if not getattr(staticfiles_storage, 'hashed_files', None):
+        return False
+    return path in _hashed_names(staticfiles_storage.manifest_hash)
+
+
+def cache_headers(response, path):
+    """Заголовки кэширования - одинаковые для 200 и 304"""
+    response['Vary'] = 'Accept-Encoding'
+    if is_hashed(path):
+        response['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+    else:
+        response['Cache-Control'] = f'public, max-age={MUTABLE_MAX_AGE}'
+    return response
+
+
+def serve(request, path):
+    """Отдает файл из STATIC_ROOT, предпочитая заранее сжатую копию"""
+    path = posixpath.normpath(path).lstrip('/')
+    if path.endswith(tuple(suffix for _, suffix in ENCODINGS)):
+        raise Http404('Сжатые копии не отдаются напрямую')
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except SuspiciousFileOperation:
+        raise Http404('Файл не найден')
+    if not os.path.isfile(fullpath):
+        raise Http404('Файл не найден')
+
+    served, content_encoding = fullpath, None
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    for coding, suffix in ENCODINGS:
+        if coding in accepted and os.path.isfile(fullpath + suffix):
+            served, content_encoding = fullpath + suffix, coding
+            break
+
+    stat = os.stat(served)
+    if not was_modified_since(request.headers.get('If-Modified-Since'), stat.st_mtime):
+        return cache_headers(HttpResponseNotModified(), path)
+    content_type, _ = mimetypes.guess_type(fullpath)
+    response = FileResponse(open(served, 'rb'), content_type=content_type or 'application/octet-stream')
+    response.headers.pop('Content-Disposition', None)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    if content_encoding:
+        response['Content-Encoding'] = content_encoding
+    return cache_headers(response, path)
@@ -0,0 +1,13 @@
+from celery import shared_task
+
+from . import counters, images
+
+
+@shared_task
+def flush_view_counters():
+    return counters.flush()
+
+
+@shared_task
+def build_image_derivatives(label, pk, fields):
+    images.build_for(label, pk, fields)
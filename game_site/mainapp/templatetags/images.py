@@ -0,0 +1,33 @@
+from django import template
+from django.utils.html import format_html
+
+from mainapp import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def srcset(field_file, fmt='jpeg'):
+    """{% srcset game.cover %} -> "url 160w, url 320w, ..." """
+    return images.srcset(field_file, fmt)
+
+
+@register.simple_tag
+def picture(field_file, alt='', sizes='100vw', css_class=''):
+    """
+    <picture> с WebP и JPEG-копиями:
+    {% picture game.cover alt=game.title sizes="(min-width: 992px) 25vw, 50vw" %}
+    """
+    if not field_file:
+        return ''
+    manifest = images.get_manifest(field_file)
+    if manifest is None:
+        return format_html('<img src="{}" alt="{}" class="{}" loading="lazy">', field_file.url, alt, css_class)
+    storage = field_file.storage
+    fallback = storage.url(manifest['variants']['jpeg'][-1][1])
+    return format_html(
+        '<picture><source type="{}" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" alt="{}" class="{}" loading="lazy" decoding="async"></picture>',
+        images.FORMATS['webp'][2], images.srcset(field_file, 'webp', manifest), sizes,
+        fallback, images.srcset(field_file, 'jpeg', manifest), sizes, alt, css_class,
+    )
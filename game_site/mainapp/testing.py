@@ -0,0 +1,31 @@
+"""
+Помощники для тестов: бюджет SQL-запросов на URL.
+
+    class NewsQueriesTestCase(QueryBudgetMixin, TestCase):
+        def test_list(self):
+            self.assertQueryBudget(reverse('news:list'), 3)
+"""
+from .instrumentation import QueryRecorder
+
+
+class QueryBudgetMixin:
+    """Миксин для TestCase: запрос к URL не должен превышать бюджет SQL-запросов"""
+    n_plus_one_threshold = 5
+
+    def assertQueryBudget(self, path, budget, method='get', **kwargs):
+        with QueryRecorder() as recorder:
+            response = getattr(self.client, method)(path, **kwargs)
+        duplicates = recorder.duplicates(self.n_plus_one_threshold)
+        details = '\n'.join(f'  {n} x {sql}' for sql, n in recorder.fingerprints.most_common())
+        self.assertLessEqual(
+            recorder.count, budget,
+            f'{method.upper()} {path}: {recorder.count} SQL-запросов при бюджете {budget}:\n{details}',
+        )
+        self.assertFalse(duplicates, f'{method.upper()} {path}: похоже на N+1:\n{details}')
+        return response
+
+    def assertQueryBudgets(self, budgets, **kwargs):
+        """budgets: {путь: бюджет}"""
+        for path, budget in budgets.items():
+            with self.subTest(path=path):
+                self.assertQueryBudget(path, budget, **kwargs)
@@ -1,3 +1,655 @@
-from django.test import TestCase
+import contextvars
+import csv
+import datetime
+import gzip
+import json
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connections
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from games.tests import make_game
+from guides.models import Guide
+from news.models import News
+from userapp.models import User, UserRating
+from PIL import Image
+
+from . import benchmark, counters, images, instrumentation, routers, search, staticfiles
+from .cache import LRUCache, TwoTierCache
+from .middleware import PRIMARY_COOKIE, QueryInstrumentationMiddleware, ReplicaRoutingMiddleware
+from .pagination import COUNT_EXACT, CursorPaginator, InvalidCursor, encode_cursor
+from .testing import QueryBudgetMixin
+
+
+@override_settings(VIEW_COUNTER_FLUSH_INTERVAL=3600)
+class ViewCounterTestCase(TestCase):
+    def setUp(self):
+        counters.get_cache().clear()
+        # Занимаем таймер сброса, чтобы hit() не сбрасывал буфер сам
+        counters.suspend_flush()
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        self.news = News.objects.create(title='Новость', slug='news', content='...', author=author)
+        self.other = News.objects.create(title='Другая', slug='other', content='...', author=author)
+
+    def test_hit_is_buffered(self):
+        with self.assertNumQueries(0):
+            counters.hit(self.news)
+            counters.hit(self.news)
+        self.assertEqual(counters.pending(), 2)
+        self.assertEqual(counters.pending_for(self.news), 2)
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.views, 0)
+
+    def test_flush_writes_batched_updates(self):
+        for _ in range(3):
+            counters.hit(self.news)
+        counters.hit(self.other)
+        self.assertEqual(counters.flush(), {'news.news': 4})
+        self.news.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.news.views, self.other.views), (3, 1))
+        self.assertEqual(counters.pending(), 0)
+
+        # Повторные просмотры после сброса снова попадают в очередь
+        counters.hit(self.news)
+        self.assertEqual(counters.flush(), {'news.news': 1})
+        self.assertEqual(counters.flush(), {})
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.views, 4)
+
+    def test_unfilled_slot_is_not_skipped(self):
+        cache = counters.get_cache()
+        counters.hit(self.news)
+        # Параллельный hit() выделил слот, но еще не записал в него pk
+        counters._incr(cache, counters._key('news.news', 'count', self.other.pk), 1)
+        cache.add(counters._key('news.news', 'dirty', self.other.pk), 1)
+        slot = counters._incr(cache, counters._key('news.news', 'slots'), 1)
+        counters._incr(cache, counters._key('pending'), 1)
+        self.assertEqual(counters.flush(), {'news.news': 1})
+
+        cache.set(counters._key('news.news', 'slot', slot), self.other.pk)
+        self.assertEqual(counters.flush(), {'news.news': 1})
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.views, counters.pending()), (1, 0))
+
+    def test_flush_is_dispatched_to_celery(self):
+        counters.resume_flush()
+        with mock.patch.object(counters, 'is_process_local', return_value=False), \
+                mock.patch('mainapp.tasks.flush_view_counters.delay') as delay:
+            counters.hit(self.news)
+            counters.hit(self.news)
+        delay.assert_called_once_with()
+
+    def test_process_local_buffer_is_flushed_in_process(self):
+        counters.resume_flush()
+        with mock.patch('mainapp.tasks.flush_view_counters.delay') as delay:
+            counters.hit(self.news)
+        delay.assert_not_called()
+        self.news.refresh_from_db()
+        self.assertEqual((self.news.views, counters.pending()), (1, 0))
+
+    def test_evicted_count_is_still_written(self):
+        counters.hit(self.news)
+        with mock.patch.object(counters.get_cache(), 'decr', side_effect=ValueError):
+            self.assertEqual(counters.flush(), {'news.news': 1})
+        self.news.refresh_from_db()
+        self.assertEqual(self.news.views, 1)
+
+
+class SearchTestCase(TestCase):
+    backend_class = search.FTS5SearchBackend
+
+    def setUp(self):
+        self.backend = self.backend_class()
+        search._backends['default'] = self.backend
+        self.addCleanup(search._backends.clear)
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        self.game = make_game(title='Witcher Saga', description='Ролевая игра про ведьмака', developer='CD Projekt')
+        self.guide = Guide.objects.create(
+            title='Прохождение Witcher', slug='guide', game=self.game, author=author,
+            content='Советы', difficulty='beginner', featured_image='guide_images/g.jpg',
+        )
+        self.news = News.objects.create(
+            title='Анонс', slug='news', content='Новая часть witcher и ведьмака', author=author
+        )
+
+    def test_prefix_ranking_and_facets(self):
+        result = self.backend.search('witch')
+        self.assertEqual(result.total, 3)
+        self.assertEqual(result.facets, {'game': 1, 'guide': 1, 'news': 1})
+        # Совпадение в заголовке весит больше, чем в тексте
+        self.assertEqual(result.hits[-1][1], self.news)
+
+        result = self.backend.search('ведьм', kinds=['game'])
+        self.assertEqual([obj for _, obj, _ in result.hits], [self.game])
+        self.assertEqual(result.facets, {'game': 1, 'news': 1})
+
+        self.assertEqual(self.backend.search('witcher анонс').total, 1)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.game.title = 'Cyberpunk'
+        self.game.save()
+        self.assertEqual(self.backend.search('cyber').facets, {'game': 1})
+        self.news.delete()
+        self.assertEqual(self.backend.search('witcher').facets, {'guide': 1})
+        self.assertEqual(search.rebuild(), 2)
+        self.assertEqual(self.backend.search('witcher').facets, {'guide': 1})
+
+    def test_search_view_paginates(self):
+        response = self.client.get(reverse('search'), {'q': 'witcher', 'per_page': 2, 'page': 2})
+        data = response.json()
+        self.assertEqual((data['total'], len(data['results'])), (3, 1))
+
+
+class TermIndexSearchTestCase(SearchTestCase):
+    backend_class = search.TermIndexSearchBackend
+
+
+class CursorPaginatorTestCase(TestCase):
+    def setUp(self):
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        News.objects.bulk_create([
+            News(title=f'Новость {i}', slug=f'news-{i}', content='...', author=author) for i in range(7)
+        ])
+        # Одинаковое время создания: порядок должен однозначно определяться pk
+        News.objects.filter(slug__in=['news-2', 'news-3', 'news-4']).update(
+            created_at=News.objects.get(slug='news-2').created_at
+        )
+        self.expected = list(News.objects.order_by('-created_at', '-pk'))
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(News.objects.all(), 3, ['-created_at', '-pk'], count_mode=COUNT_EXACT)
+        self.assertEqual(paginator.count, 7)
+        pages, cursor = [], None
+        while True:
+            page = paginator.page(cursor)
+            pages.append(page)
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([obj for page in pages for obj in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[2].previous_cursor)
+        self.assertEqual(back.object_list, pages[1].object_list)
+        back = paginator.page(back.previous_cursor)
+        self.assertEqual(back.object_list, pages[0].object_list)
+        self.assertFalse(back.has_previous())
+
+    def test_mistyped_cursor_values(self):
+        paginator = CursorPaginator(News.objects.all(), 3, ['-created_at', '-pk'])
+        for values in (['вчера', 1], [None, 1], [{'d': '2024-01-01'}, 'x']):
+            with self.subTest(values=values), self.assertRaises(InvalidCursor):
+                paginator.page(encode_cursor(values))
+        # HTML-список отвечает 404, API - 400
+        self.assertEqual(self.client.get('/news/', {'cursor': encode_cursor(['вчера', 1])}).status_code, 404)
+        self.assertEqual(self.client.get('/api/news/', {'cursor': encode_cursor(['вчера', 1])}).status_code, 400)
+
+
+class TwoTierCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.cache = TwoTierCache(l1_max_entries=10, l1_timeout=60)
+
+    def test_lru_bounds(self):
+        lru = LRUCache(max_entries=2, max_bytes=10 ** 6)
+        lru.set('a', 1, 60)
+        lru.set('b', 2, 60)
+        lru.get('a')
+        lru.set('c', 3, 60)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+        lru = LRUCache(max_entries=100, max_bytes=2000)
+        for i in range(10):
+            lru.set(i, 'x' * 500, 60)
+        self.assertLessEqual(lru.size, 2000)
+        self.assertEqual(lru.get(9), 'x' * 500)
+        self.assertIsNone(lru.get(0))
+
+    def test_l1_in_front_of_l2(self):
+        self.cache.set('key', {'v': 1}, 60)
+        cache.delete('key')
+        value = self.cache.get('key')
+        self.assertEqual(value, {'v': 1})
+        # L1 отдает копии, а не общий изменяемый объект
+        value['v'] = 2
+        self.assertEqual(self.cache.get('key'), {'v': 1})
+
+        self.cache.set('key', 1, 60)
+        self.cache.clear()
+        self.assertIsNone(cache.get('key'))
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_single_flight(self):
+        calls = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.2)
+            return 'value'
+
+        results = []
+        threads = [
+            threading.Thread(target=lambda: results.append(self.cache.get_or_set('hot', compute, 60)))
+            for _ in range(5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ['value'] * 5)
+        self.assertEqual(len(calls), 1)
+
+    def test_early_recomputation_serves_stale_while_locked(self):
+        self.cache.get_or_set('key', lambda: 'old', 60)
+        # Запись "почти истекла" и считалась долго - XFetch должен выбрать пересчет
+        self.cache.l2.set('key', ('old', 1000, time.time() + 1), 60)
+        self.cache.l1.clear()
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'new', 60), 'new')
+
+        self.cache.l2.set('key', ('old', 1000, time.time() + 1), 60)
+        self.cache.l1.clear()
+        # Пересчетом занят другой процесс - отдаем прежнее значение
+        self.cache.l2.add('key:lock', 1, 60)
+        self.assertEqual(self.cache.get_or_set('key', lambda: 'new', 60), 'old')
+
+
+class ImageDerivativesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root, IMAGE_DERIVATIVE_WIDTHS=[160, 320, 640])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+
+    def upload(self, size=(500, 250)):
+        buffer = BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return default_storage.save('news_images/cover.png', ContentFile(buffer.getvalue()))
+
+    def test_derivatives_built_on_upload(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            news = News.objects.create(title='Новость', slug='news', content='...', author=self.author,
+                                       image=self.upload())
+        manifest = images.get_manifest(news.image)
+        self.assertEqual([width for width, _ in manifest['variants']['webp']], [160, 320, 500])
+        name = manifest['variants']['webp'][0][1]
+        self.assertTrue(name.startswith(f"derivatives/{manifest['digest'][:2]}/{manifest['digest']}-160w"))
+        with default_storage.open(name) as derivative, Image.open(derivative) as image:
+            self.assertEqual((image.format, image.size), ('WEBP', (160, 80)))
+
+        # Сохранение без нового файла не ставит задачу
+        with mock.patch('mainapp.tasks.build_image_derivatives.delay') as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                news.title = 'Исправлено'
+                news.save()
+                news.save(update_fields=['views'])
+        delay.assert_not_called()
+
+        # Одинаковое содержимое - те же имена файлов
+        cache.clear()
+        self.assertEqual(images.build(self.upload()), manifest)
+
+    def test_template_tags_build_on_first_request(self):
+        news = News.objects.create(title='Новость', slug='news', content='...', author=self.author,
+                                   image=self.upload(size=(1000, 500)))
+        with mock.patch.object(images.cache, 'get', wraps=images.cache.get) as cache_get:
+            html = Template('{% load images %}{% picture news.image alt=news.title sizes="50vw" %}').render(
+                Context({'news': news})
+            )
+        # Манифест читается один раз на изображение
+        self.assertEqual(cache_get.call_count, 1)
+        self.assertIn('type="image/webp"', html)
+        self.assertIn('-640w.jpg 640w', html)
+        self.assertIn('alt="Новость"', html)
+        self.assertEqual(Template('{% load images %}{% srcset news.image %}').render(Context({'news': news})),
+                         images.srcset(news.image))
+        self.assertEqual(images.rebuild(), 1)
+
+
+class StaticFilesTestCase(TestCase):
+    def setUp(self):
+        source, self.root = tempfile.mkdtemp(), tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, source)
+        self.addCleanup(shutil.rmtree, self.root)
+        self.css = 'body { color: red; }\n' * 100
+        with open(f'{source}/app.css', 'w') as f:
+            f.write(self.css)
+        settings_override = override_settings(
+            STATICFILES_DIRS=[source], STATIC_ROOT=self.root,
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        call_command('collectstatic', interactive=False, verbosity=0)
+        self.hashed = staticfiles.staticfiles_storage.stored_name('app.css')
+
+    def test_collectstatic_writes_compressed_copies(self):
+        self.assertRegex(self.hashed, r'^app\.[0-9a-f]{12}\.css$')
+        with open(f'{self.root}/{self.hashed}.gz', 'rb') as f:
+            self.assertEqual(gzip.decompress(f.read()).decode(), self.css)
+        if staticfiles.brotli is not None:
+            with open(f'{self.root}/{self.hashed}.br', 'rb') as f:
+                self.assertEqual(staticfiles.brotli.decompress(f.read()).decode(), self.css)
+
+    def test_serve_picks_encoding_and_cache_headers(self):
+        response = self.client.get(f'/static/{self.hashed}', headers={'Accept-Encoding': 'gzip, br;q=0'})
+        self.assertEqual((response['Content-Encoding'], response['Content-Type']), ('gzip', 'text/css'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.css)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+        response = self.client.get('/static/app.css')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/static/../settings.py').status_code, 404)
+
+    def test_not_modified_keeps_cache_headers(self):
+        response = self.client.get(f'/static/{self.hashed}', headers={'Accept-Encoding': 'gzip'})
+        response = self.client.get(f'/static/{self.hashed}', headers={
+            'Accept-Encoding': 'gzip', 'If-Modified-Since': response['Last-Modified'],
+        })
+        self.assertEqual(response.status_code, 304)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(response['Vary'], 'Accept-Encoding')
+
+
+class SQLitePragmaTestCase(TestCase):
+    def test_new_file_connection_is_tuned(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        default = connections['default']
+        wrapper = type(default)({**default.settings_dict, 'NAME': f'{directory}/db.sqlite3'}, 'pragmas')
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone()[0], 'wal')
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(cursor.fetchone()[0], 5000)
+
+
+@mock.patch.object(routers, 'replicas', return_value=['replica'])
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = routers.ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_stick_to_primary_after_write(self, replicas):
+        def scenario():
+            reads = [self.router.db_for_read(News)]
+            self.assertEqual(self.router.db_for_write(News), 'default')
+            reads.append(self.router.db_for_read(News))
+            return reads
+
+        self.assertEqual(contextvars.Context().run(scenario), ['replica', 'default'])
+        self.assertFalse(self.router.allow_migrate('replica', 'news'))
+
+    def test_cache_table_is_not_a_write(self, replicas):
+        from django.core.cache.backends.db import DatabaseCache
+
+        entry = DatabaseCache('cache_entries', {}).cache_model_class
+
+        def scenario():
+            return self.router.db_for_write(entry), self.router.db_for_read(News), routers._wrote.get()
+
+        self.assertEqual(contextvars.Context().run(scenario), ('default', 'replica', False))
+        self.assertIsNone(self.router.allow_migrate('default', 'news'))
+        self.assertTrue(self.router.allow_migrate('default', 'django_cache'))
+        self.assertFalse(self.router.allow_migrate('replica', 'django_cache'))
+
+    def test_internal_writes_are_not_sticky(self, replicas):
+        def scenario():
+            with routers.internal_writes():
+                self.assertEqual(self.router.db_for_write(News), 'default')
+            return self.router.db_for_read(News), routers._wrote.get()
+
+        self.assertEqual(contextvars.Context().run(scenario), ('replica', False))
+
+    def test_middleware_sets_sticky_cookie(self, replicas):
+        seen = []
+
+        def view(request, write=False):
+            seen.append(self.router.db_for_read(News))
+            if write:
+                self.router.db_for_write(News)
+            return HttpResponse()
+
+        read_only = ReplicaRoutingMiddleware(view)
+        writing = ReplicaRoutingMiddleware(lambda request: view(request, write=True))
+
+        response = contextvars.Context().run(read_only, self.factory.get('/'))
+        self.assertNotIn(PRIMARY_COOKIE, response.cookies)
+        response = contextvars.Context().run(writing, self.factory.post('/'))
+        self.assertIn(PRIMARY_COOKIE, response.cookies)
+
+        request = self.factory.get('/')
+        request.COOKIES[PRIMARY_COOKIE] = '1'
+        context = contextvars.Context()
+        context.run(read_only, request)
+        self.assertEqual(seen, ['replica', 'default', 'default'])
+        self.assertFalse(context.run(routers.is_pinned))
+
+
+@override_settings(SQL_INSTRUMENTATION=True, SQL_N_PLUS_ONE_THRESHOLD=3)
+class QueryInstrumentationTestCase(QueryBudgetMixin, TestCase):
+    def setUp(self):
+        from reviews.models import Review
+
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        for i in range(4):
+            Review.objects.create(game=make_game(slug=f'game-{i}'), author=author, rating=5, content='...')
+        self.reviews = Review.objects.all()
+
+    def test_fingerprint_ignores_values(self):
+        self.assertEqual(
+            instrumentation.fingerprint('SELECT * FROM t WHERE id = 5 AND name = \'x\' AND pk IN (%s, %s)'),
+            instrumentation.fingerprint('SELECT *  FROM t WHERE id = 7 AND name = \'y\' AND pk IN (%s)'),
+        )
+
+    def test_headers_and_n_plus_one_log(self):
+        def view(request):
+            # Review.__str__ достает game и author на каждой строке
+            return HttpResponse(', '.join(str(review) for review in self.reviews))
+
+        with self.assertLogs('game_site.sql', 'WARNING') as logs:
+            response = QueryInstrumentationMiddleware(view)(RequestFactory().get('/reviews/'))
+        self.assertEqual(response['X-DB-Query-Count'], '9')
+        self.assertEqual(response['X-DB-Duplicate-Queries'], '8')
+        self.assertIn('"queries": 9', logs.output[0])
+
+    def test_query_budget(self):
+        self.assertQueryBudget(reverse('search'), 3, data={'q': 'игра'})
+        with self.assertRaises(AssertionError):
+            self.assertQueryBudget(reverse('search'), 0, data={'q': 'игра'})
+
+
+class BenchmarkTestCase(TestCase):
+    def test_seed_and_run(self):
+        from community.models import ForumTopic
+        from reviews.models import Review
+
+        call_command('seed_benchmark_data', scale=0.0001, batch_size=50, stdout=StringIO())
+        self.assertEqual(Review.objects.count(), 100)
+        self.assertEqual(User.objects.filter(profile__isnull=False).count(), 5)
+        # Денормализованные счетчики пересчитаны после bulk_create
+        self.assertEqual(sum(ForumTopic.objects.values_list('post_count', flat=True)), 200)
+        self.assertEqual(sum(UserRating.objects.values_list('score', flat=True)), 20 * UserRating.GUIDE_POINTS)
+
+        target_list = dict(benchmark.targets(['/games', '/news/<int:pk>/']))
+        self.assertEqual(set(target_list), {'/games', '/gamesgame/<slug:slug>/', '/news/<int:pk>/'})
+        self.assertEqual(len(target_list['/news/<int:pk>/']), 20)
+        self.assertTrue(target_list['/gamesgame/<slug:slug>/'][0].startswith('/gamesgame/bench-game-'))
+
+        report = benchmark.run(benchmark.InProcessTransport(), target_list.items(), requests=3, concurrency=1)
+        self.assertEqual(report['/games']['requests'], 3)
+        self.assertIsInstance(report['/gamesgame/<slug:slug>/']['queries'], (int, float))
+
+    def test_missing_baseline_is_an_error(self):
+        options = {'requests': 1, 'concurrency': 1, 'only': ['/games'], 'stdout': StringIO()}
+        call_command('run_benchmarks', **options)
+        with self.assertRaises(CommandError):
+            call_command('run_benchmarks', baseline=f'{tempfile.gettempdir()}/missing/baseline.json', **options)
+
+    def test_compare(self):
+        row = {'rps': 100.0, 'p50_ms': 10.0, 'p95_ms': 20.0, 'queries': 3}
+        self.assertEqual(benchmark.compare({'index': dict(row, p50_ms=11.0)}, {'index': row}), [])
+        regressions = benchmark.compare({'index': dict(row, p95_ms=30.0, queries=4)}, {'index': row})
+        self.assertEqual(
+            [(metric, before, after) for _, metric, before, after in regressions],
+            [('p95_ms', 20.0, 30.0), ('queries', 3, 4)],
+        )
+
+
+@override_settings(EXPORT_API_TOKENS=['secret'])
+class ExportTestCase(TestCase):
+    def setUp(self):
+        from games.models import Genre
+        from reviews.models import Review
+
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        self.game = make_game(title='Elden', slug='elden')
+        self.game.genres.add(self.rpg)
+        make_game(title='Hades', slug='hades')
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        Review.objects.create(game=self.game, author=author, rating=9, content='Отлично', pros='', cons='')
+
+    def get(self, url, **headers):
+        return self.client.get(url, HTTP_AUTHORIZATION='Bearer secret', **headers)
+
+    def test_ndjson_stream(self):
+        response = self.get('/export/games.ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+        # Игры и жанры всей пачки - два запроса независимо от числа игр
+        with self.assertNumQueries(2):
+            rows = [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+        self.assertEqual([(row['slug'], row['genres']) for row in rows], [('elden', ['rpg']), ('hades', [])])
+
+    async def test_asgi_stream_is_async(self):
+        response = await self.async_client.get('/export/games.ndjson', headers={'Authorization': 'Bearer secret'})
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual([json.loads(line)['slug'] for line in content.splitlines()], ['elden', 'hades'])
+
+    def test_gzip_csv_and_updated_since(self):
+        response = self.get('/export/reviews.csv', HTTP_ACCEPT_ENCODING='gzip, br')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        rows = list(csv.DictReader(gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()))
+        self.assertEqual([(row['game'], row['author'], row['rating']) for row in rows], [('elden', 'author', '9')])
+
+        since = (timezone.now() + datetime.timedelta(minutes=1)).isoformat()
+        self.assertEqual(b''.join(self.get('/export/games.ndjson', data={'updated_since': since}).streaming_content), b'')
+        # Смена жанров обновляет updated_at - игра попадает в инкрементальную выгрузку
+        self.game.genres.clear()
+        self.game.refresh_from_db()
+        since = self.game.updated_at.isoformat()
+        rows = b''.join(self.get('/export/games.ndjson', data={'updated_since': since}).streaming_content)
+        self.assertEqual([json.loads(line)['slug'] for line in rows.splitlines()], ['elden'])
+
+    def test_access_and_validation(self):
+        self.assertEqual(self.client.get('/export/games.ndjson').status_code, 403)
+        self.assertEqual(self.get('/export/games.xml').status_code, 404)
+        self.assertEqual(self.get('/export/games.csv', data={'updated_since': 'вчера'}).status_code, 400)
+
+    def test_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = f'{directory}/games.csv.gz'
+        call_command('export_catalog', 'games', format='csv', gzip=True, output=path, stdout=StringIO())
+        with gzip.open(path, 'rt', encoding='utf-8') as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([(row['slug'], row['genres']) for row in rows], [('elden', 'rpg'), ('hades', '')])
+
+
+class ApiTestCase(TestCase):
+    def setUp(self):
+        from games.models import Genre
+        from reviews.models import Review
+
+        cache.clear()
+        self.rpg = Genre.objects.create(name='RPG', slug='rpg')
+        self.old = make_game(title='Old', slug='old', release_date=datetime.date(2020, 1, 1))
+        self.new = make_game(title='New', slug='new', release_date=datetime.date(2024, 1, 1))
+        self.new.genres.add(self.rpg)
+        self.author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        self.review = Review.objects.create(game=self.new, author=self.author, rating=8, content='...', pros='', cons='')
+
+    def get(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_sparse_fields_and_include(self):
+        data = self.get('/api/games/', fields='slug,genres', include='genres', **{'fields[genres]': 'name'})
+        self.assertEqual(data['results'], [
+            {'slug': 'new', 'genres': [{'name': 'RPG'}]},
+            {'slug': 'old', 'genres': []},
+        ])
+        review = self.get(f'/api/reviews/{self.review.pk}/', include='game,author', **{'fields[game]': 'slug'})
+        self.assertEqual((review['game'], review['author']['username']), ({'slug': 'new'}, 'author'))
+        self.assertNotIn('email', review['author'])
+
+    def test_fragments_are_cached_by_updated_at(self):
+        self.get('/api/reviews/', include='game')
+        # Страница (pk и updated_at) и игры для include - фрагменты из кэша
+        with self.assertNumQueries(2):
+            data = self.get('/api/reviews/', include='game')
+        self.assertEqual(data['results'][0]['game']['rating'], 8.0)
+
+        self.new.refresh_from_db()
+        self.new.title = 'Renamed'
+        self.new.save()
+        self.assertEqual(self.get('/api/games/new/')['title'], 'Renamed')
+        # Новая оценка меняет updated_at игры - в кэше не остается старого рейтинга
+        self.review.rating = 4
+        self.review.save()
+        self.assertEqual(self.get('/api/games/new/')['rating'], 4.0)
+
+    def test_cursor_pagination(self):
+        first = self.get('/api/games/', page_size=1, fields='slug', count='exact')
+        self.assertEqual((first['results'], first['count'], first['previous']), ([{'slug': 'new'}], 2, None))
+        second = self.client.get(first['next']).json()
+        self.assertEqual((second['results'], second['next']), ([{'slug': 'old'}], None))
+        self.assertEqual(self.client.get(second['previous']).json()['results'], [{'slug': 'new'}])
+
+    def test_conditional_get(self):
+        response = self.client.get('/api/games/new/')
+        etag = response.headers['ETag']
+        self.assertIn('Last-Modified', response.headers)
+        # Только ключевые поля объекта - без фрагментов и сериализации
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get('/api/games/new/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get('/api/games/new/', {'fields': 'slug'}, HTTP_IF_NONE_MATCH=etag).status_code,
+                         200)
+
+        etag = self.client.get('/api/games/').headers['ETag']
+        self.assertEqual(self.client.get('/api/games/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        make_game(title='Newest', slug='newest', release_date=datetime.date(2025, 1, 1))
+        response = self.client.get('/api/games/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+        # Ответ со связанными объектами зависит от их версий - без ETag
+        self.assertNotIn('ETag', self.client.get('/api/reviews/', {'include': 'game'}).headers)
+
+    def test_invalid_parameters(self):
+        for params in ({'fields': 'password'}, {'include': 'author'}, {'cursor': 'broken'}, {'page_size': 'x'}):
+            self.assertEqual(self.client.get('/api/games/', params).status_code, 400, params)
+        self.assertEqual(self.client.get('/api/games/missing/').status_code, 404)
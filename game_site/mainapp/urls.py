@@ -1,9 +1,13 @@
-from django.urls import path
+from django.urls import include, path
 from . import views
+from .api import router as api_router
 
 name = 'mainapp'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    path('search/', views.search, name='search'),
+    path('export/<slug:dataset>.<slug:fmt>', views.export, name='export'),
+    path('api/', include(api_router.urls)),
 ]
 
@@ -1,7 +1,93 @@
+import hmac
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
+
+from . import export as catalog_export
+from . import search as search_index
+from .staticfiles import accepted_encodings
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
 
 
 # Create your views here.
 def index(request):
     pass
 
+
+def search(request):
+    """
+    Полнотекстовый поиск: ?q=запрос&type=game&type=news&page=2&per_page=20
+    Отвечает JSON с найденными документами, общим числом и фасетами по типам.
+    """
+    query = request.GET.get('q', '').strip()
+    kinds = request.GET.getlist('type') or None
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+        per_page = min(max(int(request.GET.get('per_page', SEARCH_PAGE_SIZE)), 1), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Некорректные параметры пагинации'}, status=400)
+
+    result = search_index.search(query, kinds, offset=(page - 1) * per_page, limit=per_page)
+    return JsonResponse({
+        'query': query,
+        'page': page,
+        'per_page': per_page,
+        'total': result.total,
+        'facets': result.facets,
+        'results': [
+            {
+                'type': kind,
+                'id': obj.pk,
+                'title': obj.title,
+                'url': obj.get_absolute_url() if hasattr(obj, 'get_absolute_url') else None,
+                'score': round(score, 4),
+            }
+            for kind, obj, score in result.hits
+        ],
+    })
+
+
+def _export_allowed(request):
+    if request.user.is_authenticated and request.user.is_staff:
+        return True
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and any(
+        hmac.compare_digest(token.encode(), allowed.encode()) for allowed in settings.EXPORT_API_TOKENS
+    )
+
+
+def export(request, dataset, fmt):
+    """
+    Потоковая выгрузка: /export/games.ndjson, /export/reviews.csv?updated_since=2024-01-01
+    Сжимается на лету, если клиент принимает gzip.
+    """
+    if dataset not in catalog_export.DATASETS or fmt not in catalog_export.FORMATS:
+        raise Http404('Неизвестная выгрузка')
+    if not _export_allowed(request):
+        return JsonResponse({'error': 'Нужен токен выгрузки'}, status=403)
+    updated_since = request.GET.get('updated_since')
+    if updated_since:
+        try:
+            updated_since = catalog_export.parse_since(updated_since)
+        except ValueError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+
+    compress = 'gzip' in accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    content = catalog_export.stream(dataset, fmt, updated_since or None, compress)
+    if isinstance(request, ASGIRequest):
+        content = catalog_export.aiterate(content)
+    response = StreamingHttpResponse(
+        content,
+        content_type=f'{catalog_export.FORMATS[fmt]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+    response['Cache-Control'] = 'private, no-store'
+    if compress:
+        response['Content-Encoding'] = 'gzip'
+    patch_vary_headers(response, ['Accept-Encoding', 'Authorization'])
+    return response
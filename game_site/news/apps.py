@@ -4,3 +4,8 @@ from django.apps import AppConfig
 class NewsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'news'
+
+    def ready(self):
+        from mainapp import counters, images
+        counters.register(self.get_model('News'))
+        images.register(self.get_model('News'), 'image')
@@ -5,6 +5,19 @@ from django.db import models
 from userapp.models import User
 
 
+class NewsQuerySet(models.QuerySet):
+    def for_list(self):
+        """Лента новостей: игра и автор одним JOIN, без текста новости и описания игры"""
+        return self.select_related('game', 'author').defer('content', 'game__description')
+
+    def for_detail(self):
+        return self.select_related('game', 'author').defer('game__description')
+
+    def for_cache(self):
+        """Карточки, которые кладутся в кэш: все поля - отложенное поле у объекта из кэша стоило бы запроса"""
+        return self.select_related('game', 'author')
+
+
 class News(models.Model):
     title = models.CharField(max_length=200)
     slug = models.SlugField(unique=True)
@@ -17,6 +30,13 @@ class News(models.Model):
     image = models.ImageField(upload_to='news_images/')
     views = models.PositiveIntegerField(default=0)
 
+    objects = NewsQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),  # Сортировка списка и keyset-пагинация
+        ]
+
     def __str__(self):
         return self.title
 
@@ -0,0 +1,12 @@
+from rest_framework import serializers
+
+from .models import News
+
+
+class NewsSerializer(serializers.ModelSerializer):
+    # Без счетчика просмотров: он меняется без updated_at, а представление кэшируется по нему
+    class Meta:
+        model = News
+        fields = [
+            'id', 'slug', 'title', 'content', 'game', 'author', 'is_featured', 'image', 'created_at', 'updated_at',
+        ]
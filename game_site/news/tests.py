@@ -1,3 +1,59 @@
-from django.test import TestCase
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+from django.utils.http import http_date
 
 # Create your tests here.
+from games.tests import make_game
+from mainapp import counters
+from userapp.models import User
+from .models import News
+from .views import NewsDetailView, NewsListView
+
+
+class NewsViewsQueryCountTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        # Занимаем таймер сброса счетчиков просмотров, чтобы просмотр не писал в БД
+        counters.suspend_flush()
+        author = User.objects.create_user(email='author@ex.com', username='author', password='pass')
+        game = make_game()
+        for i in range(5):
+            News.objects.create(title=f'Новость {i}', slug=f'news-{i}', content='...', author=author,
+                                game=game if i % 2 else None)
+        self.factory = RequestFactory()
+
+    def test_list_query_count(self):
+        # COUNT и страница с играми и авторами
+        with self.assertNumQueries(2):
+            context = NewsListView.as_view()(self.factory.get('/news/')).context_data
+            cards = [(news.author.username, news.game and news.game.title) for news in context['object_list']]
+        self.assertEqual(len(cards), 5)
+        self.assertIn('content', context['object_list'][0].get_deferred_fields())
+
+    def test_detail_query_count(self):
+        news = News.objects.get(slug='news-1')
+        # updated_at для ETag и сам объект с автором и игрой
+        with self.assertNumQueries(2):
+            response = NewsDetailView.as_view()(self.factory.get('/news/'), pk=news.pk)
+            obj = response.context_data['object']
+            obj.author.username, obj.game.title, obj.content
+
+    def test_conditional_get(self):
+        news = News.objects.get(slug='news-1')
+        response = NewsDetailView.as_view()(self.factory.get('/news/'), pk=news.pk)
+        etag = response.headers['ETag']
+        self.assertEqual(response.headers['Last-Modified'], http_date(news.updated_at.timestamp()))
+
+        # Без загрузки объекта и шаблона, но просмотр учитывается
+        with self.assertNumQueries(1):
+            response = NewsDetailView.as_view()(self.factory.get('/news/', HTTP_IF_NONE_MATCH=etag), pk=news.pk)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(counters.pending_for(news), 2)
+
+        # Страница меняется вместе с игрой, показанной на ней
+        news.game.title = 'Новое название'
+        with self.captureOnCommitCallbacks(execute=True):
+            news.game.save()
+        response = NewsDetailView.as_view()(self.factory.get('/news/', HTTP_IF_NONE_MATCH=etag), pk=news.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
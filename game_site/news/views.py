@@ -2,14 +2,19 @@ from django.shortcuts import render
 
 # Create your views here.
 from django.views.generic import ListView, DetailView
+from games import cache as game_cache
+from mainapp import counters
+from mainapp.conditional import ConditionalGetMixin, page_etag
+from mainapp.pagination import CursorPaginationMixin
 from .models import News
 
 
-class NewsListView(ListView):
-    model = News
+class NewsListView(CursorPaginationMixin, ListView):
+    queryset = News.objects.for_list()
     template_name = 'news/news_list.html'
     paginate_by = 10
     ordering = ['-created_at']
+    cursor_ordering = ['-created_at', '-pk']
 
     def get_queryset(self):
         queryset = super().get_queryset()
@@ -19,14 +24,28 @@ class NewsListView(ListView):
         return queryset
 
 
-class NewsDetailView(DetailView):
-    model = News
+class NewsDetailView(ConditionalGetMixin, DetailView):
+    queryset = News.objects.for_detail()
     template_name = 'news/news_detail.html'
 
+    def get_validators(self):
+        row = News.objects.filter(pk=self.kwargs['pk']).values_list('updated_at', 'game_id').first()
+        if row is None:
+            return None
+        updated_at, game_id = row
+        etag = page_etag(self.request, 'news', self.kwargs['pk'], updated_at.timestamp(),
+                         game_cache.page_version(game_id))
+        return etag, updated_at
+
+    def not_modified_hook(self):
+        # Повторный просмотр из кэша браузера - тоже просмотр; для счетчика хватает pk
+        counters.hit(News(pk=self.kwargs['pk']))
+
     def get(self, request, *args, **kwargs):
-        # Увеличиваем счетчик просмотров
+        # Увеличиваем счетчик просмотров (буферизованно, запись в БД пачками)
         self.object = self.get_object()
-        self.object.views += 1
-        self.object.save()
-        return super().get(request, *args, **kwargs)
+        counters.hit(self.object)
+        # super().get() загрузил бы объект повторно
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
 
@@ -2,10 +2,25 @@ from django.db import models
 
 # Create your models here.
 from django.db import models
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from games.models import Game
 from userapp.models import User
 from django.core.validators import MinValueValidator, MaxValueValidator
 
 
+class ReviewQuerySet(models.QuerySet):
+    def for_list(self):
+        """Списки обзоров: игра и автор одним JOIN (их читает __str__), без текста обзора"""
+        return self.select_related('game', 'author').defer('content', 'game__description')
+
+    def for_detail(self):
+        return self.select_related('game', 'author').defer('game__description')
+
+    def for_cache(self):
+        return self.select_related('game', 'author')
+
+
 class Review(models.Model):
     game = models.ForeignKey('games.Game', on_delete=models.CASCADE)
     author = models.ForeignKey(User, related_name='review_user', on_delete=models.CASCADE)
@@ -16,7 +31,43 @@ class Review(models.Model):
     pros = models.TextField()
     cons = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ReviewQuerySet.as_manager()
 
     def __str__(self):
         return f"Обзор {self.game.title} от {self.author.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем сохраненные значения, чтобы при редактировании применить только разницу
+        instance._saved_rating = (instance.__dict__.get('game_id'), instance.__dict__.get('rating'))
+        return instance
+
+
+@receiver(post_save, sender=Review)
+def update_game_rating_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        # loaddata: агрегаты игры в фикстуре уже учитывают этот обзор
+        return
+    old_game_id, old_rating = getattr(instance, '_saved_rating', (None, None))
+    if created:
+        Game.apply_rating_delta(instance.game_id, instance.rating, 1)
+    elif old_game_id is None or old_rating is None:
+        # Прежнее состояние неизвестно (объект собран вручную) - пересчитываем целиком
+        Game.objects.get(pk=instance.game_id).update_rating()
+    elif old_game_id != instance.game_id:
+        Game.apply_rating_delta(old_game_id, -old_rating, -1)
+        Game.apply_rating_delta(instance.game_id, instance.rating, 1)
+    elif old_rating != instance.rating:
+        Game.apply_rating_delta(instance.game_id, instance.rating - old_rating, 0)
+    instance._saved_rating = (instance.game_id, instance.rating)
+
+
+@receiver(post_delete, sender=Review)
+def update_game_rating_on_delete(sender, instance, origin=None, **kwargs):
+    if isinstance(origin, Game):
+        # Обзоры удаляются каскадом вместе с игрой - пересчитывать нечего
+        return
+    Game.apply_rating_delta(instance.game_id, -instance.rating, -1)
@@ -0,0 +1,9 @@
+from rest_framework import serializers
+
+from .models import Review
+
+
+class ReviewSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Review
+        fields = ['id', 'game', 'author', 'rating', 'content', 'pros', 'cons', 'created_at', 'updated_at']
@@ -4,3 +4,11 @@ from django.apps import AppConfig
 class UserappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'userapp'
+
+    def ready(self):
+        from . import cache  # noqa: F401 - подключает сигналы инвалидации кэша профиля
+        from . import stream  # noqa: F401 - публикует новые уведомления в поток SSE
+        from . import friends  # noqa: F401 - поддерживает кэш графа друзей
+        from . import feed  # noqa: F401 - раскладывает новые записи по лентам подписчиков
+        from mainapp import images
+        images.register(self.get_model('User'), 'avatar')
@@ -0,0 +1,111 @@
+"""
+Кэш публичного профиля пользователя, ключ - User.pk.
+
+Данные профиля кэшируются для всех зрителей, а готовый HTML - только для
+анонимных (у авторизованных в шаблон попадают их собственные данные).
+Версия профиля увеличивается после коммита изменений User, Profile, любимых жанров и друзей.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.http import Http404
+
+from mainapp import cache as shared_cache
+from mainapp.routers import use_primary
+
+from . import friends
+from .models import FriendUser, Profile, User
+
+PROFILE_TIMEOUT = 60 * 60 * 24
+
+
+def _name(user_id):
+    return f'profile:{user_id}'
+
+
+def data_key(user_id):
+    return shared_cache.versioned_key(_name(user_id), 'data')
+
+
+def anonymous_page_key(user_id):
+    return shared_cache.versioned_key(_name(user_id), 'anonymous')
+
+
+def invalidate(*user_ids):
+    """Поднимает версии профилей после коммита: раньше параллельный запрос закэшировал бы старые данные"""
+    names = [_name(user_id) for user_id in user_ids]
+
+    def bump():
+        for name in names:
+            shared_cache.bump_version(name)
+
+    transaction.on_commit(bump)
+
+
+def load_profile(user):
+    """Данные для страницы профиля (один набор запросов на версию профиля)"""
+    if user is None:
+        return None
+    with use_primary():
+        profile = Profile.objects.filter(user=user).prefetch_related('favorite_genres').first()
+        return {
+            'user': user,
+            'profile': profile,
+            'friends': friends.friends(profile) if profile is not None else [],
+        }
+
+
+def _username_key(username):
+    return f'profile:username:{username}'
+
+
+def get_user_id(username):
+    """id пользователя по username (сопоставление кэшируется)"""
+    user_id = cache.get(_username_key(username))
+    if user_id is None:
+        user_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+        if user_id is None:
+            raise Http404('Пользователь не найден')
+        cache.set(_username_key(username), user_id, PROFILE_TIMEOUT)
+    return user_id
+
+
+def get_profile_context(username):
+    user_id = get_user_id(username)
+    context = shared_cache.tiered.get_or_set(
+        data_key(user_id), lambda: load_profile(User.objects.filter(pk=user_id).first()), PROFILE_TIMEOUT
+    )
+    if context is not None and context['user'].username == username:
+        return context
+    # Пользователя удалили или сменили ему username - сопоставление в кэше устарело
+    cache.delete(_username_key(username))
+    user = User.objects.filter(username=username).first()
+    if user is None:
+        raise Http404('Пользователь не найден')
+    cache.set(_username_key(username), user.pk, PROFILE_TIMEOUT)
+    return shared_cache.tiered.get_or_set(data_key(user.pk), lambda: load_profile(user), PROFILE_TIMEOUT)
+
+
+@receiver(post_save, sender=User)
+def invalidate_user(sender, instance, **kwargs):
+    invalidate(instance.pk)
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def invalidate_profile(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+@receiver(m2m_changed, sender=Profile.favorite_genres.through)
+def invalidate_favorite_genres(sender, instance, action, reverse, **kwargs):
+    if action.startswith('post_') and not reverse:
+        invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=FriendUser)
+@receiver(post_delete, sender=FriendUser)
+def invalidate_friends(sender, instance, **kwargs):
+    # Связь видна на страницах обоих пользователей
+    invalidate(*Profile.objects.filter(pk__in=[instance.user_id, instance.friend_id]).values_list('user_id', flat=True))
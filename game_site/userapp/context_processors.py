@@ -0,0 +1,10 @@
+from django.utils.functional import SimpleLazyObject
+
+from .notifications import unread_count
+
+
+def notifications(request):
+    """Счетчик непрочитанных уведомлений для значка в шапке (запрос - только если шаблон его использует)"""
+    if not request.user.is_authenticated:
+        return {}
+    return {'unread_notifications_count': SimpleLazyObject(lambda: unread_count(request.user))}
@@ -0,0 +1,292 @@
+"""
+Персональная лента активности: новые новости, гайды, обзоры и посты форума
+от друзей пользователя и по играм его любимых жанров.
+
+Лента строится при записи (fan-out-on-write): после коммита новой записи
+задача Celery добавляет ее код в начало лент всех подписчиков. Лента -
+ограниченный список целых чисел (id * 8 + код типа) в кэше, без самих объектов.
+Карточки записей кэшируются отдельно под версией записи (mainapp.cache),
+которая поднимается после коммита изменения, поэтому чтение страницы обычно
+не идет в БД; промахи догружаются пачкой - по запросу на тип записи, сколько
+бы источников ни было у пользователя. Если ленты в кэше нет (новый
+пользователь, вытеснение, сменились друзья или жанры), она собирается из БД.
+
+Лента изменяется только под блокировкой пользователя (cache.add): вставка
+записи - это чтение и запись списка, и без блокировки параллельные вставки
+и пересборка теряли бы друг друга.
+"""
+import contextlib
+import heapq
+import itertools
+import time
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from mainapp import cache as shared_cache
+from mainapp.routers import use_primary
+
+from . import friends
+from .models import FriendUser, Profile
+
+FEED_LENGTH = 300
+FEED_TIMEOUT = 60 * 60 * 24 * 7
+FAN_OUT_BATCH_SIZE = 500
+ITEM_TIMEOUT = 60 * 60
+LOCK_TIMEOUT = 5
+
+KIND_BITS = 3
+
+# Тип записи -> (код, модель)
+FEED_TYPES = {
+    'news': (1, 'news.News'),
+    'guide': (2, 'guides.Guide'),
+    'review': (3, 'reviews.Review'),
+    'post': (4, 'community.ForumPost'),
+}
+KIND_NAMES = {code: kind for kind, (code, *_) in FEED_TYPES.items()}
+
+
+def _key(user_id):
+    return f'feed:{user_id}'
+
+
+def _lock_key(user_id):
+    return f'feed:{user_id}:lock'
+
+
+def _item_name(entry):
+    return f'feed:item:{entry}'
+
+
+@contextlib.contextmanager
+def _locked(user_id, wait=None):
+    """Блокировка ленты пользователя; отдает True, если ее удалось взять за wait секунд"""
+    lock_key = _lock_key(user_id)
+    deadline = time.monotonic() + (LOCK_TIMEOUT if wait is None else wait)
+    locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    while not locked and time.monotonic() < deadline:
+        time.sleep(0.05)
+        locked = cache.add(lock_key, 1, LOCK_TIMEOUT)
+    try:
+        yield locked
+    finally:
+        if locked:
+            cache.delete(lock_key)
+
+
+def encode(kind, pk):
+    return (pk << KIND_BITS) | FEED_TYPES[kind][0]
+
+
+def decode(entry):
+    return KIND_NAMES[entry & ((1 << KIND_BITS) - 1)], entry >> KIND_BITS
+
+
+def _model(kind):
+    return apps.get_model(FEED_TYPES[kind][1])
+
+
+def _kind_for(sender):
+    label = sender._meta.label
+    for kind, (_, model_label) in FEED_TYPES.items():
+        if model_label == label:
+            return kind
+
+
+def _sources(user_id):
+    """id авторов (друзей) и id любимых жанров пользователя"""
+    profile_id = Profile.objects.filter(user_id=user_id).values_list('pk', flat=True).first()
+    if profile_id is None:
+        return set(), set()
+    friend_profiles = friends.friend_ids(profile_id)
+    author_ids = set(Profile.objects.filter(pk__in=friend_profiles).values_list('user_id', flat=True))
+    genre_ids = set(Profile.favorite_genres.through.objects.filter(profile_id=profile_id)
+                    .values_list('genre_id', flat=True))
+    return author_ids, genre_ids
+
+
+def build_timeline(user_id):
+    """Собирает ленту из БД: последние FEED_LENGTH записей всех источников"""
+    with use_primary():
+        return _build_timeline(user_id)
+
+
+def _build_timeline(user_id):
+    author_ids, genre_ids = _sources(user_id)
+    if not author_ids and not genre_ids:
+        return []
+    streams = []
+    for kind in FEED_TYPES:
+        model = _model(kind)
+        condition = Q(author_id__in=author_ids)
+        if genre_ids and kind != 'post':
+            condition |= Q(game__genres__in=genre_ids)
+        rows = (
+            model._default_manager.filter(condition).exclude(author_id=user_id)
+            .order_by('-created_at', '-pk').values_list('created_at', 'pk').distinct()[:FEED_LENGTH]
+        )
+        streams.append([(created_at, pk, kind) for created_at, pk in rows])
+    merged = heapq.merge(*streams, key=lambda row: (row[0], row[1]), reverse=True)
+    return [encode(kind, pk) for _, pk, kind in merged][:FEED_LENGTH]
+
+
+def timeline(user_id):
+    """Лента пользователя - список закодированных записей, новые первыми"""
+    entries = cache.get(_key(user_id))
+    if entries is None:
+        # Читатель не ждет: без блокировки лента собирается, но не кэшируется
+        with _locked(user_id, wait=0) as locked:
+            entries = build_timeline(user_id)
+            if locked:
+                cache.set(_key(user_id), entries, FEED_TIMEOUT)
+    return entries
+
+
+def hydrate(entries):
+    """[(kind, obj)] в порядке ленты; удаленные записи пропускаются"""
+    versions = shared_cache.get_versions([_item_name(entry) for entry in entries])
+    keys = {entry: f'{_item_name(entry)}:v{versions[_item_name(entry)]}' for entry in entries}
+    cached = cache.get_many(keys.values())
+    objects = {entry: cached[key] for entry, key in keys.items() if key in cached}
+    by_kind = {}
+    for entry in entries:
+        if entry not in objects:
+            kind, pk = decode(entry)
+            by_kind.setdefault(kind, []).append(pk)
+    with use_primary():
+        loaded = {
+            encode(kind, pk): obj
+            for kind, pks in by_kind.items()
+            for pk, obj in _model(kind)._default_manager.for_cache().in_bulk(pks).items()
+        }
+    cache.set_many({keys[entry]: obj for entry, obj in loaded.items()}, ITEM_TIMEOUT)
+    objects.update(loaded)
+    return [(decode(entry)[0], objects[entry]) for entry in entries if entry in objects]
+
+
+def page_version(entries):
+    """
+    Отпечаток страницы ленты для ETag без гидратации и без запросов:
+    сами записи и их версии из кэша
+    """
+    versions = shared_cache.get_versions([_item_name(entry) for entry in entries])
+    return ':'.join(f'{entry}.{versions[_item_name(entry)]}' for entry in entries)
+
+
+def get_feed(user, offset=0, limit=20):
+    return hydrate(timeline(getattr(user, 'pk', user))[offset:offset + limit])
+
+
+def followers(kind, instance):
+    """id пользователей, в ленту которых попадает запись - потоком, без загрузки всех в память"""
+    friend_ids = (
+        FriendUser.objects.filter(friend__user_id=instance.author_id)
+        .exclude(user__user_id=instance.author_id).values_list('user__user_id', flat=True)
+    )
+    yield from friend_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE)
+    game_id = getattr(instance, 'game_id', None)
+    if game_id is not None:
+        fan_ids = (
+            Profile.objects.filter(favorite_genres__games=game_id).exclude(user_id=instance.author_id)
+            .values_list('user_id', flat=True).distinct()
+        )
+        yield from fan_ids.iterator(chunk_size=FAN_OUT_BATCH_SIZE)
+
+
+def _prepend(user_id, entry):
+    with _locked(user_id) as locked:
+        if not locked:
+            # Не дождались блокировки - пусть лента соберется из БД при чтении
+            cache.delete(_key(user_id))
+            return
+        entries = cache.get(_key(user_id))
+        if entries is not None and entry not in entries:
+            cache.set(_key(user_id), [entry, *entries][:FEED_LENGTH], FEED_TIMEOUT)
+
+
+def push(entry, user_ids, batch_size=FAN_OUT_BATCH_SIZE):
+    """
+    Добавляет запись в начало лент пользователей. Пачка ключей проверяется
+    одним get_many: незакэшированные ленты не трогаем - они соберутся из БД
+    при чтении; остальные (и те, что прямо сейчас собираются) меняются под блокировкой.
+    """
+    user_ids = iter(user_ids)
+    while batch := list(itertools.islice(user_ids, batch_size)):
+        present = cache.get_many([key for user_id in batch for key in (_key(user_id), _lock_key(user_id))])
+        for user_id in dict.fromkeys(batch):
+            if _key(user_id) in present or _lock_key(user_id) in present:
+                _prepend(user_id, entry)
+
+
+def fan_out(kind, pk):
+    instance = _model(kind)._default_manager.filter(pk=pk).first()
+    if instance is not None:
+        push(encode(kind, pk), followers(kind, instance))
+
+
+def invalidate(*user_ids):
+    """
+    Сбрасывает ленты после коммита: пересборка до него прочитала бы старые связи
+    и жила бы в кэше FEED_TIMEOUT. Сброс идет под блокировкой ленты, чтобы не
+    обогнать уже идущую пересборку. Обработчики друзей из friends подключены
+    раньше (модуль импортируется первым), поэтому версия смежности к этому
+    моменту уже поднята.
+    """
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+
+    def drop():
+        for user_id in user_ids:
+            with _locked(user_id):
+                cache.delete(_key(user_id))
+
+    transaction.on_commit(drop)
+
+
+@receiver(post_save, sender='news.News')
+@receiver(post_save, sender='guides.Guide')
+@receiver(post_save, sender='reviews.Review')
+@receiver(post_save, sender='community.ForumPost')
+def publish_item(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        from .tasks import fan_out_item
+
+        kind = _kind_for(sender)
+        transaction.on_commit(lambda: fan_out_item.delay(kind, instance.pk))
+
+
+@receiver(post_save, sender='news.News')
+@receiver(post_save, sender='guides.Guide')
+@receiver(post_save, sender='reviews.Review')
+@receiver(post_save, sender='community.ForumPost')
+@receiver(post_delete, sender='news.News')
+@receiver(post_delete, sender='guides.Guide')
+@receiver(post_delete, sender='reviews.Review')
+@receiver(post_delete, sender='community.ForumPost')
+def invalidate_item(sender, instance, raw=False, **kwargs):
+    if not raw:
+        name = _item_name(encode(_kind_for(sender), instance.pk))
+        transaction.on_commit(lambda: shared_cache.bump_version(name))
+
+
+@receiver(post_save, sender=FriendUser)
+@receiver(post_delete, sender=FriendUser)
+def invalidate_on_friends_change(sender, instance, **kwargs):
+    invalidate(Profile.objects.filter(pk=instance.user_id).values_list('user_id', flat=True).first())
+
+
+@receiver(m2m_changed, sender=Profile.favorite_genres.through)
+def invalidate_on_genres_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate(instance.user_id)
+    elif action == 'pre_clear':
+        instance._cleared_feed_user_ids = list(instance.profile_set.values_list('user_id', flat=True))
+    elif action == 'post_clear':
+        invalidate(*getattr(instance, '_cleared_feed_user_ids', []))
+    elif action.startswith('post_'):
+        invalidate(*Profile.objects.filter(pk__in=pk_set).values_list('user_id', flat=True))
@@ -0,0 +1,108 @@
+"""
+Запросы к графу друзей (направленные связи FriendUser: профиль -> профиль).
+
+Список смежности каждого профиля - множество id друзей - хранится в кэше
+под версионированным ключом (mainapp.cache). Добавление и удаление связи
+после коммита поднимают версию, а не переписывают закэшированное множество:
+запись на месте через get/set теряла бы параллельные изменения. Общие друзья и
+рекомендации "возможно, вы знакомы" считаются в памяти по этим множествам,
+так что страница профиля не делает запрос на каждого друга.
+"""
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from mainapp import cache as shared_cache
+from mainapp.routers import use_primary
+
+from .models import FriendUser, Profile
+
+ADJACENCY_TIMEOUT = 60 * 60 * 24
+
+
+def _name(profile_id):
+    return f'friends:{profile_id}'
+
+
+def _profile_id(profile):
+    return getattr(profile, 'pk', profile)
+
+
+def friend_ids_many(profile_ids):
+    """{id профиля: frozenset(id друзей)} - один поход в кэш и не больше одного запроса"""
+    profile_ids = set(profile_ids)
+    versions = shared_cache.get_versions([_name(profile_id) for profile_id in profile_ids])
+    keys = {profile_id: f'{_name(profile_id)}:v{versions[_name(profile_id)]}:ids' for profile_id in profile_ids}
+    cached = cache.get_many(keys.values())
+    result = {profile_id: cached[key] for profile_id, key in keys.items() if key in cached}
+    missing = profile_ids - result.keys()
+    if missing:
+        loaded = {profile_id: set() for profile_id in missing}
+        with use_primary():
+            edges = list(FriendUser.objects.filter(user_id__in=missing).values_list('user_id', 'friend_id'))
+        for user_id, friend_id in edges:
+            loaded[user_id].add(friend_id)
+        loaded = {profile_id: frozenset(ids) for profile_id, ids in loaded.items()}
+        cache.set_many({keys[profile_id]: ids for profile_id, ids in loaded.items()}, ADJACENCY_TIMEOUT)
+        result.update(loaded)
+    return result
+
+
+def friend_ids(profile):
+    profile_id = _profile_id(profile)
+    return friend_ids_many([profile_id])[profile_id]
+
+
+def friends(profile):
+    """Профили друзей вместе с пользователями"""
+    return list(Profile.objects.filter(pk__in=friend_ids(profile)).select_related('user'))
+
+
+def mutual_friend_ids(profile, other):
+    adjacency = friend_ids_many([_profile_id(profile), _profile_id(other)])
+    return adjacency[_profile_id(profile)] & adjacency[_profile_id(other)]
+
+
+def mutual_friend_count(profile, other):
+    return len(mutual_friend_ids(profile, other))
+
+
+def suggestions(profile, limit=10):
+    """
+    "Возможно, вы знакомы": друзья друзей, которых еще нет в друзьях,
+    по убыванию числа общих друзей. Возвращает [(Profile, число общих друзей)].
+    """
+    profile_id = _profile_id(profile)
+    direct = friend_ids(profile_id)
+    scores = Counter()
+    for ids in friend_ids_many(direct).values():
+        scores.update(ids)
+    for excluded in (profile_id, *direct):
+        scores.pop(excluded, None)
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+    profiles = Profile.objects.select_related('user').in_bulk([candidate for candidate, _ in ranked])
+    return [(profiles[candidate], count) for candidate, count in ranked if candidate in profiles]
+
+
+def invalidate(profile_id):
+    # После коммита: чтение, начатое до коммита, сохранит результат под старой версией
+    transaction.on_commit(lambda: shared_cache.bump_version(_name(profile_id)))
+
+
+@receiver(post_save, sender=FriendUser)
+def add_edge(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=FriendUser)
+def remove_edge(sender, instance, **kwargs):
+    invalidate(instance.user_id)
+
+
+@receiver(post_delete, sender=Profile)
+def drop_profile(sender, instance, **kwargs):
+    invalidate(instance.pk)
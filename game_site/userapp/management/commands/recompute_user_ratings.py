@@ -0,0 +1,36 @@
+import itertools
+
+from django.core.management.base import BaseCommand
+from django.db import models, transaction
+from django.db.models.functions import Coalesce
+
+from guides.models import Guide
+from userapp.models import Comment, LikeDislike, User, UserRating
+
+BATCH_SIZE = 5000
+
+
+def _count(queryset, field):
+    """Коррелированный подсчет строк пользователя"""
+    rows = queryset.filter(**{field: models.OuterRef('pk')}).order_by().values(field)
+    return Coalesce(models.Subquery(rows.annotate(n=models.Count('pk')).values('n')), 0)
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает рейтинг пользователей (таблицу лидеров) по комментариям, гайдам и лайкам'
+
+    def handle(self, *args, **options):
+        scores = User.objects.annotate(score=(
+            _count(Comment.objects.all(), 'user') * UserRating.COMMENT_POINTS
+            + _count(Guide.objects.all(), 'author') * UserRating.GUIDE_POINTS
+            + _count(LikeDislike.objects.filter(vote=LikeDislike.LIKE), 'user') * UserRating.LIKE_POINTS
+        )).filter(score__gt=0).values_list('pk', 'score')
+        total = 0
+        with transaction.atomic():
+            # Строки рейтинга, как и у сигналов, есть только у пользователей с начислениями
+            UserRating.objects.all().delete()
+            rows = scores.iterator(chunk_size=BATCH_SIZE)
+            while batch := list(itertools.islice(rows, BATCH_SIZE)):
+                UserRating.objects.bulk_create([UserRating(user_id=pk, score=score) for pk, score in batch])
+                total += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Рейтинг пересобран для {total} пользователей'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from userapp import notifications
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счетчики непрочитанных уведомлений по таблице уведомлений'
+
+    def handle(self, *args, **options):
+        updated = notifications.recount()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано счетчиков: {updated}'))
@@ -1,13 +1,15 @@
 from django.contrib.auth.models import AbstractUser
+from django.contrib.contenttypes.fields import GenericForeignKey
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 from django.core import validators
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
 from django.utils import timezone
-from ..guides.models import Guide
 
 # Create your models here.
 
@@ -133,11 +135,6 @@ class Profile(models.Model):
     def img_tag(self):
         return mark_safe('<img src="%s" width="50" height="50" />' % self.get_img())
 
-    def save(self, *args, **kwargs):
-        if not self.avatar:
-            self.avatar = '/media/avatars/default.png'
-        super().save(*args, **kwargs)
-
 
 class FriendUser(models.Model):
     user = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='friend_user')
@@ -151,6 +148,10 @@ class FriendUser(models.Model):
         verbose_name = 'Друг'
         verbose_name_plural = 'Друзья'
         ordering = ['-friend']
+        indexes = [
+            # Покрывающий индекс для построения списка смежности (userapp.friends)
+            models.Index(fields=['user', 'friend']),
+        ]
 
 
 class Comment(models.Model):
@@ -171,16 +172,174 @@ class Notification(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'is_read']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Прежнее значение is_read нужно, чтобы поправить счетчик непрочитанных при сохранении
+        instance._saved_is_read = instance.__dict__.get('is_read')
+        return instance
+
+
+class NotificationCounter(models.Model):
+    """
+    Денормализованный счетчик непрочитанных уведомлений пользователя.
+    Отдельная таблица, чтобы сохранение User/Profile не затирало счетчик.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True,
+                                related_name='notification_counter')
+    unread = models.IntegerField(default=0, verbose_name='непрочитанные')
+
+    class Meta:
+        verbose_name = 'счетчик уведомлений'
+        verbose_name_plural = 'счетчики уведомлений'
+
+    @classmethod
+    def add(cls, user_ids, delta):
+        """Атомарно меняет счетчики пользователей на delta (строки создаются при необходимости)"""
+        user_ids = list(user_ids)
+        if not user_ids or not delta:
+            return
+        if delta > 0:
+            cls.objects.bulk_create([cls(user_id=user_id) for user_id in user_ids], ignore_conflicts=True)
+        cls.objects.filter(user_id__in=user_ids).update(unread=Greatest(models.F('unread') + delta, 0))
+
+
+@receiver(post_save, sender=Notification)
+def update_unread_counter_on_save(sender, instance, created, raw=False, **kwargs):
+    previous = getattr(instance, '_saved_is_read', None)
+    instance._saved_is_read = instance.is_read
+    if raw:
+        return
+    if created:
+        if not instance.is_read:
+            NotificationCounter.add([instance.user_id], 1)
+    elif previous is not None and previous != instance.is_read:
+        NotificationCounter.add([instance.user_id], -1 if instance.is_read else 1)
+
+
+@receiver(post_delete, sender=Notification)
+def update_unread_counter_on_delete(sender, instance, **kwargs):
+    if not instance.is_read:
+        NotificationCounter.add([instance.user_id], -1)
+
+
+class LikeDislike(models.Model):
+    """Оценка пользователем любого объекта сайта (гайда, новости, комментария...)"""
+    LIKE = 1
+    DISLIKE = -1
+    VOTE_CHOICES = [
+        (LIKE, 'Нравится'),
+        (DISLIKE, 'Не нравится'),
+    ]
+    user = models.ForeignKey(User, related_name='votes', on_delete=models.CASCADE)
+    vote = models.SmallIntegerField(choices=VOTE_CHOICES)
+    content_type = models.ForeignKey(ContentType, on_delete=models.CASCADE)
+    object_id = models.PositiveBigIntegerField()
+    content_object = GenericForeignKey('content_type', 'object_id')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'оценка'
+        verbose_name_plural = 'оценки'
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'content_type', 'object_id'], name='unique_user_vote'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._saved_vote = instance.__dict__.get('vote')
+        return instance
 
 
 class UserRating(models.Model):
+    # Вклад действий пользователя в рейтинг
+    COMMENT_POINTS = 1
+    GUIDE_POINTS = 5
+    LIKE_POINTS = 2
+
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     score = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            # Таблица лидеров и поиск места пользователя идут по индексу, без сортировки таблицы
+            models.Index(fields=['-score', 'user'], name='userrating_leaderboard_idx'),
+        ]
+
     def update_score(self):
+        """Полный пересчет рейтинга (для исправления расхождений; обычно рейтинг ведется сигналами)"""
+        from guides.models import Guide
+
         comments = Comment.objects.filter(user=self.user).count()
         guides = Guide.objects.filter(author=self.user).count()
-        likes = LikeDislike.objects.filter(user=self.user, vote=1).count()
-        self.score = comments * 1 + guides * 5 + likes * 2
-        self.save()
-
+        likes = LikeDislike.objects.filter(user=self.user, vote=LikeDislike.LIKE).count()
+        self.score = comments * self.COMMENT_POINTS + guides * self.GUIDE_POINTS + likes * self.LIKE_POINTS
+        self.save(update_fields=['score'])
+
+    @classmethod
+    def add(cls, user_id, delta):
+        """Атомарно меняет рейтинг пользователя на delta (строка создается при необходимости)"""
+        if not delta:
+            return
+        if delta > 0:
+            # Строку создаем только при начислении: при каскадном удалении пользователя ее не воскрешаем
+            cls.objects.bulk_create([cls(user_id=user_id)], ignore_conflicts=True)
+        cls.objects.filter(user_id=user_id).update(score=models.F('score') + delta)
+
+    @classmethod
+    def top(cls, limit=10):
+        """Первые limit мест таблицы лидеров"""
+        return cls.objects.select_related('user').order_by('-score', 'user_id')[:limit]
+
+    @classmethod
+    def rank_for(cls, user):
+        """Место пользователя (1 + число пользователей с большим рейтингом) или None"""
+        score = cls.objects.filter(user=user).values_list('score', flat=True).first()
+        if score is None:
+            return None
+        return cls.objects.filter(score__gt=score).count() + 1
+
+
+@receiver(post_save, sender=Comment)
+def add_comment_points(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserRating.add(instance.user_id, UserRating.COMMENT_POINTS)
+
+
+@receiver(post_delete, sender=Comment)
+def remove_comment_points(sender, instance, **kwargs):
+    UserRating.add(instance.user_id, -UserRating.COMMENT_POINTS)
+
+
+@receiver(post_save, sender='guides.Guide')
+def add_guide_points(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserRating.add(instance.author_id, UserRating.GUIDE_POINTS)
+
+
+@receiver(post_delete, sender='guides.Guide')
+def remove_guide_points(sender, instance, **kwargs):
+    UserRating.add(instance.author_id, -UserRating.GUIDE_POINTS)
+
+
+@receiver(post_save, sender=LikeDislike)
+def update_like_points(sender, instance, created, raw=False, **kwargs):
+    previous = None if created else getattr(instance, '_saved_vote', None)
+    instance._saved_vote = instance.vote
+    if raw:
+        return
+    was_like = previous == LikeDislike.LIKE
+    is_like = instance.vote == LikeDislike.LIKE
+    if is_like != was_like and (created or previous is not None):
+        UserRating.add(instance.user_id, UserRating.LIKE_POINTS if is_like else -UserRating.LIKE_POINTS)
+
+
+@receiver(post_delete, sender=LikeDislike)
+def remove_like_points(sender, instance, **kwargs):
+    if instance.vote == LikeDislike.LIKE:
+        UserRating.add(instance.user_id, -UserRating.LIKE_POINTS)
@@ -0,0 +1,90 @@
+"""
+Уведомления пользователей: массовая рассылка и отметка о прочтении
+с поддержкой денормализованного счетчика непрочитанных (NotificationCounter).
+
+Одиночные Notification.objects.create()/save()/delete() обновляют счетчик
+сигналами; функции этого модуля работают пачками и правят счетчик сами.
+"""
+from django.db import transaction
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from . import stream
+from .models import Notification, NotificationCounter
+
+FAN_OUT_BATCH_SIZE = 500
+
+
+def _user_id(user):
+    return getattr(user, 'pk', user)
+
+
+def unread_count(user):
+    """Количество непрочитанных уведомлений - чтение одной строки по первичному ключу"""
+    return (
+        NotificationCounter.objects.filter(user_id=_user_id(user)).values_list('unread', flat=True).first() or 0
+    )
+
+
+def fan_out(users, message, link='', batch_size=FAN_OUT_BATCH_SIZE):
+    """
+    Создает одинаковое уведомление для многих получателей (пользователи или их id)
+    через bulk_create пачками. Повторы получателя в пачке отбрасываются: счетчик
+    поднимается одним UPDATE на пачку, по единице на пользователя.
+    Возвращает количество созданных уведомлений.
+    """
+    total = 0
+    batch = {}
+    for user in users:
+        batch[_user_id(user)] = None
+        if len(batch) >= batch_size:
+            total += _create_batch(list(batch), message, link)
+            batch = {}
+    if batch:
+        total += _create_batch(list(batch), message, link)
+    return total
+
+
+def _create_batch(user_ids, message, link):
+    with transaction.atomic():
+        created = Notification.objects.bulk_create(
+            [Notification(user_id=user_id, message=message, link=link) for user_id in user_ids]
+        )
+        NotificationCounter.add(user_ids, 1)
+        # bulk_create не шлет сигналов - публикуем в поток уведомлений сами
+        stream.publish(created)
+    return len(user_ids)
+
+
+def mark_read(user, notification_ids):
+    """Отмечает прочитанными выбранные уведомления пользователя"""
+    with transaction.atomic():
+        marked = Notification.objects.filter(
+            user_id=_user_id(user), pk__in=notification_ids, is_read=False
+        ).update(is_read=True)
+        NotificationCounter.add([_user_id(user)], -marked)
+    return marked
+
+
+def mark_all_read(user):
+    """Отмечает прочитанными все уведомления пользователя одним UPDATE"""
+    with transaction.atomic():
+        marked = Notification.objects.filter(user_id=_user_id(user), is_read=False).update(is_read=True)
+        # Вычитаем ровно отмеченное: уведомления, созданные параллельно, останутся в счетчике
+        NotificationCounter.add([_user_id(user)], -marked)
+    return marked
+
+
+def recount():
+    """Пересчитывает все счетчики по таблице уведомлений"""
+    unread = (
+        Notification.objects.filter(user_id=OuterRef('user_id'), is_read=False)
+        .order_by().values('user_id').annotate(n=Count('pk')).values('n')
+    )
+    with transaction.atomic():
+        NotificationCounter.objects.bulk_create(
+            [NotificationCounter(user_id=user_id) for user_id in
+             Notification.objects.filter(is_read=False).values_list('user_id', flat=True).distinct()],
+            ignore_conflicts=True,
+        )
+        return NotificationCounter.objects.update(unread=Coalesce(Subquery(unread), 0))
@@ -13,4 +13,12 @@ class UserSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = User
-        fields = ['id', 'email', 'username', 'avatar', 'bio', 'profile']
\ No newline at end of file
+        fields = ['id', 'email', 'username', 'avatar', 'bio', 'profile']
+
+
+class PublicUserSerializer(serializers.ModelSerializer):
+    """Автор в публичном API: без email и профиля"""
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'avatar']
@@ -0,0 +1,161 @@
+"""
+Доставка уведомлений в реальном времени (Server-Sent Events поверх ASGI).
+
+Уведомления публикуются в брокер после коммита транзакции. По умолчанию
+брокер живет в памяти процесса: каждое подключение - это лишь asyncio.Queue,
+поэтому тысячи простаивающих клиентов почти ничего не стоят одному воркеру.
+Если уведомления создаются в других процессах (WSGI-воркеры, celery), задайте
+NOTIFICATION_BROKER = 'userapp.stream.RedisBroker' - процессы обменяются через
+Redis pub/sub, держа по одному подписочному соединению на процесс.
+"""
+import asyncio
+import contextlib
+import json
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from .models import Notification
+
+QUEUE_SIZE = 100
+
+# Маркер переполнения очереди: поток закрывается, клиент переподключается с Last-Event-ID
+OVERFLOW = object()
+
+
+def serialize(notification):
+    return {
+        'id': notification.pk,
+        'message': notification.message,
+        'link': notification.link,
+        'created_at': notification.created_at.isoformat() if notification.created_at else None,
+    }
+
+
+class InProcessBroker:
+    """Pub/sub в памяти процесса. publish() можно вызывать из любого потока"""
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)  # user_id -> {(loop, queue)}
+        self._lock = threading.Lock()
+
+    def publish(self, user_id, event):
+        self.dispatch(user_id, event)
+
+    def dispatch(self, user_id, event):
+        with self._lock:
+            subscribers = list(self._subscribers.get(user_id, ()))
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(self._put, queue, event)
+
+    @staticmethod
+    def _put(queue, event):
+        try:
+            queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Клиент не успевает читать - не копим память, а просим переподключиться
+            while not queue.empty():
+                queue.get_nowait()
+            queue.put_nowait(OVERFLOW)
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, user_id):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(QUEUE_SIZE))
+        with self._lock:
+            self._subscribers[user_id].add(subscriber)
+        try:
+            yield subscriber[1]
+        finally:
+            with self._lock:
+                self._subscribers[user_id].discard(subscriber)
+                if not self._subscribers[user_id]:
+                    del self._subscribers[user_id]
+
+    def subscriber_count(self):
+        with self._lock:
+            return sum(len(subscribers) for subscribers in self._subscribers.values())
+
+
+class RedisBroker(InProcessBroker):
+    """
+    Межпроцессный брокер на Redis pub/sub (нужен пакет redis и настройка REDIS_URL).
+    Каждый процесс держит одну подписку на все каналы и раздает события локальным клиентам.
+    """
+    CHANNEL_PREFIX = 'notifications:'
+
+    def __init__(self):
+        super().__init__()
+        try:
+            import redis
+            import redis.asyncio
+        except ImportError as exc:
+            raise ImproperlyConfigured('RedisBroker требует установленного пакета redis') from exc
+        if not getattr(settings, 'REDIS_URL', None):
+            raise ImproperlyConfigured('RedisBroker требует настройки REDIS_URL')
+        self._redis = redis.Redis.from_url(settings.REDIS_URL)
+        self._async_redis = redis.asyncio
+        self._listeners = {}  # loop -> task
+
+    def publish(self, user_id, event):
+        self._redis.publish(f'{self.CHANNEL_PREFIX}{user_id}', json.dumps(event))
+
+    async def _listen(self):
+        client = self._async_redis.Redis.from_url(settings.REDIS_URL)
+        pubsub = client.pubsub()
+        await pubsub.psubscribe(f'{self.CHANNEL_PREFIX}*')
+        async for message in pubsub.listen():
+            if message['type'] != 'pmessage':
+                continue
+            user_id = int(message['channel'].decode()[len(self.CHANNEL_PREFIX):])
+            self.dispatch(user_id, json.loads(message['data']))
+
+    @contextlib.asynccontextmanager
+    async def subscribe(self, user_id):
+        loop = asyncio.get_running_loop()
+        if loop not in self._listeners or self._listeners[loop].done():
+            self._listeners[loop] = loop.create_task(self._listen())
+        async with super().subscribe(user_id) as queue:
+            yield queue
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                path = getattr(settings, 'NOTIFICATION_BROKER', 'userapp.stream.InProcessBroker')
+                _broker = import_string(path)()
+    return _broker
+
+
+def publish(notifications):
+    """Публикует уведомления подписчикам после коммита текущей транзакции"""
+    events = [(notification.user_id, serialize(notification)) for notification in notifications]
+
+    def send():
+        broker = get_broker()
+        for user_id, event in events:
+            broker.publish(user_id, event)
+
+    transaction.on_commit(send)
+
+
+@receiver(post_save, sender=Notification)
+def publish_created_notification(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        publish([instance])
+
+
+def format_event(event):
+    """Событие в формате text/event-stream"""
+    return f"id: {event['id']}\nevent: notification\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
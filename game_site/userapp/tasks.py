@@ -0,0 +1,8 @@
+from celery import shared_task
+
+from . import feed
+
+
+@shared_task
+def fan_out_item(kind, pk):
+    feed.fan_out(kind, pk)
@@ -1,5 +1,14 @@
-from django.test import TestCase
-from .models import User
+import asyncio
+
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from . import cache as profile_cache
+from . import feed, friends, notifications, stream
+from django.contrib.contenttypes.models import ContentType
+from .models import Comment, FriendUser, LikeDislike, Notification, NotificationCounter, User, UserRating
 
 
 # Create your tests here.
@@ -18,4 +27,388 @@ class AuthTestCase(TestCase):
         user = User.objects.create_user(email='test@ex.com', username='test', password='testpass')
         self.client.login(email='test@ex.com', password='testpass')
         response = self.client.get('/profile/')
-        self.assertContains(response, user.username)
\ No newline at end of file
+        self.assertContains(response, user.username)
+
+
+PROFILE_TEMPLATES = [{
+    'BACKEND': 'django.template.backends.django.DjangoTemplates',
+    'OPTIONS': {
+        'loaders': [('django.template.loaders.locmem.Loader', {
+            'userapp/profile.html': '{{ user.username }}: {{ user.bio }} '
+                                    '{% for friend in friends %}[{{ friend.user.username }}]{% endfor %}',
+        })],
+    },
+}]
+
+
+@override_settings(TEMPLATES=PROFILE_TEMPLATES)
+class ProfileCacheTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(email='user@ex.com', username='user', password='pass')
+        self.friend = User.objects.create_user(email='friend@ex.com', username='friend', password='pass')
+        self.url = reverse('user_profile', args=['user'])
+
+    def test_anonymous_page_is_cached_and_invalidated(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertContains(response, 'user:')
+
+        self.user.bio = 'Новое описание'
+        # Версия профиля поднимается после коммита
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertContains(self.client.get(self.url), 'Новое описание')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendUser.objects.create(user=self.user.profile, friend=self.friend.profile)
+        self.assertContains(self.client.get(self.url), '[friend]')
+
+    def test_cached_page_keeps_headers_and_skips_csrf_pages(self):
+        first = self.client.get(self.url)
+        cached = self.client.get(self.url)
+        self.assertEqual((cached.content, cached['Content-Type']), (first.content, first['Content-Type']))
+
+        # Токен одного посетителя не должен попасть в кэш для всех
+        csrf_templates = [{**PROFILE_TEMPLATES[0], 'OPTIONS': {'loaders': [
+            ('django.template.loaders.locmem.Loader', {'userapp/profile.html': '{% csrf_token %}'}),
+        ]}}]
+        cache.clear()
+        with override_settings(TEMPLATES=csrf_templates):
+            self.client.get(self.url)
+        self.assertIsNone(cache.get(profile_cache.anonymous_page_key(self.user.pk)))
+
+    def test_authenticated_viewer_reuses_cached_data(self):
+        self.client.force_login(self.friend)
+        self.client.get(self.url)
+        with self.assertNumQueries(2):  # сессия и пользователь-зритель
+            response = self.client.get(self.url)
+        self.assertContains(response, 'user:')
+
+    def test_renamed_user(self):
+        self.client.get(self.url)
+        self.user.username = 'renamed'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        self.assertContains(self.client.get(reverse('user_profile', args=['renamed'])), 'renamed:')
+
+
+def statements(queries):
+    """Запросы без служебных SAVEPOINT/RELEASE"""
+    return [query for query in queries if 'SAVEPOINT' not in query['sql']]
+
+
+class NotificationCounterTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{i}@ex.com', username=f'user{i}', password='pass')
+            for i in range(5)
+        ]
+        self.user = self.users[0]
+
+    def test_single_notifications_keep_counter(self):
+        first = Notification.objects.create(user=self.user, message='Первое')
+        Notification.objects.create(user=self.user, message='Второе')
+        self.assertEqual(notifications.unread_count(self.user), 2)
+
+        first = Notification.objects.get(pk=first.pk)
+        first.is_read = True
+        first.save()
+        self.assertEqual(notifications.unread_count(self.user), 1)
+        first.delete()
+        self.assertEqual(notifications.unread_count(self.user), 1)
+
+    def test_fan_out_and_mark_read(self):
+        with CaptureQueriesContext(connection) as queries:
+            created = notifications.fan_out(self.users, 'Новость', batch_size=2)
+        # По 3 запроса на пачку из двух получателей, независимо от их числа
+        self.assertEqual(len(statements(queries)), 3 * 3)
+        self.assertEqual(created, 5)
+        self.assertEqual(Notification.objects.count(), 5)
+        self.assertEqual([notifications.unread_count(user) for user in self.users], [1] * 5)
+
+        notifications.fan_out([user.pk for user in self.users[:2]], 'Еще новость')
+        ids = list(Notification.objects.filter(user=self.user).values_list('pk', flat=True))
+        self.assertEqual(notifications.mark_read(self.user, ids[:1]), 1)
+        self.assertEqual(notifications.unread_count(self.user), 1)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(notifications.mark_all_read(self.user), 1)
+        self.assertEqual(len(statements(queries)), 2)
+        self.assertEqual(notifications.unread_count(self.user), 0)
+        self.assertEqual(notifications.unread_count(self.users[1]), 2)
+
+    def test_fan_out_skips_duplicate_recipients(self):
+        self.assertEqual(notifications.fan_out([self.user, self.user.pk, self.users[1]], 'Новость'), 2)
+        self.assertEqual(Notification.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(notifications.unread_count(self.user), 1)
+
+    def test_recount(self):
+        notifications.fan_out(self.users, 'Новость')
+        NotificationCounter.objects.update(unread=10)
+        notifications.recount()
+        self.assertEqual(notifications.unread_count(self.user), 1)
+
+
+class NotificationStreamTestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='user@ex.com', username='user', password='pass')
+        self.broker = stream.InProcessBroker()
+        stream._broker = self.broker
+        self.addCleanup(setattr, stream, '_broker', None)
+
+    async def read_event(self, content):
+        while True:
+            chunk = await asyncio.wait_for(anext(content), 1)
+            chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+            if chunk.startswith('id:'):
+                return chunk
+
+    async def test_broker_delivers_to_subscriber(self):
+        async with self.broker.subscribe(self.user.pk) as queue:
+            self.assertEqual(self.broker.subscriber_count(), 1)
+            self.broker.publish(self.user.pk, {'id': 1})
+            self.broker.publish(self.user.pk + 1, {'id': 2})
+            self.assertEqual(await asyncio.wait_for(queue.get(), 1), {'id': 1})
+            self.assertTrue(queue.empty())
+        self.assertEqual(self.broker.subscriber_count(), 0)
+
+    async def test_stream_pushes_new_and_missed_notifications(self):
+        missed = await Notification.objects.acreate(user=self.user, message='Пропущенное')
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse('notification_stream'), headers={'Last-Event-ID': str(missed.pk - 1)}
+        )
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = aiter(response.streaming_content)
+        self.assertIn('Пропущенное', await self.read_event(content))
+
+        self.broker.publish(self.user.pk, {'id': missed.pk + 1, 'message': 'Новое'})
+        self.assertIn('Новое', await self.read_event(content))
+        await content.aclose()
+
+    def test_created_notifications_are_published_on_commit(self):
+        published = []
+        self.broker.publish = lambda user_id, event: published.append((user_id, event['message']))
+        with self.captureOnCommitCallbacks(execute=True):
+            Notification.objects.create(user=self.user, message='Одиночное')
+            notifications.fan_out([self.user], 'Рассылка')
+        self.assertEqual(published, [(self.user.pk, 'Одиночное'), (self.user.pk, 'Рассылка')])
+
+    async def test_anonymous_is_rejected(self):
+        response = await self.async_client.get(reverse('notification_stream'))
+        self.assertEqual(response.status_code, 401)
+
+
+class UserRatingTestCase(TestCase):
+    def setUp(self):
+        self.users = [
+            User.objects.create_user(email=f'user{i}@ex.com', username=f'user{i}', password='pass')
+            for i in range(4)
+        ]
+        self.user = self.users[0]
+
+    def score(self, user=None):
+        return UserRating.objects.get(user=user or self.user).score
+
+    def test_score_follows_events(self):
+        from games.tests import make_game
+        from guides.models import Guide
+
+        comment = Comment.objects.create(user=self.user, content='...')
+        guide = Guide.objects.create(
+            title='Гайд', slug='guide', game=make_game(), author=self.user,
+            content='...', difficulty='beginner', featured_image='guide_images/g.jpg',
+        )
+        like = LikeDislike.objects.create(
+            user=self.user, vote=LikeDislike.LIKE,
+            content_type=ContentType.objects.get_for_model(Guide), object_id=guide.pk,
+        )
+        self.assertEqual(self.score(), 1 + 5 + 2)
+
+        like = LikeDislike.objects.get(pk=like.pk)
+        like.vote = LikeDislike.DISLIKE
+        like.save()
+        self.assertEqual(self.score(), 6)
+        comment.delete()
+        guide.delete()
+        self.assertEqual(self.score(), 0)
+
+        Comment.objects.create(user=self.user, content='...')
+        rating = UserRating.objects.get(user=self.user)
+        UserRating.objects.update(score=100)
+        rating.update_score()
+        self.assertEqual(self.score(), 1)
+
+    def test_leaderboard(self):
+        for user, score in zip(self.users, [5, 20, 5, 1]):
+            UserRating.add(user.pk, score)
+        with self.assertNumQueries(1):
+            top = [(rating.user.username, rating.score) for rating in UserRating.top(3)]
+        self.assertEqual(top, [('user1', 20), ('user0', 5), ('user2', 5)])
+        self.assertEqual([UserRating.rank_for(user) for user in self.users], [2, 1, 2, 4])
+
+    def test_user_deletion(self):
+        Comment.objects.create(user=self.user, content='...')
+        self.user.delete()
+        self.assertFalse(UserRating.objects.exists())
+
+
+class FriendGraphTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.profiles = {}
+        for name in ['ann', 'bob', 'cat', 'dan', 'eve']:
+            user = User.objects.create_user(email=f'{name}@ex.com', username=name, password='pass')
+            self.profiles[name] = user.profile
+        for user, friend in [('ann', 'bob'), ('ann', 'cat'), ('bob', 'dan'), ('cat', 'dan'),
+                             ('cat', 'eve'), ('bob', 'ann'), ('dan', 'eve')]:
+            self.link(user, friend)
+
+    def link(self, user, friend):
+        return FriendUser.objects.create(user=self.profiles[user], friend=self.profiles[friend])
+
+    def test_mutual_friends_and_suggestions(self):
+        ann, cat = self.profiles['ann'], self.profiles['cat']
+        self.assertEqual(friends.mutual_friend_ids(ann, self.profiles['dan']), set())
+        self.assertEqual(friends.mutual_friend_count(self.profiles['bob'], cat), 1)
+        self.assertEqual(
+            [(profile.user.username, count) for profile, count in friends.suggestions(ann)],
+            [('dan', 2), ('eve', 1)],
+        )
+        # Списки смежности уже в кэше - повторный расчет обходится одним запросом гидратации
+        with self.assertNumQueries(1):
+            friends.suggestions(ann)
+
+    def test_adjacency_follows_edge_changes(self):
+        ann = self.profiles['ann']
+        friends.suggestions(ann)
+        with self.captureOnCommitCallbacks(execute=True):
+            edge = self.link('ann', 'dan')
+        # Новая версия списка после коммита: список перечитывается из БД один раз
+        with self.assertNumQueries(1):
+            self.assertIn(self.profiles['dan'].pk, friends.friend_ids(ann))
+        with self.assertNumQueries(0):
+            friends.friend_ids(ann)
+        self.assertEqual([profile.user.username for profile, _ in friends.suggestions(ann)], ['eve'])
+        with self.captureOnCommitCallbacks(execute=True):
+            edge.delete()
+        self.assertNotIn(self.profiles['dan'].pk, friends.friend_ids(ann))
+        self.assertEqual({profile.user.username for profile in friends.friends(ann)}, {'bob', 'cat'})
+
+
+class ActivityFeedTestCase(TestCase):
+    def setUp(self):
+        from games.models import Genre
+        from games.tests import make_game
+
+        cache.clear()
+        self.reader, self.friend, self.stranger = [
+            User.objects.create_user(email=f'{name}@ex.com', username=name, password='pass')
+            for name in ['reader', 'friend', 'stranger']
+        ]
+        FriendUser.objects.create(user=self.reader.profile, friend=self.friend.profile)
+        rpg = Genre.objects.create(name='RPG', slug='rpg')
+        self.reader.profile.favorite_genres.add(rpg)
+        self.game = make_game()
+        self.game.genres.add(rpg)
+        self.other_game = make_game(slug='other')
+
+    def publish(self):
+        from community.models import ForumPost, ForumTopic
+        from news.models import News
+        from reviews.models import Review
+
+        with self.captureOnCommitCallbacks(execute=True):
+            news = News.objects.create(title='От друга', slug='friend-news', content='...', author=self.friend)
+            review = Review.objects.create(game=self.game, author=self.stranger, rating=8, content='...')
+            News.objects.create(title='Чужая', slug='stranger-news', content='...', author=self.stranger,
+                                game=self.other_game)
+            topic = ForumTopic.objects.create(title='Тема', slug='topic', author=self.stranger)
+            post = ForumPost.objects.create(topic=topic, author=self.friend, content='...')
+        return [('post', post), ('review', review), ('news', news)]
+
+    def test_fan_out_on_write(self):
+        self.assertEqual(feed.get_feed(self.reader), [])
+        expected = self.publish()
+        # Лента уже в кэше: только гидратация, по запросу на тип записи
+        with self.assertNumQueries(3):
+            self.assertEqual(feed.get_feed(self.reader), expected)
+        # Карточки тоже закэшированы
+        with self.assertNumQueries(0):
+            self.assertEqual(feed.get_feed(self.reader), expected)
+        self.assertEqual(feed.get_feed(self.friend), [])
+
+    def test_fan_out_is_dispatched_to_celery(self):
+        from unittest import mock
+
+        with mock.patch('userapp.tasks.fan_out_item.delay') as delay:
+            expected = self.publish()
+        self.assertEqual(delay.call_count, 4)
+        delay.assert_any_call('news', expected[2][1].pk)
+
+    def test_push_waits_for_timeline_lock(self):
+        from unittest import mock
+
+        feed.timeline(self.reader.pk)
+        entry = feed.encode('news', 1)
+        with feed._locked(self.reader.pk):
+            # Лента занята: вставка ждет, а не дождавшись - сбрасывает ленту
+            with mock.patch.object(feed, 'LOCK_TIMEOUT', 0):
+                feed.push(entry, [self.reader.pk])
+            self.assertIsNone(cache.get(feed._key(self.reader.pk)))
+        feed.timeline(self.reader.pk)
+        feed.push(entry, iter([self.reader.pk, self.reader.pk]))
+        self.assertEqual(cache.get(feed._key(self.reader.pk)), [entry])
+
+    def test_edited_item_is_refreshed(self):
+        expected = self.publish()
+        feed.get_feed(self.reader)
+        news = expected[2][1]
+        with self.captureOnCommitCallbacks(execute=True):
+            news.title = 'Исправлено'
+            news.save()
+        self.assertEqual(feed.get_feed(self.reader)[2][1].title, 'Исправлено')
+
+    def test_rebuild_and_invalidation(self):
+        expected = self.publish()
+        cache.clear()
+        self.assertEqual(feed.get_feed(self.reader), expected)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendUser.objects.filter(user=self.reader.profile).delete()
+        self.assertEqual(feed.get_feed(self.reader), [expected[1]])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.reader.profile.favorite_genres.clear()
+        self.assertEqual(feed.get_feed(self.reader), [])
+
+    def test_rebuild_before_commit_is_dropped(self):
+        expected = self.publish()
+        self.assertEqual(feed.get_feed(self.reader), expected)
+        with self.captureOnCommitCallbacks(execute=True):
+            FriendUser.objects.filter(user=self.reader.profile).delete()
+            # До коммита в кэше прежние связи, и лента по ним - после коммита она сбрасывается
+            self.assertEqual(feed.get_feed(self.reader), expected)
+        self.assertEqual(feed.get_feed(self.reader), [expected[1]])
+
+    def test_conditional_feed_page(self):
+        from django.test import RequestFactory
+        from mainapp.conditional import page_etag
+        from .views import activity_feed
+
+        expected = self.publish()
+        entries = feed.timeline(self.reader.pk)
+        version = feed.page_version(entries)
+        news = expected[2][1]
+        with self.captureOnCommitCallbacks(execute=True):
+            news.title = 'Исправлено'
+            news.save()
+        self.assertNotEqual(feed.page_version(entries), version)
+
+        request = RequestFactory().get('/users/feed/')
+        request.user = self.reader
+        request.META['HTTP_IF_NONE_MATCH'] = page_etag(request, 'feed', 1, 1, feed.page_version(entries))
+        # Лента и версии записей из кэша - без запросов, гидратации и шаблона
+        with self.assertNumQueries(0):
+            self.assertEqual(activity_feed(request).status_code, 304)
@@ -17,6 +17,9 @@ urlpatterns = [
     # Управление профилем
     path('profile/', view.profile, name='profile'),
     path('profile/update/', view.profile_update, name='profile_update'),
+    path('user/<str:username>/', view.user_profile, name='user_profile'),
+    path('feed/', view.activity_feed, name='activity_feed'),
+    path('notifications/stream/', view.notification_stream, name='notification_stream'),
 
     # Смена пароля
     path('password-change/',
@@ -1,16 +1,23 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
 from django.dispatch import receiver
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from .forms import UserRegisterForm, UserUpdateForm, ProfileUpdateForm
-from django.contrib.auth import authenticate, login, logout
-from django.http import HttpResponseRedirect
+from django.contrib.auth import authenticate, get_user, login, logout
+from django.http import HttpResponse, HttpResponseRedirect, StreamingHttpResponse
 from django.shortcuts import render
+from django.core.paginator import Paginator
 from django.urls import reverse
 # from .forms import CreateUserForm
 from .models import User, Notification, Comment
+from . import cache as profile_cache
+from mainapp.conditional import has_pending_messages, not_modified, page_etag, set_validators
+from . import feed, friends, stream
 from django.db.models.signals import post_save
-from django.views.decorators.cache import cache_page
+from django.core.cache import cache
 from celery import shared_task
 from django.core.mail import send_mail
 
@@ -42,17 +49,45 @@ def register(request):
 
 @receiver(post_save, sender=Comment)
 def notify_about_comment(sender, instance, created, **kwargs):
-    if created:
+    # Комментарий пока не привязан к материалу - уведомлять некого
+    target = getattr(instance, 'content_object', None)
+    if created and target is not None:
         Notification.objects.create(
-            user=instance.content_object.author,
-            message=f"Новый комментарий к вашему посту '{instance.content_object.title[:30]}...'",
+            user=target.author,
+            message=f"Новый комментарий к вашему посту '{target.title[:30]}...'",
             link=instance.get_absolute_url()
         )
 
 
+PROFILE_SUGGESTIONS = 5
+
+
 @login_required
 def profile(request):
-    return render(request, 'users/profile.html')
+    context = {
+        'suggestions': friends.suggestions(request.user.profile, limit=PROFILE_SUGGESTIONS),
+    }
+    return render(request, 'users/profile.html', context)
+
+
+FEED_PAGE_SIZE = 20
+
+
+@login_required
+def activity_feed(request):
+    paginator = Paginator(feed.timeline(request.user.pk), FEED_PAGE_SIZE)
+    page = paginator.get_page(request.GET.get('page'))
+    etag = None
+    if not has_pending_messages(request):
+        etag = page_etag(request, 'feed', page.number, paginator.num_pages, feed.page_version(page.object_list))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+    context = {
+        'page_obj': page,
+        'items': feed.hydrate(page.object_list),
+    }
+    return set_validators(render(request, 'users/feed.html', context), etag)
 
 
 @login_required
@@ -154,8 +189,65 @@ def user_register(request):
                                                   'label_name': label_name, 'error': error})
 
 
-@cache_page(60 * 15)  # Кэшировать на 15 минут
 def user_profile(request, username):
-    user = get_object_or_404(User, username=username)
-    return render(request, 'userapp/profile.html', {'user': user})
+    # Кэш по User.pk с инвалидацией сигналами (userapp.cache) вместо cache_page по URL
+    anonymous = not request.user.is_authenticated
+    if anonymous:
+        page_key = profile_cache.anonymous_page_key(profile_cache.get_user_id(username))
+        response = cache.get(page_key)
+        if response is not None:
+            return response
+
+    context = profile_cache.get_profile_context(username)
+    response = render(request, 'userapp/profile.html', context)
+    # Кэшируется ответ целиком, с заголовками. Страница с CSRF-токеном персональна - ее не кэшируем
+    if anonymous and not request.META.get('CSRF_COOKIE_NEEDS_UPDATE'):
+        cache.set(profile_cache.anonymous_page_key(context['user'].pk), response, profile_cache.PROFILE_TIMEOUT)
+    return response
+
+
+STREAM_HEARTBEAT = 25  # секунд; держит соединение открытым через прокси
+STREAM_REPLAY_LIMIT = 100
+
+
+async def notification_stream(request):
+    """
+    Поток новых уведомлений пользователя (text/event-stream).
+    Работает под ASGI; при переподключении браузер присылает Last-Event-ID,
+    и пропущенные за это время непрочитанные уведомления досылаются из БД.
+    """
+    # get_user синхронный: не у всех бэкендов аутентификации (social_core) есть aget_user
+    user = await sync_to_async(get_user)(request)
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+    try:
+        last_event_id = int(request.headers['Last-Event-ID'])
+    except (KeyError, ValueError):
+        last_event_id = None
+
+    async def events():
+        async with stream.get_broker().subscribe(user.pk) as queue:
+            if last_event_id is not None:
+                missed = await sync_to_async(list)(
+                    Notification.objects.filter(user=user, pk__gt=last_event_id, is_read=False)
+                    .order_by('pk')[:STREAM_REPLAY_LIMIT]
+                )
+                for notification in missed:
+                    yield stream.format_event(stream.serialize(notification))
+            # Подсказка браузеру, через сколько переподключаться
+            yield 'retry: 3000\n\n'
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), STREAM_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                if event is stream.OVERFLOW:
+                    return
+                yield stream.format_event(event)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
 